@@ -1,13 +1,14 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+import os
 import uuid
-from utils.location_helper import calculate_distance, find_nearby_turfs
+from utils.location_helper import calculate_distance
+from utils.places_cache import find_nearby_turfs_cached as find_nearby_turfs
 from utils.firebase_storage import (
     read_json, write_json, 
-    get_user_by_id, get_post_by_id, get_user_by_email, get_user_by_phone,
+    get_user_by_id, get_user_by_email, get_user_by_phone,
     add_user, add_post, update_post, update_user, get_all_posts_with_filters,
     get_user_posts, update_group, USERS_COLLECTION, POSTS_COLLECTION
 )
@@ -24,19 +25,106 @@ from utils.rating_helper import (
 )
 from utils.turf_helper import (
     get_turf_by_id, add_turf, update_turf, delete_turf,
-    get_owner_turfs, search_nearby_turfs, get_turf_availability,
-    book_turf_slot, cancel_turf_booking, merge_compatible_groups
+    get_owner_turfs, search_nearby_turfs,
+    cancel_turf_booking, merge_compatible_groups
 )
+from utils.log_helper import configure_logging, get_logger, log_event
+from utils.auth_helper import (
+    AuthError, hash_password, verify_password, issue_tokens, read_refresh_token,
+    refresh_is_current, require_auth, verify_socket_auth
+)
+from utils.models import Location
+from utils.counters import increment_user_stats, increment_business_stats
+from utils.analytics_helper import (
+    record_cancellation, get_owner_analytics
+)
+from utils.booking_helper import (
+    create_booking, create_bookings, expand_recurrence, cancel_booking as cancel_slot_booking
+)
+from utils.pricing_helper import (
+    validate_pricing, quote_slot, get_priced_availability, MAX_AVAILABILITY_DAYS
+)
+from utils.typing_helper import mark_typing, start_typing_broadcaster
+from utils.recommendation_helper import (
+    get_recommendations, invalidate_user_recommendations
+)
+from utils.archive_helper import (
+    is_past_post, get_archived_post, get_archived_user_posts,
+    get_archived_group_messages, get_archived_notifications, mark_group_deleted
+)
+from utils.cascade_delete import (
+    get_live_post, start_post_deletion, get_deletion_job, retry_deletion_job, start_deletion_worker
+)
+from utils.search_index import search_documents, SEARCH_KINDS, MAX_SEARCH_RESULTS
+from utils.waitlist_helper import (
+    add_to_waitlist, remove_from_waitlist, update_post_atomically, release_spot
+)
+from utils.instrumentation import (
+    instrument_storage_calls, init_request_instrumentation, add_storage_call_listener
+)
+from utils.rate_limit import init_rate_limiting, route_class
+from utils.idempotency import idempotent
+from utils.metrics import (
+    init_metrics, record_storage_call, record_socket_event,
+    record_socket_connected, record_socket_disconnected
+)
+from utils.membership_cache import (
+    get_group_membership, get_group_member_ids, clear_membership_cache
+)
+from utils.change_events import emit_change_events, check_change_events, start_change_listeners
+from utils.message_buffer import (
+    build_group_message, enqueue_message, get_pending_messages, get_buffer_stats
+)
+
+configure_logging()
+socket_logger = get_logger('socket')
+turf_logger = get_logger('turfs')
+
+# Count and time every storage helper call (must run before the wrappers below)
+instrument_storage_calls(globals())
+add_storage_call_listener(record_storage_call)
+
+# Post / group / turf / booking writes publish change events; caches such as
+# the chat membership cache and the recommendation index follow them
+emit_change_events(globals())
+check_change_events(globals())
+start_change_listeners()
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend requests
-socketio = SocketIO(app, cors_allowed_origins="*")
+CORS(app, expose_headers=['Server-Timing', 'Idempotent-Replayed', 'Retry-After'])  # Enable CORS for frontend requests
+init_request_instrumentation(app)
+
+# Async mode is picked automatically (gevent under gunicorn, threading for
+# `python app.py`); see gunicorn.conf.py for the production tunables.
+# With SOCKETIO_MESSAGE_QUEUE set (e.g. redis://localhost:6379/0) every
+# emit(..., room=...) is published to the queue, so clients connected to other
+# processes/nodes in the same room receive it too.
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None,
+    channel=os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio'),
+    async_mode=os.environ.get('SOCKETIO_ASYNC_MODE') or None,
+    ping_interval=int(os.environ.get('SOCKETIO_PING_INTERVAL', 25)),
+    ping_timeout=int(os.environ.get('SOCKETIO_PING_TIMEOUT', 20)),
+    max_http_buffer_size=int(os.environ.get('SOCKETIO_MAX_HTTP_BUFFER_SIZE', 1000000))
+)
+init_metrics(app, socketio)
+init_rate_limiting(app)
 
 # ======================
 # USER ENDPOINTS
 # ======================
 
+def _store_rehashed_password(user, new_hash):
+    """Save a login's rehash to the password field only, leaving concurrent counter updates alone"""
+    from utils.firebase_storage import get_db
+    get_db().collection(USERS_COLLECTION).document(user['id']).update({'password': new_hash})
+    user['password'] = new_hash
+
+
 @app.route('/api/users/register', methods=['POST'])
+@route_class('auth')
 def register_user():
     """Register a new player or turf owner"""
     data = request.json
@@ -67,7 +155,7 @@ def register_user():
         'name': data['name'],
         'email': data['email'],
         'phone': data['phone'],
-        'password': generate_password_hash(password),  # Store hashed password
+        'password': hash_password(password),  # Store hashed password
         'role': role,  # player or turf_owner
         'created_at': datetime.now().isoformat()
     }
@@ -116,6 +204,7 @@ def register_user():
 
 
 @app.route('/api/users/login', methods=['POST'])
+@route_class('auth')
 def login_user():
     """Login existing user by email and password"""
     data = request.json
@@ -134,19 +223,25 @@ def login_user():
         return jsonify({'error': 'Invalid email or password'}), 401
     
     # Verify password
-    if not check_password_hash(user['password'], data['password']):
+    valid, new_hash = verify_password(user['password'], data['password'])
+    if not valid:
         return jsonify({'error': 'Invalid email or password'}), 401
+    if new_hash:
+        # Hash parameters changed since this password was stored
+        _store_rehashed_password(user, new_hash)
     
     # Remove password from response for security
     user_response = {k: v for k, v in user.items() if k != 'password'}
     
     return jsonify({
         'message': 'Login successful',
-        'user': user_response
+        'user': user_response,
+        **issue_tokens(user)
     }), 200
 
 
 @app.route('/api/turf-owners/register', methods=['POST'])
+@route_class('auth')
 def register_turf_owner():
     """Register a new turf owner with business details"""
     data = request.json
@@ -174,7 +269,7 @@ def register_turf_owner():
         'name': data['name'],
         'email': data['email'],
         'phone': data['phone'],
-        'password': generate_password_hash(password),
+        'password': hash_password(password),
         'role': 'turf_owner',
         'business': {
             'business_name': data['business_name'],
@@ -199,6 +294,7 @@ def register_turf_owner():
 
 
 @app.route('/api/turf-owners/login', methods=['POST'])
+@route_class('auth')
 def login_turf_owner():
     """Login turf owner by email and password"""
     data = request.json
@@ -221,18 +317,44 @@ def login_turf_owner():
         return jsonify({'error': 'This account is not a turf owner account. Please use the player login.'}), 403
     
     # Verify password
-    if not check_password_hash(user['password'], data['password']):
+    valid, new_hash = verify_password(user['password'], data['password'])
+    if not valid:
         return jsonify({'error': 'Invalid email or password'}), 401
+    if new_hash:
+        # Hash parameters changed since this password was stored
+        _store_rehashed_password(user, new_hash)
     
     # Remove password from response
     user_response = {k: v for k, v in user.items() if k != 'password'}
     
     return jsonify({
         'message': 'Turf owner login successful',
-        'user': user_response
+        'user': user_response,
+        **issue_tokens(user)
     }), 200
 
 
+@app.route('/api/auth/refresh', methods=['POST'])
+@route_class('auth')
+def refresh_session():
+    """Exchange a refresh token for a new token pair without re-sending the password"""
+    data = request.json or {}
+    
+    if 'refresh_token' not in data:
+        return jsonify({'error': 'Missing required field: refresh_token'}), 400
+    
+    try:
+        claims = read_refresh_token(data['refresh_token'])
+    except AuthError as e:
+        return jsonify({'error': str(e)}), 401
+    
+    user = get_user_by_id(claims['uid'])
+    if not user or not refresh_is_current(claims, user):
+        return jsonify({'error': 'Session is no longer valid, please log in again'}), 401
+    
+    return jsonify(issue_tokens(user)), 200
+
+
 @app.route('/api/users/<user_id>', methods=['GET'])
 def get_user(user_id):
     """Get user details"""
@@ -247,6 +369,7 @@ def get_user(user_id):
 
 
 @app.route('/api/users/<user_id>/profile', methods=['PUT'])
+@require_auth()
 def update_user_profile(user_id):
     """Update user profile"""
     data = request.json
@@ -288,6 +411,8 @@ def get_user_posts_endpoint(user_id):
     # Format posts with basic info
     formatted_posts = []
     for post in posts:
+        if post.get('status') == 'deleted':
+            continue
         formatted_posts.append({
             'id': post.get('id'),
             'sport': post.get('sport'),
@@ -307,6 +432,25 @@ def get_user_posts_endpoint(user_id):
     }), 200
 
 
+@app.route('/api/users/<user_id>/posts/archived', methods=['GET'])
+def get_archived_user_posts_endpoint(user_id):
+    """Archived (finished) games a user organised or played in, newest first"""
+    before = request.args.get('before')
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    
+    posts = get_archived_user_posts(user_id, before=before, limit=max(limit, 1))
+    
+    return jsonify({
+        'count': len(posts),
+        'posts': posts,
+        # Pass as `before` to get the next page
+        'next_before': posts[-1].get('date') if posts else None
+    }), 200
+
+
 @app.route('/api/users/<user_id>/ratings', methods=['GET'])
 def get_user_ratings_alias(user_id):
     """Get user ratings (alias route)"""
@@ -356,6 +500,8 @@ def get_user_posts_endpoint_old(user_id):
     # Format posts with basic info
     formatted_posts = []
     for post in posts:
+        if post.get('status') == 'deleted':
+            continue
         formatted_posts.append({
             'id': post.get('id'),
             'sport': post.get('sport'),
@@ -380,6 +526,8 @@ def get_user_posts_endpoint_old(user_id):
 # ======================
 
 @app.route('/api/posts/create', methods=['POST'])
+@require_auth()
+@idempotent
 def create_post():
     """Create a new post"""
     data = request.json
@@ -390,9 +538,13 @@ def create_post():
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
-    # Validate location
-    if 'lat' not in data['location'] or 'lng' not in data['location']:
-        return jsonify({'error': 'Location must include lat and lng'}), 400
+    # Validate location and player count once, here at the edge
+    try:
+        location = Location.from_dict(data['location'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not isinstance(data['players_needed'], int) or data['players_needed'] < 1:
+        return jsonify({'error': 'players_needed must be a positive integer'}), 400
     
     # Verify user exists
     user = get_user_by_id(data['user_id'])
@@ -411,11 +563,8 @@ def create_post():
         'players_needed': data['players_needed'],
         'accepted_players': [],
         'pending_requests': [],
-        'location': {
-            'lat': data['location']['lat'],
-            'lng': data['location']['lng'],
-            'address': data['location'].get('address', '')
-        },
+        'waitlist': [],  # FIFO of players waiting for a spot, see utils/waitlist_helper.py
+        'location': location.to_dict(),
         'description': data.get('description', ''),
         'date': data.get('date', ''),
         'time': data.get('time', ''),
@@ -448,9 +597,7 @@ def create_post():
     update_post(post['id'], post)
     
     # Update creator stats
-    user['stats']['games_organized'] += 1
-    user['stats']['games_played'] += 1
-    update_user(user['id'], user)
+    increment_user_stats(user['id'], games_organized=1, games_played=1)
     
     return jsonify({
         'message': 'Post created successfully',
@@ -460,6 +607,7 @@ def create_post():
 
 
 @app.route('/api/posts/nearby', methods=['POST'])
+@route_class('heavy')
 def get_nearby_posts():
     """Get posts within a specified radius using Haversine formula"""
     data = request.json
@@ -477,10 +625,15 @@ def get_nearby_posts():
     
     # Get all posts
     posts = list(read_json(POSTS_COLLECTION).values())
+    today = datetime.now().strftime('%Y-%m-%d')
     
     # Filter by distance and optionally by sport
     nearby_posts = []
     for post in posts:
+        # Finished games wait for the archive job, deleted ones for the cascade job
+        if is_past_post(post, today) or post.get('status') == 'deleted':
+            continue
+        
         distance = calculate_distance(
             user_lat, user_lng,
             post['location']['lat'], post['location']['lng']
@@ -508,6 +661,7 @@ def get_nearby_posts():
 
 
 @app.route('/api/posts/nearby-with-turfs', methods=['POST'])
+@route_class('heavy')
 def get_nearby_posts_with_turfs():
     """Get posts near location with nearby turfs"""
     data = request.json
@@ -525,10 +679,15 @@ def get_nearby_posts_with_turfs():
     
     # Get all posts
     posts = list(read_json(POSTS_COLLECTION).values())
+    today = datetime.now().strftime('%Y-%m-%d')
     
     # Filter by distance and optionally by sport
     nearby_posts = []
     for post in posts:
+        # Finished games wait for the archive job, deleted ones for the cascade job
+        if is_past_post(post, today) or post.get('status') == 'deleted':
+            continue
+        
         distance = calculate_distance(
             user_lat, user_lng,
             post['location']['lat'], post['location']['lng']
@@ -562,10 +721,43 @@ def get_nearby_posts_with_turfs():
     }), 200
 
 
+@app.route('/api/posts/recommended/<user_id>', methods=['GET'])
+@route_class('heavy')
+def get_recommended_posts(user_id):
+    """Open games near the player ranked by distance, sport history, skill, organizer rating and start time"""
+    user = get_user_by_id(user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        radius_km = float(request.args.get('radius_km', 10))
+        limit = int(request.args.get('limit', 20))
+    except KeyError:
+        return jsonify({'error': 'Missing required query parameters: lat, lng'}), 400
+    except ValueError:
+        return jsonify({'error': 'lat, lng, radius_km and limit must be numbers'}), 400
+    
+    if not 0 < radius_km <= 100:
+        return jsonify({'error': 'radius_km must be between 0 and 100'}), 400
+    limit = max(1, min(limit, 100))
+    
+    posts = get_recommendations(user, lat, lng, radius_km, limit)
+    
+    return jsonify({
+        'count': len(posts),
+        'posts': posts
+    }), 200
+
+
 @app.route('/api/posts/<post_id>', methods=['GET'])
 def get_post(post_id):
     """Get post details"""
-    post = get_post_by_id(post_id)
+    post = get_live_post(post_id)
+    if not post:
+        # Finished games live on in the archive
+        post = get_archived_post(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
@@ -580,7 +772,32 @@ def get_post(post_id):
 # JOIN REQUEST ENDPOINTS
 # ======================
 
+def _can_take_waitlist_spot(user_id):
+    """Waitlisted players are promoted only while under the 3 active group limit"""
+    return count_user_active_groups(user_id) < 3
+
+
+def _promoted_members(promoted):
+    return [{'user_id': entry['user_id'], 'user_name': entry['user_name']} for entry in promoted]
+
+
+def _notify_promoted_players(post, promoted):
+    """Tell waitlisted players they got a spot and count the game for them"""
+    group_id = f"group_{post['id']}"
+    for entry in promoted:
+        create_notification(
+            entry['user_id'],
+            'waitlist_promoted',
+            'You\'re In! 🎉',
+            f'A spot opened up in {post["user_name"]}\'s {post["sport"]} game and you have been added from the waitlist',
+            {'post_id': post['id'], 'group_id': group_id}
+        )
+        increment_user_stats(entry['user_id'], games_played=1)
+
+
 @app.route('/api/posts/<post_id>/join', methods=['POST'])
+@require_auth()
+@idempotent
 def join_post(post_id):
     """Directly join a post (no approval needed)"""
     data = request.json
@@ -596,39 +813,56 @@ def join_post(post_id):
         return jsonify({'error': 'User not found'}), 404
     
     # Get post
-    post = get_post_by_id(post_id)
+    post = get_live_post(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
-    # Check if post is full
-    if post['status'] == 'full':
-        return jsonify({'error': 'This game is already full. No spots available!'}), 400
-    
     # Check if already in the game
     if any(p['user_id'] == user_id for p in post['accepted_players']):
         return jsonify({'error': 'You have already joined this game'}), 400
     
-    # Check if user has reached 3 group limit
-    user_groups = count_user_active_groups(user_id)
-    if user_groups >= 3:
+    # Check if user has reached 3 group limit (full games still take them on the waitlist)
+    if post['status'] != 'full' and count_user_active_groups(user_id) >= 3:
         return jsonify({'error': 'You have reached the maximum of 3 active groups'}), 400
     
-    # Ensure group_id exists in post
-    if 'group_id' not in post:
-        post['group_id'] = group_id
-    
-    # Directly add user to accepted players
-    post['accepted_players'].append({
-        'user_id': user_id,
-        'user_name': user['name'],
-        'accepted_at': datetime.now().isoformat()
-    })
+    def join(current):
+        # Re-checked on the stored post inside the transaction
+        if any(p['user_id'] == user_id for p in current['accepted_players']):
+            raise ValueError('You have already joined this game')
+        # Full games put the player on the waitlist; they are promoted when a spot opens
+        if current['status'] == 'full':
+            return add_to_waitlist(current, user)
+        if post['status'] == 'full':
+            raise ValueError('A spot has just opened up in this game, please try joining again')
+        
+        current.setdefault('group_id', f"group_{post_id}")
+        
+        # Directly add user to accepted players
+        remove_from_waitlist(current, user_id)
+        current['accepted_players'].append({
+            'user_id': user_id,
+            'user_name': user['name'],
+            'accepted_at': datetime.now().isoformat()
+        })
+        
+        # Update status if now full
+        if len(current['accepted_players']) >= current['players_needed']:
+            current['status'] = 'full'
+        return None
     
-    # Update status if now full
-    if len(post['accepted_players']) >= post['players_needed']:
-        post['status'] = 'full'
+    try:
+        post, position = update_post_atomically(post_id, join)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not post:
+        return jsonify({'error': 'Post not found'}), 404
     
-    update_post(post['id'], post)
+    if position is not None:
+        return jsonify({
+            'message': 'This game is full. You have been added to the waitlist.',
+            'waitlist_position': position,
+            'post': post
+        }), 202
     
     # Add user to group chat
     group_id = f"group_{post_id}"
@@ -666,8 +900,8 @@ def join_post(post_id):
     )
     
     # Update player stats
-    user['stats']['games_played'] += 1
-    update_user(user['id'], user)
+    increment_user_stats(user_id, games_played=1)
+    invalidate_user_recommendations(user_id)
     
     return jsonify({
         'message': 'Successfully joined the game!',
@@ -677,6 +911,7 @@ def join_post(post_id):
 
 
 @app.route('/api/posts/<post_id>/accept', methods=['POST'])
+@require_auth(identity='owner_id')
 def accept_request(post_id):
     """Accept a join request and create/update group chat"""
     data = request.json
@@ -690,7 +925,7 @@ def accept_request(post_id):
     player_id = data['player_id']
     
     # Get post
-    post = get_post_by_id(post_id)
+    post = get_live_post(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
@@ -741,6 +976,15 @@ def accept_request(post_id):
             'user_id': pending_request['user_id'],
             'user_name': pending_request['user_name']
         })
+        group = update_group(existing_group['id'], existing_group)
+    else:
+        # Create new group with owner and first accepted player
+        members = [{
+            'user_id': pending_request['user_id'],
+            'user_name': pending_request['user_name']
+        }]
+        group = create_group(post_id, owner_id, post['user_name'], members)
+    
     # Send notification to accepted player
     create_notification(
         player_id,
@@ -751,19 +995,7 @@ def accept_request(post_id):
     )
     
     # Update player stats
-    player = get_user_by_id(player_id)
-    if player:
-        player['stats']['games_played'] += 1
-        update_user(player['id'], player)
-    
-        group = update_group(existing_group['id'], existing_group)
-    else:
-        # Create new group with owner and first accepted player
-        members = [{
-            'user_id': pending_request['user_id'],
-            'user_name': pending_request['user_name']
-        }]
-        group = create_group(post_id, owner_id, post['user_name'], members)
+    increment_user_stats(player_id, games_played=1)
     
     return jsonify({
         'message': 'Request accepted successfully',
@@ -773,6 +1005,7 @@ def accept_request(post_id):
 
 
 @app.route('/api/posts/<post_id>/leave', methods=['POST'])
+@require_auth()
 def leave_post(post_id):
     """Leave a post/game"""
     data = request.json
@@ -783,7 +1016,7 @@ def leave_post(post_id):
     user_id = data['user_id']
     
     # Get post
-    post = get_post_by_id(post_id)
+    post = get_live_post(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
@@ -797,25 +1030,25 @@ def leave_post(post_id):
     if not user_entry:
         return jsonify({'error': 'You are not in this game'}), 400
     
-    # Remove from accepted players
-    post['accepted_players'].remove(user_entry)
-    
-    # Update status back to open if it was full
-    if post['status'] == 'full':
-        post['status'] = 'open'
-    
-    update_post(post['id'], post)
+    # Remove from accepted players, filling the spot from the waitlist
+    try:
+        post, user_entry, promoted = release_spot(post_id, user_id, can_join=_can_take_waitlist_spot)
+    except ValueError:
+        return jsonify({'error': 'You are not in this game'}), 400
+    if not post:
+        return jsonify({'error': 'Post not found'}), 404
     
     # Remove from group
     group_id = f"group_{post_id}"
     group = get_group_by_id(group_id)
     if group:
         # Remove member
-        group['members'] = [m for m in group['members'] if m['user_id'] != user_id]
+        group['members'] = [m for m in group['members'] if m['user_id'] != user_id] + _promoted_members(promoted)
         
         if len(group['members']) == 0:
-            # Delete group if empty
+            # Delete group if empty (its messages are archived later)
             from utils.firebase_storage import delete_group
+            mark_group_deleted(group_id)
             delete_group(group_id)
         else:
             update_group(group['id'], group)
@@ -828,12 +1061,10 @@ def leave_post(post_id):
         f'{user_entry["user_name"]} left your {post["sport"]} game ({len(post["accepted_players"])}/{post["players_needed"]} players)',
         {'post_id': post_id}
     )
+    _notify_promoted_players(post, promoted)
     
-    # Update user stats
-    user = get_user_by_id(user_id)
-    if user and user['stats']['games_played'] > 0:
-        user['stats']['games_played'] -= 1
-        update_user(user['id'], user)
+    # Update user stats (the decrement stops at zero)
+    increment_user_stats(user_id, games_played=-1)
     
     return jsonify({
         'message': 'Successfully left the game',
@@ -841,8 +1072,39 @@ def leave_post(post_id):
     }), 200
 
 
+@app.route('/api/posts/<post_id>/waitlist/leave', methods=['POST'])
+@require_auth()
+def leave_waitlist(post_id):
+    """Remove yourself from a game's waitlist"""
+    data = request.json
+    
+    if 'user_id' not in data:
+        return jsonify({'error': 'Missing user_id'}), 400
+    
+    post = get_live_post(post_id)
+    if not post:
+        return jsonify({'error': 'Post not found'}), 404
+    
+    def leave(current):
+        if not remove_from_waitlist(current, data['user_id']):
+            raise ValueError('You are not on the waitlist for this game')
+    
+    try:
+        post, _ = update_post_atomically(post_id, leave)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not post:
+        return jsonify({'error': 'Post not found'}), 404
+    
+    return jsonify({
+        'message': 'Removed from the waitlist',
+        'post': post
+    }), 200
+
+
 @app.route('/api/posts/<post_id>/delete', methods=['DELETE'])
 @app.route('/api/posts/<post_id>', methods=['DELETE'])
+@require_auth()
 def delete_post(post_id):
     """Delete a post (creator only)"""
     data = request.json
@@ -853,7 +1115,7 @@ def delete_post(post_id):
     user_id = data['user_id']
     
     # Get post
-    post = get_post_by_id(post_id)
+    post = get_live_post(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
@@ -861,31 +1123,50 @@ def delete_post(post_id):
     if post['user_id'] != user_id:
         return jsonify({'error': 'Only the creator can delete this post'}), 403
     
-    # Notify all players
-    for player in post['accepted_players']:
-        if player['user_id'] != user_id:  # Don't notify creator
-            create_notification(
-                player['user_id'],
-                'game_cancelled',
-                'Game Cancelled ❌',
-                f'{post["user_name"]}\'s {post["sport"]} game has been cancelled',
-                {'post_id': post_id}
-            )
+    # Hide the post now; players are notified and the group, messages,
+    # ratings and bookings removed by the background cascade job
+    job_id = start_post_deletion(post, user_id)
     
-    # Delete associated group
-    group_id = f"group_{post_id}"
-    from utils.firebase_storage import delete_group, delete_post
-    delete_group(group_id)
+    return jsonify({
+        'message': 'Post deleted successfully',
+        'deletion_job_id': job_id
+    }), 202
+
+
+@app.route('/api/deletions/<job_id>', methods=['GET'])
+def get_deletion_status(job_id):
+    """Progress of a background cascade delete"""
+    job = get_deletion_job(job_id)
+    if not job:
+        return jsonify({'error': 'Deletion job not found'}), 404
     
-    # Delete post
-    delete_post(post_id)
+    return jsonify(job), 200
+
+
+@app.route('/api/deletions/<job_id>/retry', methods=['POST'])
+@require_auth()
+def retry_deletion(job_id):
+    """Queue an abandoned cascade delete again (the post's owner only)"""
+    data = request.json
     
-    return jsonify({
-        'message': 'Post deleted successfully'
-    }), 200
+    if 'user_id' not in data:
+        return jsonify({'error': 'Missing user_id'}), 400
+    
+    job = get_deletion_job(job_id)
+    if not job:
+        return jsonify({'error': 'Deletion job not found'}), 404
+    if job['requested_by'] != data['user_id']:
+        return jsonify({'error': 'Only the user who deleted the post can retry'}), 403
+    
+    job = retry_deletion_job(job_id)
+    if not job:
+        return jsonify({'error': 'Only failed or abandoned deletions can be retried'}), 409
+    
+    return jsonify(job), 202
 
 
 @app.route('/api/posts/<post_id>/kick', methods=['POST'])
+@require_auth(identity='creator_id')
 def kick_player(post_id):
     """Kick a player from the game (creator only)"""
     data = request.json
@@ -899,7 +1180,7 @@ def kick_player(post_id):
     player_id = data['player_id']
     
     # Get post
-    post = get_post_by_id(post_id)
+    post = get_live_post(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
@@ -917,21 +1198,21 @@ def kick_player(post_id):
     if not player_entry:
         return jsonify({'error': 'Player not in this game'}), 404
     
-    # Remove player
-    post['accepted_players'].remove(player_entry)
-    
-    # Update status back to open if it was full
-    if post['status'] == 'full':
-        post['status'] = 'open'
-    
-    update_post(post['id'], post)
+    # Remove player, filling the spot from the waitlist
+    try:
+        post, player_entry, promoted = release_spot(post_id, player_id, can_join=_can_take_waitlist_spot)
+    except ValueError:
+        return jsonify({'error': 'Player not in this game'}), 404
+    if not post:
+        return jsonify({'error': 'Post not found'}), 404
     
     # Remove from group
     group_id = f"group_{post_id}"
     group = get_group_by_id(group_id)
     if group:
-        group['members'] = [m for m in group['members'] if m['user_id'] != player_id]
+        group['members'] = [m for m in group['members'] if m['user_id'] != player_id] + _promoted_members(promoted)
         update_group(group['id'], group)
+    _notify_promoted_players(post, promoted)
     
     # Notify kicked player
     create_notification(
@@ -954,6 +1235,7 @@ def kick_player(post_id):
 
 @app.route('/api/posts/<post_id>/deny', methods=['POST'])
 @app.route('/api/posts/<post_id>/reject', methods=['POST'])
+@require_auth(identity='owner_id')
 def deny_request(post_id):
     """Deny/Reject a player (remove from accepted players or pending requests)"""
     data = request.json
@@ -967,7 +1249,7 @@ def deny_request(post_id):
     player_id = data['player_id']
     
     # Get post
-    post = get_post_by_id(post_id)
+    post = get_live_post(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
@@ -1011,21 +1293,21 @@ def deny_request(post_id):
     if not accepted_player:
         return jsonify({'error': 'Player not found in this game'}), 404
     
-    # Remove from accepted players
-    post['accepted_players'].remove(accepted_player)
-    
-    # Update status back to open if it was full
-    if post['status'] == 'full':
-        post['status'] = 'open'
-    
-    update_post(post['id'], post)
+    # Remove from accepted players, filling the spot from the waitlist
+    try:
+        post, accepted_player, promoted = release_spot(post_id, player_id, can_join=_can_take_waitlist_spot)
+    except ValueError:
+        return jsonify({'error': 'Player not found in this game'}), 404
+    if not post:
+        return jsonify({'error': 'Post not found'}), 404
     
     # Remove from group
     group_id = f"group_{post_id}"
     group = get_group_by_id(group_id)
     if group:
-        group['members'] = [m for m in group['members'] if m['user_id'] != player_id]
+        group['members'] = [m for m in group['members'] if m['user_id'] != player_id] + _promoted_members(promoted)
         update_group(group['id'], group)
+    _notify_promoted_players(post, promoted)
     
     # Send notification
     create_notification(
@@ -1047,6 +1329,7 @@ def deny_request(post_id):
 # ======================
 
 @app.route('/api/turfs/nearby', methods=['POST'])
+@route_class('heavy')
 def get_nearby_turfs():
     """Discover nearby cricket turfs using Google Places API"""
     data = request.json
@@ -1061,7 +1344,7 @@ def get_nearby_turfs():
     lng = data['lng']
     radius_km = data['radius_km']
     
-    # Call Google Places API
+    # Google Places API, served from the geo-tile cache for repeat neighbourhoods
     turfs = find_nearby_turfs(lat, lng, radius_km)
     
     return jsonify({
@@ -1070,11 +1353,43 @@ def get_nearby_turfs():
     }), 200
 
 
+# ======================
+# SEARCH
+# ======================
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """Prefix / typo-tolerant search over turfs, posts and users (?q=&types=turf,post,user&limit=)"""
+    query = request.args.get('q', '').strip()
+    if len(query) < 2:
+        return jsonify({'error': 'q must be at least 2 characters'}), 400
+    
+    types = [t.strip() for t in request.args.get('types', ','.join(SEARCH_KINDS)).split(',') if t.strip()]
+    unknown = [t for t in types if t not in SEARCH_KINDS]
+    if unknown or not types:
+        return jsonify({'error': f"types must be a comma-separated subset of {', '.join(SEARCH_KINDS)}"}), 400
+    
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    
+    results = search_documents(query, types, limit)
+    
+    return jsonify({
+        'query': query,
+        'count': len(results),
+        'results': results
+    }), 200
+
+
 # ======================
 # HEALTH CHECK
 # ======================
 
 @app.route('/api/health', methods=['GET'])
+@route_class('heavy')
 def health_check():
     """Health check endpoint with auto-maintenance"""
     try:
@@ -1094,6 +1409,8 @@ def health_check():
         
         # Auto-merge compatible groups
         merged = merge_compatible_groups()
+        if deleted_groups or merged:
+            clear_membership_cache()
         
         return jsonify({
             'status': 'healthy',
@@ -1102,7 +1419,8 @@ def health_check():
             'maintenance': {
                 'deleted_expired_groups': deleted_groups,
                 'merged_groups': len(merged)
-            }
+            },
+            'message_buffer': get_buffer_stats()
         }), 200
     except Exception as e:
         return jsonify({
@@ -1120,7 +1438,8 @@ def health_check():
 def get_my_groups(user_id):
     """Get all active groups for a user"""
     # Clean up expired groups first
-    auto_delete_expired_groups()
+    if auto_delete_expired_groups():
+        clear_membership_cache()
     
     groups = get_user_groups(user_id)
     
@@ -1142,6 +1461,7 @@ def get_single_group(group_id):
 
 
 @app.route('/api/groups/<group_id>/leave', methods=['POST'])
+@require_auth()
 def leave_group(group_id):
     """Leave a group"""
     data = request.json
@@ -1170,6 +1490,7 @@ def leave_group(group_id):
 
 
 @app.route('/api/groups/<group_id>/book-turf', methods=['POST'])
+@require_auth()
 def book_group_turf(group_id):
     """Book turf for group - triggers 6 hour auto-delete timer"""
     data = request.json
@@ -1210,30 +1531,53 @@ def get_group_chat_messages(group_id):
     if not user_id:
         return jsonify({'error': 'Missing user_id parameter'}), 400
     
-    group = get_group_by_id(group_id)
-    if not group:
+    members = get_group_membership(group_id)
+    if members is None:
         return jsonify({'error': 'Group not found'}), 404
     
     # Verify user is member or owner
-    is_member = group['owner_id'] == user_id
-    if not is_member:
-        for member in group['members']:
-            if member['user_id'] == user_id:
-                is_member = True
-                break
-    
-    if not is_member:
+    if user_id not in members:
         return jsonify({'error': 'You are not a member of this group'}), 403
     
     messages = get_group_messages(group_id)
     
+    # Include chat messages still waiting in the write-behind buffer
+    pending = get_pending_messages(group_id)
+    if pending:
+        persisted_ids = {m.get('id') for m in messages}
+        messages = messages + [m for m in pending if m['id'] not in persisted_ids]
+    
     return jsonify({
         'count': len(messages),
         'messages': messages
     }), 200
 
 
+@app.route('/api/groups/<group_id>/messages/archived', methods=['GET'])
+@require_auth()
+def get_archived_group_chat_messages(group_id):
+    """Chat history of a deleted group, for its former players"""
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Missing user_id parameter'}), 400
+    
+    messages, allowed = get_archived_group_messages(group_id)
+    if not messages and not allowed:
+        return jsonify({'error': 'No archived messages for this group'}), 404
+    
+    if user_id not in allowed:
+        return jsonify({'error': 'You were not a member of this group'}), 403
+    
+    return jsonify({
+        'count': len(messages),
+        'messages': messages,
+        'archived': True
+    }), 200
+
+
 @app.route('/api/groups/<group_id>/messages', methods=['POST'])
+@require_auth()
+@idempotent
 def send_group_message(group_id):
     """Send a message to group"""
     data = request.json
@@ -1246,24 +1590,15 @@ def send_group_message(group_id):
     user_id = data['user_id']
     message_text = data['message']
     
-    # Get group
-    group = get_group_by_id(group_id)
-    if not group:
+    # Get group membership
+    members = get_group_membership(group_id)
+    if members is None:
         return jsonify({'error': 'Group not found'}), 404
     
     # Verify user is member or owner
-    is_member = group['owner_id'] == user_id
-    sender_name = group['owner_name'] if is_member else None
-    
-    if not is_member:
-        for member in group['members']:
-            if member['user_id'] == user_id:
-                is_member = True
-                sender_name = member['user_name']
-                break
-    
-    if not is_member:
+    if user_id not in members:
         return jsonify({'error': 'You are not a member of this group'}), 403
+    sender_name = members[user_id]
     
     # Send message
     message = send_message(user_id, sender_name, message_text, group_id=group_id)
@@ -1321,6 +1656,7 @@ def get_group_members(group_id):
 # ======================
 
 @app.route('/api/friends/request', methods=['POST'])
+@require_auth(identity='from_user_id')
 def send_friend_req():
     """Send a friend request"""
     data = request.json
@@ -1389,6 +1725,7 @@ def get_friends_list(user_id):
 
 
 @app.route('/api/friends/accept', methods=['POST'])
+@require_auth()
 def accept_friend_req():
     """Accept a friend request"""
     data = request.json
@@ -1427,6 +1764,8 @@ def accept_friend_req():
 # ======================
 
 @app.route('/api/messages/direct', methods=['POST'])
+@require_auth(identity='from_user_id')
+@idempotent
 def send_direct_msg():
     """Send a direct message to a friend"""
     data = request.json
@@ -1443,12 +1782,31 @@ def send_direct_msg():
     # Verify users are friends
     if not are_friends(from_user_id, to_user_id):
         return jsonify({'error': 'You can only send direct messages to friends'}), 403
+    
+    # Get sender info
+    from_user = get_user_by_id(from_user_id)
+    if not from_user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    # Send message
+    message = send_message(
+        from_user_id, from_user['name'],
+        message_text, recipient_id=to_user_id
+    )
+    
+    return jsonify({
+        'message': 'Direct message sent successfully',
+        'data': message
+    }), 201
+
+
 # ======================
 # RATING SYSTEM ENDPOINTS
 # ======================
 
 @app.route('/api/ratings/add', methods=['POST'])
 @app.route('/api/ratings/rate-player', methods=['POST'])
+@require_auth(identity='rater_id')
 def rate_player():
     """Rate a player after a game"""
     data = request.json
@@ -1472,7 +1830,7 @@ def rate_player():
         return jsonify({'error': 'Rated user not found'}), 404
     
     # Verify post exists
-    post = get_post_by_id(post_id)
+    post = get_live_post(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
@@ -1546,6 +1904,7 @@ def get_user_rating_details(user_id):
 # ======================
 
 @app.route('/api/notifications/<user_id>', methods=['GET'])
+@require_auth()
 def get_notifications(user_id):
     """Get user's notifications"""
     unread_only = request.args.get('unread_only', 'false').lower() == 'true'
@@ -1561,7 +1920,28 @@ def get_notifications(user_id):
     }), 200
 
 
+@app.route('/api/notifications/<user_id>/archived', methods=['GET'])
+@require_auth()
+def get_archived_notifications_endpoint(user_id):
+    """Old read notifications moved out by the archive job, newest first"""
+    before = request.args.get('before')
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    
+    notifications = get_archived_notifications(user_id, before=before, limit=max(limit, 1))
+    
+    return jsonify({
+        'count': len(notifications),
+        'notifications': notifications,
+        # Pass as `before` to get the next page
+        'next_before': notifications[-1].get('created_at') if notifications else None
+    }), 200
+
+
 @app.route('/api/notifications/<notification_id>/read', methods=['POST'])
+@require_auth()
 def mark_notif_read(notification_id):
     """Mark a notification as read"""
     data = request.json
@@ -1583,6 +1963,7 @@ def mark_notif_read(notification_id):
 
 
 @app.route('/api/notifications/<user_id>/read-all', methods=['PUT', 'POST'])
+@require_auth()
 def mark_all_read(user_id):
     """Mark all user's notifications as read"""
     mark_all_notifications_read(user_id)
@@ -1592,24 +1973,6 @@ def mark_all_read(user_id):
     }), 200
 
 
-    
-    # Get sender info
-    from_user = get_user_by_id(from_user_id)
-    if not from_user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    # Send message
-    message = send_message(
-        from_user_id, from_user['name'],
-        message_text, recipient_id=to_user_id
-    )
-    
-    return jsonify({
-        'message': 'Direct message sent successfully',
-        'data': message
-    }), 201
-
-
 @app.route('/api/messages/direct/<user_id>/<friend_id>', methods=['GET'])
 def get_direct_messages_with_friend(user_id, friend_id):
     """Get direct messages between user and friend"""
@@ -1630,6 +1993,7 @@ def get_direct_messages_with_friend(user_id, friend_id):
 # ======================
 
 @app.route('/api/turfs/create', methods=['POST'])
+@require_auth(identity='owner_id')
 def create_turf():
     """Create a new turf (turf owner only)"""
     data = request.json
@@ -1639,18 +2003,26 @@ def create_turf():
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
-    # Validate location has lat, lng
-    if 'lat' not in data['location'] or 'lng' not in data['location']:
-        return jsonify({'error': 'Location must include lat and lng (latitude and longitude)'}), 400
+    # Validate location has numeric lat, lng
+    try:
+        location = Location.from_dict(data['location'])
+    except ValueError as e:
+        return jsonify({'error': f'{e} (latitude and longitude)'}), 400
     
     # Validate pricing has per_hour
-    if 'per_hour' not in data['pricing']:
+    if not isinstance(data['pricing'], dict) or 'per_hour' not in data['pricing']:
         return jsonify({'error': 'Pricing must include per_hour rate'}), 400
     
     # Validate timings
     if 'opening' not in data['timings'] or 'closing' not in data['timings']:
         return jsonify({'error': 'Timings must include opening and closing times (HH:MM format)'}), 400
     
+    # Validate optional dynamic pricing rules (peak_hours, weekend_multiplier, surge)
+    try:
+        validate_pricing(data['pricing'])
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid pricing: {e}'}), 400
+    
     # Verify owner exists and is turf_owner
     owner = get_user_by_id(data['owner_id'])
     if not owner:
@@ -1663,16 +2035,15 @@ def create_turf():
         'owner_id': data['owner_id'],
         'owner_name': owner['name'],
         'name': data['name'],
-        'location': {
-            'lat': float(data['location']['lat']),
-            'lng': float(data['location']['lng']),
-            'address': data['location'].get('address', '')
-        },
+        'location': location.to_dict(),
         'sports': data['sports'],  # List of sports: ['cricket', 'football']
         'facilities': data.get('facilities', []),  # ['parking', 'washroom', 'changing room', 'night lights']
         'pricing': {
             'per_hour': float(data['pricing']['per_hour']),
-            'currency': data['pricing'].get('currency', 'INR')
+            'currency': data['pricing'].get('currency', 'INR'),
+            'peak_hours': data['pricing'].get('peak_hours', []),  # [{'start': '18:00', 'end': '22:00', 'multiplier': 1.25}]
+            'weekend_multiplier': float(data['pricing'].get('weekend_multiplier', 1)),
+            'surge': data['pricing'].get('surge', [])  # [{'occupancy': 0.8, 'multiplier': 1.2}]
         },
         'timings': {
             'opening': data['timings']['opening'],  # Format: "06:00"
@@ -1682,7 +2053,8 @@ def create_turf():
         'rating': 0.0,
         'total_ratings': 0,
         'total_bookings': 0,
-        'bookings': [],
+        'total_cancellations': 0,
+        'bookings_migrated': True,  # bookings live in the turf_bookings collection
         'status': 'active',
         'created_at': datetime.now().isoformat()
     }
@@ -1691,8 +2063,7 @@ def create_turf():
     
     # Update owner stats
     if 'business' in owner:
-        owner['business']['total_turfs'] += 1
-        update_user(owner['id'], owner)
+        increment_business_stats(owner['id'], total_turfs=1)
     
     return jsonify({
         'message': 'Turf created successfully',
@@ -1707,10 +2078,14 @@ def get_turf(turf_id):
     if not turf:
         return jsonify({'error': 'Turf not found'}), 404
     
+    # Legacy embedded bookings are not part of the turf payload
+    turf.pop('bookings', None)
+    
     return jsonify(turf), 200
 
 
 @app.route('/api/turfs/<turf_id>', methods=['PUT'])
+@require_auth(identity='owner_id')
 def update_turf_details(turf_id):
     """Update turf details (owner only)"""
     data = request.json
@@ -1735,6 +2110,10 @@ def update_turf_details(turf_id):
     if 'facilities' in data:
         turf['facilities'] = data['facilities']
     if 'pricing' in data:
+        try:
+            validate_pricing(data['pricing'])
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid pricing: {e}'}), 400
         turf['pricing'] = data['pricing']
     if 'timings' in data:
         turf['timings'] = data['timings']
@@ -1753,6 +2132,7 @@ def update_turf_details(turf_id):
 
 
 @app.route('/api/turfs/<turf_id>', methods=['DELETE'])
+@require_auth(identity='owner_id')
 def delete_turf_endpoint(turf_id):
     """Delete turf (owner only)"""
     data = request.json
@@ -1770,10 +2150,7 @@ def delete_turf_endpoint(turf_id):
     delete_turf(turf_id)
     
     # Update owner stats
-    owner = get_user_by_id(data['owner_id'])
-    if owner and 'business' in owner:
-        owner['business']['total_turfs'] = max(0, owner['business']['total_turfs'] - 1)
-        update_user(owner['id'], owner)
+    increment_business_stats(turf['owner_id'], total_turfs=-1)
     
     return jsonify({
         'message': 'Turf deleted successfully'
@@ -1793,7 +2170,33 @@ def get_owner_turfs_list(owner_id):
     }), 200
 
 
+@app.route('/api/turf-owners/<owner_id>/analytics', methods=['GET'])
+@route_class('heavy')
+@require_auth(identity='owner_id')
+def get_owner_analytics_endpoint(owner_id):
+    """Bookings, revenue, occupancy by hour and cancellation rate for an owner's turfs"""
+    today = datetime.now().date()
+    start_date = request.args.get('from', (today - timedelta(days=29)).isoformat())
+    end_date = request.args.get('to', today.isoformat())
+    
+    owner = get_user_by_id(owner_id)
+    if not owner:
+        return jsonify({'error': 'Owner not found'}), 404
+    if owner.get('role') != 'turf_owner':
+        return jsonify({'error': 'User is not a turf owner'}), 403
+    
+    try:
+        analytics = get_owner_analytics(owner_id, start_date, end_date)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {str(e)}'}), 400
+    
+    analytics['business'] = owner.get('business', {})
+    
+    return jsonify(analytics), 200
+
+
 @app.route('/api/turfs/search/nearby', methods=['POST'])
+@route_class('heavy')
 def search_turfs_nearby():
     """Search for turfs near a location"""
     data = request.json
@@ -1818,23 +2221,37 @@ def search_turfs_nearby():
 
 @app.route('/api/turfs/<turf_id>/availability', methods=['POST'])
 def get_availability(turf_id):
-    """Get available time slots for a turf on a specific date"""
+    """Get available, priced time slots for a turf on a date (and optionally the following days)"""
     data = request.json
     
     if 'date' not in data:
         return jsonify({'error': 'Missing date'}), 400
     
-    slots = get_turf_availability(turf_id, data['date'])
-    if slots is None:
+    try:
+        days = int(data.get('days', 1))
+        datetime.strptime(data['date'], '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return jsonify({'error': 'date must be YYYY-MM-DD and days an integer'}), 400
+    if not 1 <= days <= MAX_AVAILABILITY_DAYS:
+        return jsonify({'error': f'days must be between 1 and {MAX_AVAILABILITY_DAYS}'}), 400
+    
+    turf = get_turf_by_id(turf_id)
+    if not turf:
         return jsonify({'error': 'Turf not found'}), 404
     
+    calendar = get_priced_availability(turf, data['date'], days)
+    
     return jsonify({
         'date': data['date'],
-        'slots': slots
+        'slots': calendar[0]['slots'],
+        'currency': turf.get('pricing', {}).get('currency', 'INR'),
+        'days': calendar
     }), 200
 
 
 @app.route('/api/turfs/<turf_id>/book', methods=['POST'])
+@require_auth()
+@idempotent
 def book_turf(turf_id):
     """Book a turf slot"""
     data = request.json
@@ -1844,22 +2261,37 @@ def book_turf(turf_id):
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
+    try:
+        datetime.strptime(data['date'], '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    
     # Verify user
     user = get_user_by_id(data['user_id'])
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
+    turf = get_turf_by_id(turf_id)
+    if not turf:
+        return jsonify({'error': 'Turf not found'}), 404
+    
     booking_data = {
         'group_id': data.get('group_id', None),
         'user_id': data['user_id'],
         'user_name': user['name'],
         'date': data['date'],
-        'time_slot': data['time_slot']
+        'time_slot': data['time_slot'],
+        'currency': turf.get('pricing', {}).get('currency', 'INR')
     }
     
-    booking = book_turf_slot(turf_id, booking_data)
+    # Priced inside the booking transaction so surge sees the same calendar as the conflict check;
+    # the owner's analytics are counted in the same transaction
+    booking = create_booking(
+        turf, booking_data,
+        quote=lambda booked: quote_slot(turf, data['date'], data['time_slot'], booked)
+    )
     if not booking:
-        return jsonify({'error': 'Time slot already booked or turf not found'}), 400
+        return jsonify({'error': 'Time slot already booked or invalid time slot'}), 400
     
     # Send notification
     create_notification(
@@ -1876,7 +2308,104 @@ def book_turf(turf_id):
     }), 201
 
 
+@app.route('/api/turfs/<turf_id>/book/bulk', methods=['POST'])
+@require_auth()
+@idempotent
+def book_turf_bulk(turf_id):
+    """Book several slots, or a recurring slot, in one atomic request
+    
+    Body: user_id, optional group_id, and either
+      slots: [{'date': 'YYYY-MM-DD', 'time_slot': 'HH:MM-HH:MM'}, ...]
+    or
+      recurrence: {'start_date', 'time_slot', 'count' or 'until', 'every_days' (default 7)}
+    With allow_partial=true the free slots are booked and conflicts reported;
+    otherwise any conflict books nothing and returns 409.
+    """
+    data = request.json
+    
+    if 'user_id' not in data:
+        return jsonify({'error': 'Missing required field: user_id'}), 400
+    
+    recurrence_id = None
+    try:
+        if 'recurrence' in data:
+            rule = data['recurrence']
+            occurrences = expand_recurrence(
+                rule['start_date'], rule['time_slot'],
+                count=int(rule['count']) if 'count' in rule else None,
+                until=rule.get('until'),
+                every_days=int(rule.get('every_days', 7))
+            )
+            recurrence_id = str(uuid.uuid4())
+        elif 'slots' in data:
+            occurrences = [(slot['date'], slot['time_slot']) for slot in data['slots']]
+            for date, _ in occurrences:
+                datetime.strptime(date, '%Y-%m-%d')
+        else:
+            return jsonify({'error': 'Provide slots or recurrence'}), 400
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid booking request: {e}'}), 400
+    
+    if not occurrences:
+        return jsonify({'error': 'No slots to book'}), 400
+    
+    user = get_user_by_id(data['user_id'])
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    turf = get_turf_by_id(turf_id)
+    if not turf:
+        return jsonify({'error': 'Turf not found'}), 404
+    
+    booking_data = {
+        'group_id': data.get('group_id', None),
+        'user_id': data['user_id'],
+        'user_name': user['name'],
+        'currency': turf.get('pricing', {}).get('currency', 'INR')
+    }
+    if recurrence_id:
+        booking_data['recurrence_id'] = recurrence_id
+    
+    try:
+        bookings, conflicts = create_bookings(
+            turf, booking_data, occurrences,
+            quote=lambda date, time_slot, booked: quote_slot(turf, date, time_slot, booked),
+            allow_partial=bool(data.get('allow_partial', False))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not bookings:
+        return jsonify({
+            'error': 'Requested slots are already booked or invalid',
+            'conflicts': conflicts
+        }), 409
+    
+    # One notification for the whole request
+    dates = sorted(b['date'] for b in bookings)
+    create_notification(
+        data['user_id'],
+        'turf_booked',
+        'Turf Booked! 🏟️',
+        f'{len(bookings)} slots at {turf.get("name", "the turf")} confirmed from {dates[0]} to {dates[-1]}',
+        {
+            'turf_id': turf_id,
+            'booking_ids': [b['id'] for b in bookings],
+            'recurrence_id': recurrence_id
+        }
+    )
+    
+    return jsonify({
+        'message': f'{len(bookings)} slots booked successfully',
+        'recurrence_id': recurrence_id,
+        'bookings': bookings,
+        'conflicts': conflicts,
+        'total_amount': round(sum(b.get('amount', 0) for b in bookings), 2)
+    }), 201
+
+
 @app.route('/api/turfs/<turf_id>/bookings/<booking_id>/cancel', methods=['POST'])
+@require_auth()
 def cancel_booking(turf_id, booking_id):
     """Cancel a turf booking"""
     data = request.json
@@ -1884,10 +2413,22 @@ def cancel_booking(turf_id, booking_id):
     if 'user_id' not in data:
         return jsonify({'error': 'Missing user_id'}), 400
     
-    success = cancel_turf_booking(turf_id, booking_id, data['user_id'])
-    if not success:
+    turf = get_turf_by_id(turf_id)
+    if not turf:
         return jsonify({'error': 'Booking not found or unauthorized'}), 404
     
+    # Owner analytics are updated in the cancellation transaction
+    booking = cancel_slot_booking(turf, booking_id, data['user_id'])
+    if not booking:
+        # Booking still embedded in a turf that migrate_bookings.py has not processed yet
+        booking = next((b for b in turf.get('bookings', []) if b.get('id') == booking_id), None)
+        if not booking or not cancel_turf_booking(turf_id, booking_id, data['user_id']):
+            return jsonify({'error': 'Booking not found or unauthorized'}), 404
+        try:
+            record_cancellation(turf, booking)
+        except Exception:
+            turf_logger.exception('analytics.cancellation_failed', extra={'fields': {'turf_id': turf_id}})
+    
     return jsonify({
         'message': 'Booking cancelled successfully'
     }), 200
@@ -1898,9 +2439,12 @@ def cancel_booking(turf_id, booking_id):
 # ======================
 
 @app.route('/api/groups/merge', methods=['POST'])
+@route_class('heavy')
 def auto_merge_groups():
     """Automatically merge compatible groups (9+ players each)"""
     merged = merge_compatible_groups()
+    if merged:
+        clear_membership_cache()
     
     return jsonify({
         'message': f'Successfully merged {len(merged)} group pairs',
@@ -1912,28 +2456,43 @@ def auto_merge_groups():
 # SOCKET.IO EVENTS - Real-time Chat
 # ======================
 
+# sid -> access token claims of clients that connected with a token
+_socket_auth = {}
+
+
 @socketio.on('connect')
-def handle_connect():
-    """Handle client connection"""
-    print('Client connected:', request.sid)
+def handle_connect(auth=None):
+    """Handle client connection (token in the Socket.IO auth payload or an Authorization header)"""
+    try:
+        claims = verify_socket_auth(auth)
+    except AuthError as e:
+        log_event(socket_logger, 'socket.auth_failed', sid=request.sid, reason=str(e))
+        return False
+    if claims:
+        _socket_auth[request.sid] = claims
+    record_socket_connected()
+    log_event(socket_logger, 'socket.connect', sid=request.sid)
     emit('connected', {'message': 'Connected to server'})
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    print('Client disconnected:', request.sid)
+    _socket_auth.pop(request.sid, None)
+    record_socket_disconnected()
+    log_event(socket_logger, 'socket.disconnect', sid=request.sid)
 
 
 @socketio.on('join_group')
 def handle_join_group(data):
     """User joins a group room"""
+    record_socket_event('join_group')
     group_id = data.get('group_id')
     user_name = data.get('user_name', 'Unknown')
     
     if group_id:
         join_room(group_id)
-        print(f'{user_name} joined group {group_id}')
+        log_event(socket_logger, 'socket.join_group', group_id=group_id, user_name=user_name)
         emit('user_joined', {
             'message': f'{user_name} joined the chat',
             'user_name': user_name
@@ -1943,12 +2502,13 @@ def handle_join_group(data):
 @socketio.on('leave_group')
 def handle_leave_group(data):
     """User leaves a group room"""
+    record_socket_event('leave_group')
     group_id = data.get('group_id')
     user_name = data.get('user_name', 'Unknown')
     
     if group_id:
         leave_room(group_id)
-        print(f'{user_name} left group {group_id}')
+        log_event(socket_logger, 'socket.leave_group', group_id=group_id, user_name=user_name)
         emit('user_left', {
             'message': f'{user_name} left the chat',
             'user_name': user_name
@@ -1958,6 +2518,7 @@ def handle_leave_group(data):
 @socketio.on('send_message')
 def handle_send_message(data):
     """Handle real-time message sending"""
+    record_socket_event('send_message')
     try:
         group_id = data.get('group_id')
         user_id = data.get('user_id')
@@ -1968,16 +2529,23 @@ def handle_send_message(data):
             emit('error', {'message': 'Missing required fields'})
             return
         
-        # Verify group exists
-        group = get_group_by_id(group_id)
-        if not group:
+        claims = _socket_auth.get(request.sid)
+        if claims and claims['uid'] != user_id:
+            emit('error', {'message': 'Token does not belong to this user'})
+            return
+        
+        # Verify membership against the cached member set (no storage read)
+        member_ids = get_group_member_ids(group_id)
+        if member_ids is None:
             emit('error', {'message': 'Group not found'})
             return
+        if user_id not in member_ids:
+            emit('error', {'message': 'You are not a member of this group'})
+            return
         
-        # Save message to database
-        message = send_message(user_id, user_name, message_text, group_id=group_id)
+        message = build_group_message(user_id, user_name, message_text, group_id)
         
-        # Broadcast to all users in the room
+        # Broadcast to all users in the room first, persist in the background
         emit('new_message', {
             'id': message['id'],
             'user_id': user_id,
@@ -1986,26 +2554,36 @@ def handle_send_message(data):
             'timestamp': message['timestamp']
         }, room=group_id)
         
-        print(f'Message sent in group {group_id} by {user_name}')
+        enqueue_message(message)
         
-    except Exception as e:
-        print(f'Error sending message: {str(e)}')
+        log_event(socket_logger, 'socket.message', group_id=group_id, user_id=user_id)
+        
+    except Exception:
+        socket_logger.exception('socket.message_failed', extra={'fields': {'sid': request.sid}})
         emit('error', {'message': 'Failed to send message'})
 
 
 @socketio.on('typing')
 def handle_typing(data):
-    """Handle typing indicator"""
+    """Handle typing indicator (coalesced: `user_typing` is sent per start/stop, not per keystroke)"""
+    record_socket_event('typing')
     group_id = data.get('group_id')
     user_name = data.get('user_name')
     is_typing = data.get('is_typing', False)
     
     if group_id and user_name:
-        emit('user_typing', {
-            'user_name': user_name,
-            'is_typing': is_typing
-        }, room=group_id, skip_sid=request.sid)
+        start_typing_broadcaster(socketio)
+        mark_typing(group_id, user_name, is_typing, sid=request.sid)
 
 
 if __name__ == '__main__':
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    # Finish cascade deletes a previous process left half done
+    start_deletion_worker()
+    
+    # Development server only - production runs through gunicorn (wsgi.py)
+    socketio.run(
+        app,
+        debug=os.environ.get('FLASK_DEBUG', '1') == '1',
+        host='0.0.0.0',
+        port=int(os.environ.get('PORT', 5000))
+    )
@@ -0,0 +1,39 @@
+"""Move finished posts, messages of deleted groups and old read notifications to the archive.
+
+Meant to run periodically (cron, Cloud Scheduler job). Every batch is
+written and deleted atomically, so an interrupted run is finished by the
+next one.
+
+Usage:
+    python archive_data.py [--batch-size 200] [--dry-run]
+    python archive_data.py --backfill-deleted-groups [--dry-run]
+
+--backfill-deleted-groups is a one-off: it scans the messages collection for
+groups that were deleted without a deleted_groups marker, marks them, and
+then archives as usual.
+"""
+import argparse
+
+from utils.archive_helper import ARCHIVE_BATCH_SIZE, archive_stale_data, backfill_deleted_groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive stale posts, messages and notifications')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                        help='documents moved per batch (at most 240)')
+    parser.add_argument('--dry-run', action='store_true', help='count what would move without writing')
+    parser.add_argument('--backfill-deleted-groups', action='store_true',
+                        help='first mark deleted groups that still have messages (scans all messages)')
+    args = parser.parse_args()
+
+    if args.backfill_deleted_groups:
+        marked = backfill_deleted_groups(dry_run=args.dry_run)
+        print(f"{'[dry-run] ' if args.dry_run else ''}Deleted groups marked: {marked}")
+
+    moved = archive_stale_data(batch_size=min(args.batch_size, 240), dry_run=args.dry_run)
+    prefix = '[dry-run] ' if args.dry_run else ''
+    print(f"{prefix}Posts: {moved['posts']}, messages: {moved['messages']}, notifications: {moved['notifications']}")
+
+
+if __name__ == '__main__':
+    main()
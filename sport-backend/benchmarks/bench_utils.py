@@ -0,0 +1,33 @@
+"""Shared helpers for the benchmark scripts"""
+import statistics
+import subprocess
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize_latencies(latencies_ms):
+    """p50/p95/p99/mean/max of a list of millisecond latencies"""
+    return {
+        'p50': round(percentile(latencies_ms, 50), 3),
+        'p95': round(percentile(latencies_ms, 95), 3),
+        'p99': round(percentile(latencies_ms, 99), 3),
+        'mean': round(statistics.mean(latencies_ms), 3) if latencies_ms else 0.0,
+        'max': round(max(latencies_ms), 3) if latencies_ms else 0.0
+    }
+
+
+def git_commit():
+    """Current commit hash, so results can be lined up across commits"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
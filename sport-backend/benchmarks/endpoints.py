@@ -0,0 +1,377 @@
+"""Endpoint benchmark suite for app.py.
+
+Seeds a synthetic dataset through the storage helpers (users, posts with
+their groups, turfs, bookings, ratings and chat messages, clustered around a
+handful of city centres), then drives the hot endpoints in-process with the
+Flask test client and the Socket.IO test client. Prints p50/p95/p99 latency
+and throughput per endpoint as JSON.
+
+Usage:
+    python benchmarks/endpoints.py --users 500 --posts 300 --iterations 200 \
+        --output bench_output.json
+    python benchmarks/endpoints.py --compare bench_output.json
+
+Seeding writes real documents to whatever Firestore the app is configured
+for - point FIRESTORE_EMULATOR_HOST at the emulator for local runs. Every
+seeded document carries a `bench_run` field so it can be found and removed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every request comes from one test-client IP; with the production limits most
+# calls would be 429s timed as if they were real responses. Must be set before
+# app (and utils.rate_limit) is imported.
+os.environ.setdefault('RATE_LIMITS', 'default=1e9:1e9,heavy=1e9:1e9,auth=1e9:1e9')
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app, socketio  # noqa: E402
+from bench_utils import git_commit, summarize_latencies  # noqa: E402
+from utils.firebase_storage import add_user, add_post, update_post  # noqa: E402
+from utils.chat_helper import create_group, send_message  # noqa: E402
+from utils.rating_helper import add_rating  # noqa: E402
+from utils.turf_helper import add_turf  # noqa: E402
+from utils.booking_helper import create_booking  # noqa: E402
+
+SPORTS = ['cricket', 'football', 'basketball', 'badminton', 'tennis', 'volleyball']
+SKILL_LEVELS = ['beginner', 'intermediate', 'advanced']
+
+# (lat, lng) of the cities games cluster around
+CITY_CENTRES = [
+    (12.9716, 77.5946),   # Bengaluru
+    (19.0760, 72.8777),   # Mumbai
+    (28.6139, 77.2090),   # Delhi
+    (17.3850, 78.4867),   # Hyderabad
+    (18.5204, 73.8567),   # Pune
+]
+
+# ~0.03 degrees is ~3 km, a typical neighbourhood spread
+CLUSTER_SPREAD_DEG = 0.03
+
+
+def clustered_location(rng):
+    lat, lng = rng.choice(CITY_CENTRES)
+    return {
+        'lat': round(rng.gauss(lat, CLUSTER_SPREAD_DEG), 6),
+        'lng': round(rng.gauss(lng, CLUSTER_SPREAD_DEG), 6),
+        'address': f'Bench Street {rng.randint(1, 999)}'
+    }
+
+
+# ======================
+# SEEDING
+# ======================
+
+def seed_users(rng, run_id, count, role='player'):
+    # One shared hash keeps seeding fast; login is not what is measured here
+    password = generate_password_hash('benchmark')
+    users = []
+    for i in range(count):
+        user = {
+            'id': str(uuid.uuid4()),
+            'name': f'Bench {role} {i}',
+            'email': f'bench_{run_id}_{role}_{i}@example.com',
+            'phone': f'9{rng.randint(100000000, 999999999)}',
+            'password': password,
+            'role': role,
+            'bench_run': run_id,
+            'created_at': datetime.now().isoformat()
+        }
+        if role == 'player':
+            user['profile'] = {'skill_level': rng.choice(SKILL_LEVELS)}
+            user['stats'] = {
+                'games_played': 0,
+                'games_organized': 0,
+                'attendance_rate': 100.0,
+                'average_rating': 0.0,
+                'total_ratings': 0
+            }
+        else:
+            user['business'] = {
+                'business_name': f'Bench Arena {i}',
+                'business_address': 'Bench Road',
+                'contact_person': user['name'],
+                'total_turfs': 0,
+                'total_bookings': 0,
+                'total_revenue': 0.0
+            }
+        add_user(user)
+        users.append(user)
+    return users
+
+
+def seed_posts(rng, run_id, count, creators, players_needed):
+    posts = []
+    for _ in range(count):
+        creator = rng.choice(creators)
+        post_id = str(uuid.uuid4())
+        post = {
+            'id': post_id,
+            'user_id': creator['id'],
+            'user_name': creator['name'],
+            'sport': rng.choice(SPORTS),
+            'players_needed': players_needed,
+            'accepted_players': [],
+            'pending_requests': [],
+            'location': clustered_location(rng),
+            'description': 'Benchmark game',
+            'date': (datetime.now() + timedelta(days=rng.randint(0, 14))).strftime('%Y-%m-%d'),
+            'time': f'{rng.randint(6, 21):02d}:00',
+            'status': 'open',
+            'group_id': f'group_{post_id}',
+            'bench_run': run_id,
+            'created_at': datetime.now().isoformat()
+        }
+        add_post(post)
+        create_group(post_id, creator['id'], creator['name'], [])
+        post['accepted_players'].append({
+            'user_id': creator['id'],
+            'user_name': creator['name'],
+            'accepted_at': datetime.now().isoformat()
+        })
+        update_post(post_id, post)
+        posts.append(post)
+    return posts
+
+
+def seed_turfs(rng, run_id, count, owners):
+    turfs = []
+    for i in range(count):
+        owner = rng.choice(owners)
+        turf = {
+            'id': str(uuid.uuid4()),
+            'owner_id': owner['id'],
+            'owner_name': owner['name'],
+            'name': f'Bench Turf {i}',
+            'location': clustered_location(rng),
+            'sports': rng.sample(SPORTS, 2),
+            'facilities': ['parking', 'washroom'],
+            'pricing': {'per_hour': float(rng.choice([600, 800, 1000, 1200])), 'currency': 'INR'},
+            'timings': {'opening': '06:00', 'closing': '23:00'},
+            'images': [],
+            'rating': 0.0,
+            'total_ratings': 0,
+            'total_bookings': 0,
+            'total_cancellations': 0,
+            'bookings_migrated': True,
+            'status': 'active',
+            'bench_run': run_id,
+            'created_at': datetime.now().isoformat()
+        }
+        add_turf(turf)
+        turfs.append(turf)
+    return turfs
+
+
+def seed_bookings(rng, turfs, users, per_turf, date):
+    for turf in turfs:
+        hours = rng.sample(range(6, 23), min(per_turf, 17))
+        for hour in hours:
+            user = rng.choice(users)
+            create_booking(turf, {
+                'group_id': None,
+                'user_id': user['id'],
+                'user_name': user['name'],
+                'date': date,
+                'time_slot': f'{hour:02d}:00-{hour + 1:02d}:00'
+            })
+
+
+def seed_ratings(rng, posts, users, count):
+    for _ in range(count):
+        post = rng.choice(posts)
+        rater, rated = rng.sample(users, 2)
+        score = rng.randint(1, 5)
+        add_rating(post['id'], rater['id'], rater['name'], rated['id'], rated['name'], {
+            'overall_rating': score,
+            'punctuality': score,
+            'skill': score,
+            'teamwork': score,
+            'sportsmanship': score,
+            'review': ''
+        })
+
+
+def seed_messages(rng, posts, per_group):
+    for post in posts:
+        for i in range(per_group):
+            send_message(post['user_id'], post['user_name'], f'Benchmark message {i}',
+                         group_id=post['group_id'])
+
+
+# ======================
+# MEASUREMENT
+# ======================
+
+def measure(name, iterations, call):
+    """Run `call(i)` `iterations` times; `call` returns a status code"""
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        status = call(i)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        if status >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return name, {
+        'requests': iterations,
+        'errors': errors,
+        'throughput_rps': round(iterations / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': summarize_latencies(latencies)
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    booking_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    seed_started = time.perf_counter()
+    users = seed_users(rng, run_id, args.users)
+    owners = seed_users(rng, run_id, max(1, args.turfs // 5), role='turf_owner')
+    # Joiners are separate so the 3-active-groups limit never trips the join benchmark
+    joiners = seed_users(rng, run_id, args.iterations)
+    posts = seed_posts(rng, run_id, args.posts, users, players_needed=args.iterations + 2)
+    turfs = seed_turfs(rng, run_id, args.turfs, owners)
+    seed_bookings(rng, turfs, users, args.bookings_per_turf, booking_date)
+    seed_ratings(rng, posts, users, args.ratings)
+    seed_messages(rng, posts[:args.message_groups], args.messages_per_group)
+    seed_seconds = time.perf_counter() - seed_started
+
+    client = app.test_client()
+    results = {}
+
+    def nearby(i):
+        lat, lng = CITY_CENTRES[i % len(CITY_CENTRES)]
+        return client.post('/api/posts/nearby', json={
+            'lat': lat, 'lng': lng, 'radius_km': args.radius_km
+        }).status_code
+
+    # All joins target one post, like a popular game filling up
+    join_post = posts[0]
+
+    def join(i):
+        return client.post(f"/api/posts/{join_post['id']}/join", json={
+            'user_id': joiners[i]['id']
+        }).status_code
+
+    chat_posts = posts[:max(1, args.message_groups)]
+
+    def group_messages(i):
+        post = chat_posts[i % len(chat_posts)]
+        return client.get(
+            f"/api/groups/{post['group_id']}/messages?user_id={post['user_id']}"
+        ).status_code
+
+    def availability(i):
+        turf = turfs[i % len(turfs)]
+        return client.post(f"/api/turfs/{turf['id']}/availability", json={
+            'date': booking_date
+        }).status_code
+
+    def health(i):
+        return client.get('/api/health').status_code
+
+    for name, call in [
+        ('POST /api/posts/nearby', nearby),
+        ('POST /api/posts/<post_id>/join', join),
+        ('GET /api/groups/<group_id>/messages', group_messages),
+        ('POST /api/turfs/<turf_id>/availability', availability),
+        ('GET /api/health', health),
+    ]:
+        key, value = measure(name, args.iterations, call)
+        results[key] = value
+
+    # Socket.IO: send_message round trip until the sender sees its own broadcast
+    sio = socketio.test_client(app)
+    chat_post = chat_posts[0]
+    sio.emit('join_group', {'group_id': chat_post['group_id'], 'user_name': chat_post['user_name']})
+    sio.get_received()
+
+    def socket_send(i):
+        sio.emit('send_message', {
+            'group_id': chat_post['group_id'],
+            'user_id': chat_post['user_id'],
+            'user_name': chat_post['user_name'],
+            'message': f'bench {i}'
+        })
+        received = sio.get_received()
+        return 200 if any(r['name'] == 'new_message' for r in received) else 500
+
+    key, value = measure('SOCKET send_message', args.iterations, socket_send)
+    results[key] = value
+    sio.disconnect()
+
+    return {
+        'benchmark': 'endpoints',
+        'commit': git_commit(),
+        'bench_run': run_id,
+        'timestamp': datetime.now().isoformat(),
+        'dataset': {
+            'users': args.users,
+            'posts': args.posts,
+            'turfs': args.turfs,
+            'bookings_per_turf': args.bookings_per_turf,
+            'ratings': args.ratings,
+            'message_groups': args.message_groups,
+            'messages_per_group': args.messages_per_group,
+            'seed_seconds': round(seed_seconds, 2)
+        },
+        'iterations': args.iterations,
+        'endpoints': results
+    }
+
+
+def compare(current, baseline):
+    """Print p50/p95/p99 deltas of `current` against a previous result"""
+    print(f"{'endpoint':45} {'metric':6} {'baseline':>10} {'current':>10} {'delta':>8}")
+    for name, stats in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        for metric in ('p50', 'p95', 'p99'):
+            old = before['latency_ms'][metric]
+            new = stats['latency_ms'][metric]
+            delta = ((new - old) / old * 100.0) if old else 0.0
+            print(f'{name:45} {metric:6} {old:10.3f} {new:10.3f} {delta:+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--turfs', type=int, default=50)
+    parser.add_argument('--bookings-per-turf', type=int, default=8)
+    parser.add_argument('--ratings', type=int, default=200)
+    parser.add_argument('--message-groups', type=int, default=20)
+    parser.add_argument('--messages-per-group', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--radius-km', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=42, help='random seed for the dataset')
+    parser.add_argument('--output', help='write the JSON result to this file as well')
+    parser.add_argument('--compare', help='previous JSON result to diff against')
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Measure Socket.IO room broadcast latency across N server processes.
+
+Starts N copies of app.py on consecutive ports, all sharing one message
+queue, connects clients to every process, joins them to the same group room
+and then publishes broadcasts from an external emitter. The time until each
+client receives a broadcast is the cross-worker fan-out latency.
+
+Usage:
+    python benchmarks/socketio_fanout.py --workers 4 --clients 25 \
+        --queue redis://localhost:6379/0
+
+Requires a running Redis (or any kombu URL reachable by every process) and
+the Socket.IO client extras: pip install "python-socketio[client]"
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import socketio as socketio_client
+from flask_socketio import SocketIO
+
+from bench_utils import git_commit, summarize_latencies
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_port(port, timeout=30):
+    """Block until something listens on localhost:port"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_workers(count, base_port, queue_url):
+    """Spawn `count` app.py processes sharing the message queue"""
+    processes = []
+    for i in range(count):
+        env = dict(os.environ)
+        env.update({
+            'PORT': str(base_port + i),
+            'FLASK_DEBUG': '0',
+            'SOCKETIO_MESSAGE_QUEUE': queue_url,
+        })
+        processes.append(subprocess.Popen(
+            [sys.executable, 'app.py'], cwd=BACKEND_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+    for i in range(count):
+        if not wait_for_port(base_port + i):
+            stop_workers(processes)
+            raise RuntimeError(f'Worker on port {base_port + i} did not start')
+    return processes
+
+
+def stop_workers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def connect_clients(workers, clients_per_worker, base_port, room, on_message):
+    """Connect clients round the workers and join them all to `room`"""
+    clients = []
+    for i in range(workers):
+        for _ in range(clients_per_worker):
+            client = socketio_client.Client(reconnection=False)
+            client.on('new_message', on_message)
+            client.connect(f'http://127.0.0.1:{base_port + i}', transports=['websocket'])
+            client.emit('join_group', {'group_id': room, 'user_name': 'bench'})
+            clients.append(client)
+    return clients
+
+
+def run(args):
+    room = f'bench_{uuid.uuid4().hex[:8]}'
+    latencies = []
+    received = {}
+    lock = threading.Lock()
+
+    def on_message(data):
+        now = time.time()
+        with lock:
+            latencies.append((now - data['sent_at']) * 1000.0)
+            received[data['seq']] = received.get(data['seq'], 0) + 1
+
+    processes = start_workers(args.workers, args.base_port, args.queue)
+    clients = []
+    try:
+        clients = connect_clients(args.workers, args.clients, args.base_port, room, on_message)
+        # Give join_room a moment to land on every worker
+        time.sleep(1.0)
+
+        emitter = SocketIO(message_queue=args.queue)
+        expected = args.workers * args.clients
+        started = time.time()
+        for seq in range(args.messages):
+            emitter.emit('new_message', {
+                'seq': seq,
+                'sent_at': time.time(),
+                'message': 'x' * args.payload
+            }, room=room)
+            time.sleep(args.interval)
+
+        deadline = time.time() + args.drain
+        while time.time() < deadline:
+            with lock:
+                if sum(received.values()) >= expected * args.messages:
+                    break
+            time.sleep(0.05)
+        elapsed = time.time() - started
+    finally:
+        for client in clients:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+        stop_workers(processes)
+
+    delivered = sum(received.values())
+    result = {
+        'benchmark': 'socketio_fanout',
+        'commit': git_commit(),
+        'workers': args.workers,
+        'clients': args.workers * args.clients,
+        'messages': args.messages,
+        'delivered': delivered,
+        'delivery_ratio': round(delivered / float(expected * args.messages), 4) if expected else 0.0,
+        'deliveries_per_sec': round(delivered / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': summarize_latencies(latencies)
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2, help='server processes to start')
+    parser.add_argument('--clients', type=int, default=10, help='clients per server process')
+    parser.add_argument('--messages', type=int, default=200, help='broadcasts to send')
+    parser.add_argument('--interval', type=float, default=0.01, help='seconds between broadcasts')
+    parser.add_argument('--payload', type=int, default=64, help='message size in bytes')
+    parser.add_argument('--drain', type=float, default=10.0, help='seconds to wait for stragglers')
+    parser.add_argument('--base-port', type=int, default=5100)
+    parser.add_argument('--queue', default=os.environ.get('SOCKETIO_MESSAGE_QUEUE', 'redis://localhost:6379/0'))
+    parser.add_argument('--output', help='write the JSON result to this file as well')
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
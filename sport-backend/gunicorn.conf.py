@@ -0,0 +1,74 @@
+"""Gunicorn configuration for running the Sport API in production.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden through environment variables so the same
+file works locally, on Cloud Run and on a plain VM.
+"""
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# ======================
+# SERVER SOCKET
+# ======================
+
+# Cloud Run injects PORT; BIND wins if both are set
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# Pending connections the kernel queues before accept()
+backlog = _env_int('GUNICORN_BACKLOG', 2048)
+
+
+# ======================
+# WORKERS
+# ======================
+
+# gevent + websocket worker: every Socket.IO client is a greenlet, and
+# Firestore (grpc) / requests calls yield instead of blocking the process.
+worker_class = os.environ.get(
+    'GUNICORN_WORKER_CLASS',
+    'geventwebsocket.gunicorn.workers.GeventWebSocketWorker'
+)
+
+# Socket.IO long-polling needs sticky sessions, which gunicorn cannot provide
+# between its own workers. Keep one worker per process unless clients use the
+# websocket transport only and a message queue is configured.
+workers = _env_int('WEB_CONCURRENCY', _env_int('GUNICORN_WORKERS', 1))
+
+# Max simultaneous clients (sockets + HTTP requests) per worker
+worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 5000)
+
+# Long-lived websockets must not be killed by the worker timeout; the
+# heartbeat is handled by Socket.IO ping/pong instead.
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Recycle workers periodically to cap memory growth (0 disables)
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 0)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 0)
+
+
+# ======================
+# LOGGING
+# ======================
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', None)
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+# ======================
+# HOOKS
+# ======================
+
+def worker_exit(server, worker):
+    """Persist chat messages still sitting in the write-behind buffer"""
+    from utils.message_buffer import flush_messages
+    flush_messages()
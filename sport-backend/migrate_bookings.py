@@ -0,0 +1,56 @@
+"""Move embedded turf `bookings` arrays into the turf_bookings collection.
+
+Safe to run while the API is serving traffic: new bookings already go to the
+collection and still respect unmigrated legacy entries, each turf's array is
+removed in a transaction that re-reads it (legacy cancellations made during
+the run are kept), and turfs that were migrated are skipped on the next run.
+
+Bulk bookings and availability ranges need a composite Firestore index on
+turf_bookings (turf_id ASC, date ASC); create it before deploying.
+
+Usage:
+    python migrate_bookings.py [--batch-size 100] [--dry-run]
+"""
+import argparse
+
+from utils.firebase_storage import get_db
+from utils.booking_helper import TURFS_COLLECTION, migrate_turf_bookings
+
+
+def stream_turfs(batch_size):
+    """Yield turf documents page by page, ordered by document id"""
+    db = get_db()
+    query = db.collection(TURFS_COLLECTION).order_by('__name__').limit(batch_size)
+    last = None
+    while True:
+        page = list((query.start_after(last) if last else query).stream())
+        if not page:
+            return
+        for doc in page:
+            yield {'id': doc.id, **doc.to_dict()}
+        last = page[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate embedded turf bookings to their own collection')
+    parser.add_argument('--batch-size', type=int, default=100, help='turfs read per page')
+    parser.add_argument('--dry-run', action='store_true', help='count what would move without writing')
+    args = parser.parse_args()
+
+    turfs_seen = 0
+    turfs_migrated = 0
+    bookings_moved = 0
+    for turf in stream_turfs(args.batch_size):
+        turfs_seen += 1
+        if turf.get('bookings_migrated') or 'bookings' not in turf:
+            continue
+        moved = migrate_turf_bookings(turf, dry_run=args.dry_run)
+        turfs_migrated += 1
+        bookings_moved += moved
+        print(f"{'[dry-run] ' if args.dry_run else ''}{turf['id']}: {moved} bookings")
+
+    print(f'Turfs scanned: {turfs_seen}, migrated: {turfs_migrated}, bookings moved: {bookings_moved}')
+
+
+if __name__ == '__main__':
+    main()
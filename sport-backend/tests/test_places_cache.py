@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.places_cache import PlacesCache
+
+
+def place(place_id, lat, lng):
+    return {'id': place_id, 'location': {'lat': lat, 'lng': lng}}
+
+
+class FakeProvider:
+    def __init__(self, places):
+        self.places = places
+        self.calls = []
+        self.fail = False
+
+    def __call__(self, lat, lng, radius_km):
+        self.calls.append((lat, lng, radius_km))
+        if self.fail:
+            raise RuntimeError('quota exceeded')
+        return list(self.places)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class PlacesCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.provider = FakeProvider([
+            place('far', 18.5400, 73.8400),
+            place('near', 18.5205, 73.8568),
+            {'id': 'unknown'},
+        ])
+        self.clock = FakeClock()
+        self.cache = PlacesCache(self.provider, path=None, ttl=60, clock=self.clock)
+
+    def ids(self, results):
+        return [result['id'] for result in results]
+
+    def test_filters_by_radius_and_sorts_by_distance(self):
+        results = self.cache.get(18.5204, 73.8567, 1)
+        self.assertEqual(self.ids(results), ['near', 'unknown'])
+        self.assertLess(results[0]['distance_km'], 0.1)
+
+        self.assertEqual(self.ids(self.cache.get(18.5204, 73.8567, 5)), ['near', 'far', 'unknown'])
+
+    def test_nearby_points_share_a_tile(self):
+        self.cache.get(18.5204, 73.8567, 3)
+        self.cache.get(18.5209, 73.8561, 4)
+        self.assertEqual(len(self.provider.calls), 1)
+        # The tile is queried wide enough to cover any point in it
+        self.assertGreater(self.provider.calls[0][2], 5)
+
+    def test_expired_tile_is_refetched(self):
+        self.cache.get(18.5204, 73.8567, 1)
+        self.clock.now += 61
+        self.cache.get(18.5204, 73.8567, 1)
+        self.assertEqual(len(self.provider.calls), 2)
+
+    def test_serves_stale_tile_when_provider_fails(self):
+        self.cache.get(18.5204, 73.8567, 1)
+        self.clock.now += 61
+        self.provider.fail = True
+        self.assertEqual(self.ids(self.cache.get(18.5204, 73.8567, 1)), ['near', 'unknown'])
+
+    def test_provider_error_without_cached_tile_propagates(self):
+        self.provider.fail = True
+        with self.assertRaises(RuntimeError):
+            self.cache.get(18.5204, 73.8567, 1)
+
+    def test_saturated_tile_uses_the_finer_grid(self):
+        self.provider.places = [place(f'p{i}', 18.6, 73.9) for i in range(20)]
+        cache = PlacesCache(self.provider, path=None, ttl=60, result_cap=20, clock=self.clock)
+        cache.get(18.5204, 73.8567, 5)
+        self.assertEqual(len(self.provider.calls), 2)
+        lat, lng, radius_km = self.provider.calls[1]
+        self.assertAlmostEqual(lat, 18.521, places=6)
+        self.assertAlmostEqual(lng, 73.857, places=6)
+        self.assertLess(radius_km, 5.2)
+
+        # A nearby caller in the same fine cell is served from the cache
+        cache.get(18.5207, 73.8565, 4)
+        self.assertEqual(len(self.provider.calls), 2)
+
+
+class PlacesCacheDiskTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'places.sqlite3')
+        self.provider = FakeProvider([place('near', 18.5205, 73.8568)])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_new_cache_starts_warm_from_disk(self):
+        PlacesCache(self.provider, path=self.path).get(18.5204, 73.8567, 1)
+        results = PlacesCache(self.provider, path=self.path).get(18.5204, 73.8567, 1)
+        self.assertEqual([result['id'] for result in results], ['near'])
+        self.assertEqual(len(self.provider.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from utils.search_index import SearchIndex, tokenize
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_folds_case_and_accents(self):
+        self.assertEqual(tokenize('Café FÚTBOL 5-a-side'), ['cafe', 'futbol', '5', 'a', 'side'])
+
+    def test_joins_lists(self):
+        self.assertEqual(tokenize(['Parking', 'Floodlights']), ['parking', 'floodlights'])
+
+    def test_empty(self):
+        self.assertEqual(tokenize(None), [])
+        self.assertEqual(tokenize(''), [])
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.load('turf', {
+            't1': {'name': 'Green Arena', 'sports': ['football', 'cricket'], 'location': {'address': 'Baner Road'}},
+            't2': {'name': 'Cricket Club', 'sports': ['cricket']},
+            't3': {'name': 'Closed Ground', 'sports': ['football'], 'status': 'inactive'},
+        })
+        self.index.load('user', {'u1': {'name': 'Aarav Shah', 'email': 'aarav@example.com', 'phone': '999'}})
+
+    def ids(self, query, **kwargs):
+        return [result['id'] for result in self.index.search(query, **kwargs)]
+
+    def test_exact_match_ranks_by_field_weight(self):
+        # Name (x3) outranks sports (x2)
+        self.assertEqual(self.ids('cricket'), ['t2', 't1'])
+
+    def test_prefix(self):
+        self.assertEqual(self.ids('foot'), ['t1'])
+        self.assertEqual(self.ids('foot', prefix=False), [])
+
+    def test_fuzzy_one_edit_and_transposition(self):
+        self.assertEqual(self.ids('fotball'), ['t1'])
+        self.assertEqual(self.ids('cirkcet'), [])
+        self.assertEqual(self.ids('crikcet'), ['t2', 't1'])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.ids('green cricket'), ['t1'])
+        self.assertEqual(self.ids('green tennis'), [])
+
+    def test_kinds_filter(self):
+        self.assertEqual(self.ids('aarav'), ['u1'])
+        self.assertEqual(self.ids('aarav', kinds=('turf',)), [])
+
+    def test_inactive_turf_not_indexed(self):
+        self.assertNotIn('t3', self.ids('closed'))
+
+    def test_no_contact_details(self):
+        result = self.index.search('aarav')[0]
+        self.assertNotIn('email', result)
+        self.assertNotIn('phone', result)
+
+    def test_remove_drops_tokens(self):
+        self.index.remove('turf', 't2')
+        self.assertEqual(self.ids('club'), [])
+        self.assertEqual(self.ids('cricket'), ['t1'])
+        self.assertEqual(self.ids('clu'), [])
+
+    def test_upsert_replaces_tokens(self):
+        self.index.upsert('turf', 't2', {'name': 'Tennis Court', 'sports': ['tennis']})
+        self.assertEqual(self.ids('club'), [])
+        self.assertEqual(self.ids('tenis'), ['t2'])
+
+    def test_upsert_of_deleted_post_removes_it(self):
+        self.index.upsert('post', 'p1', {'sport': 'badminton'})
+        self.assertEqual(self.ids('badminton'), ['p1'])
+        self.index.upsert('post', 'p1', {'sport': 'badminton', 'status': 'deleted'})
+        self.assertEqual(self.ids('badminton'), [])
+
+    def test_past_posts_not_returned(self):
+        self.index.upsert('post', 'p1', {'sport': 'badminton', 'date': '2020-01-01'})
+        self.index.upsert('post', 'p2', {'sport': 'badminton', 'date': '2999-01-01'})
+        self.assertEqual(self.ids('badminton'), ['p2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
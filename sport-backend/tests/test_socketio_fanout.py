@@ -0,0 +1,118 @@
+"""Group chat fan-out through a Socket.IO message queue, in-process
+
+With SOCKETIO_MESSAGE_QUEUE set, every emit(..., room=...) is published to
+the queue and delivered by the manager's listener, on this worker as on the
+others. An in-memory queue stands in for Redis, so the app's own
+join_group / send_message handlers are exercised without a broker.
+"""
+import os
+import queue
+import time
+import unittest
+from unittest import mock
+
+# Background tasks must be real threads for the listener to run beside the test
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'threading')
+
+import socketio  # noqa: E402
+
+import app as app_module  # noqa: E402
+
+
+class MemoryQueue:
+    """Fan-out bus shared by the managers of every simulated worker"""
+
+    def __init__(self):
+        self.inboxes = []
+        self.published = []
+
+    def publish(self, data):
+        self.published.append(data)
+        for inbox in list(self.inboxes):
+            inbox.put(data)
+
+
+class MemoryManager(socketio.PubSubManager):
+    name = 'memory'
+
+    def __init__(self, bus):
+        super().__init__(channel='flask-socketio')
+        self._bus = bus
+        self._inbox = queue.Queue()
+        bus.inboxes.append(self._inbox)
+
+    def _publish(self, data):
+        self._bus.publish(data)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+class GroupChatFanoutTest(unittest.TestCase):
+    def setUp(self):
+        self.persisted = []
+        for name, value in (('get_group_member_ids', lambda group_id: {'u1', 'u2'}),
+                            ('enqueue_message', self.persisted.append)):
+            patcher = mock.patch.object(app_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # The test client refuses a queue-backed manager, so connect first and then
+        # hand the connections over to one, as a worker with SOCKETIO_MESSAGE_QUEUE has
+        self.alice = app_module.socketio.test_client(app_module.app)
+        self.bob = app_module.socketio.test_client(app_module.app)
+        server = app_module.socketio.server
+        self.saved_manager = server.manager
+        self.queue = MemoryQueue()
+        manager = MemoryManager(self.queue)
+        manager.set_server(server)
+        for state in ('rooms', 'eio_to_sid', 'callbacks', 'pending_disconnect'):
+            setattr(manager, state, getattr(self.saved_manager, state))
+        manager.initialize()
+        server.manager = manager
+
+        for client, user_name in ((self.alice, 'Alice'), (self.bob, 'Bob')):
+            client.emit('join_group', {'group_id': 'g1', 'user_name': user_name})
+        self.received(self.alice, 'user_joined')  # Bob's join went through the queue
+
+    def tearDown(self):
+        for client in (self.alice, self.bob):
+            if client.is_connected():
+                client.disconnect()
+        app_module.socketio.server.manager = self.saved_manager
+
+    def received(self, client, event, timeout=2.0):
+        """Events named `event` the client received within `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            packets = [p for p in client.get_received() if p['name'] == event]
+            if packets:
+                return packets
+            time.sleep(0.01)
+        return []
+
+    def test_message_reaches_the_other_member(self):
+        self.alice.emit('send_message', {
+            'group_id': 'g1', 'user_id': 'u1', 'user_name': 'Alice', 'message': 'Kick-off at 6?'
+        })
+
+        packets = self.received(self.bob, 'new_message')
+        self.assertEqual(len(packets), 1)
+        message = packets[0]['args'][0]
+        self.assertEqual(message['message'], 'Kick-off at 6?')
+        self.assertEqual(message['user_id'], 'u1')
+        self.assertIn('new_message', [data.get('event') for data in self.queue.published])
+        self.assertEqual([m['id'] for m in self.persisted], [message['id']])
+
+    def test_message_from_non_member_is_not_broadcast(self):
+        self.alice.emit('send_message', {'group_id': 'g1', 'user_id': 'u3', 'message': 'hello'})
+
+        errors = self.received(self.alice, 'error')
+        self.assertEqual(errors[0]['args'][0]['message'], 'You are not a member of this group')
+        self.assertEqual(self.received(self.bob, 'new_message', timeout=0.2), [])
+        self.assertEqual(self.persisted, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
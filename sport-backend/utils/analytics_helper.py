@@ -0,0 +1,176 @@
+"""
+Incrementally maintained turf-owner analytics.
+
+Every booking and cancellation bumps counters in one document per
+(owner, play date) using Firestore field increments, so the dashboard reads
+one document per day in the requested range instead of scanning bookings:
+
+    turf_owner_daily_stats/{owner_id}_{YYYY-MM-DD}
+        bookings, cancellations, revenue
+        turfs.{turf_id}.bookings / cancellations / revenue
+        hours.{HH}                 booked slots starting in that hour
+
+The owner's `business.total_bookings` / `business.total_revenue` counters are
+kept in step with the same increments.
+
+booking_helper records bookings and cancellations inside the booking
+transaction (record_in_transaction), so the stats commit or roll back with
+the booking itself. record_cancellation() is for bookings cancelled outside
+it (legacy embedded bookings, cascade deletes). In both, an owner document
+that no longer exists only skips the business counters.
+"""
+from datetime import datetime, timedelta
+
+from firebase_admin import firestore
+
+from utils.firebase_storage import get_db, USERS_COLLECTION
+from utils.counters import increment_business_stats
+
+TURF_ANALYTICS_COLLECTION = 'turf_owner_daily_stats'
+
+# Firestore get_all() handles large batches, but keep requests bounded
+MAX_ANALYTICS_DAYS = 366
+
+
+def parse_time_slot(time_slot):
+    """'10:00-12:00' -> (duration_hours, ['10', '11']); (0, []) if malformed
+
+    Same slot rules as booking_helper.slot_range, including '23:00-00:00'
+    ending at midnight.
+    """
+    # booking_helper imports this module, so import it when first used
+    from utils.booking_helper import slot_range
+    span = slot_range(time_slot)
+    if span is None:
+        return 0.0, []
+    start, end = span
+    return (end - start) / 60.0, [f'{hour:02d}' for hour in range(start // 60, (end + 59) // 60)]
+
+
+def booking_amount(turf, time_slot):
+    """Price of a booking at the turf's flat hourly rate"""
+    hours, _ = parse_time_slot(time_slot)
+    return round(float(turf.get('pricing', {}).get('per_hour', 0)) * hours, 2)
+
+
+def _day_update(owner_id, turf_id, date, time_slot, amount, booked):
+    _, hours = parse_time_slot(time_slot)
+    sign = 1 if booked else -1
+
+    turf_counters = {'revenue': firestore.Increment(sign * amount)}
+    turf_counters['bookings' if booked else 'cancellations'] = firestore.Increment(1)
+    return {
+        'owner_id': owner_id,
+        'date': date,
+        'revenue': firestore.Increment(sign * amount),
+        'bookings' if booked else 'cancellations': firestore.Increment(1),
+        'turfs': {turf_id: turf_counters},
+        'hours': {hour: firestore.Increment(sign) for hour in hours},
+    }
+
+
+def _day_updates(turf, bookings, booked):
+    """([(day stats ref, update)], revenue) for a set of bookings"""
+    db = get_db()
+    owner_id = turf['owner_id']
+    revenue = 0.0
+    updates = []
+    for booking in bookings:
+        amount = booking['amount'] if 'amount' in booking else booking_amount(turf, booking['time_slot'])
+        revenue += amount
+        updates.append((
+            db.collection(TURF_ANALYTICS_COLLECTION).document(f"{owner_id}_{booking['date']}"),
+            _day_update(owner_id, turf['id'], booking['date'], booking['time_slot'], amount, booked)
+        ))
+    return updates, revenue
+
+
+def record_in_transaction(transaction, turf, bookings, booked=True):
+    """Count bookings (or, with booked=False, their cancellation) in the booking's transaction
+
+    Reads the owner document, so call it after the transaction's other reads
+    and before its writes.
+    """
+    db = get_db()
+    owner_ref = db.collection(USERS_COLLECTION).document(turf['owner_id'])
+    owner_exists = owner_ref.get(transaction=transaction).exists
+    sign = 1 if booked else -1
+
+    updates, revenue = _day_updates(turf, bookings, booked)
+    for ref, update in updates:
+        transaction.set(ref, update, merge=True)
+    if owner_exists:
+        transaction.update(owner_ref, {
+            'business.total_bookings': firestore.Increment(sign * len(bookings)),
+            'business.total_revenue': firestore.Increment(sign * revenue)
+        })
+
+
+def record_cancellation(turf, booking):
+    """Reverse a booking's revenue/occupancy and count the cancellation (outside a booking transaction)"""
+    updates, revenue = _day_updates(turf, [booking], False)
+    batch = get_db().batch()
+    for ref, update in updates:
+        batch.set(ref, update, merge=True)
+    batch.commit()
+    # Unbatched, so a deleted owner is skipped instead of failing the stats write
+    increment_business_stats(turf['owner_id'], total_bookings=-1, total_revenue=-revenue)
+
+
+def get_owner_analytics(owner_id, start_date, end_date):
+    """Aggregate daily stats for owner between two YYYY-MM-DD dates (inclusive)"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    days = (end - start).days + 1
+    if days <= 0:
+        raise ValueError('from must not be after to')
+    if days > MAX_ANALYTICS_DAYS:
+        raise ValueError(f'Range cannot exceed {MAX_ANALYTICS_DAYS} days')
+
+    db = get_db()
+    collection = db.collection(TURF_ANALYTICS_COLLECTION)
+    dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    refs = [collection.document(f'{owner_id}_{date}') for date in dates]
+    docs = {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+
+    totals = {'bookings': 0, 'cancellations': 0, 'revenue': 0.0}
+    per_turf = {}
+    hours = {}
+    daily = []
+    for date in dates:
+        stats = docs.get(f'{owner_id}_{date}') or {}
+        day = {
+            'date': date,
+            'bookings': stats.get('bookings', 0),
+            'cancellations': stats.get('cancellations', 0),
+            'revenue': round(stats.get('revenue', 0.0), 2),
+            'turfs': stats.get('turfs', {})
+        }
+        daily.append(day)
+
+        for key in totals:
+            totals[key] += day[key]
+        for turf_id, counters in day['turfs'].items():
+            turf_totals = per_turf.setdefault(turf_id, {'bookings': 0, 'cancellations': 0, 'revenue': 0.0})
+            for key in turf_totals:
+                turf_totals[key] += counters.get(key, 0)
+        for hour, count in stats.get('hours', {}).items():
+            hours[hour] = hours.get(hour, 0) + count
+
+    def with_rates(counters):
+        counters['revenue'] = round(counters['revenue'], 2)
+        counters['net_bookings'] = counters['bookings'] - counters['cancellations']
+        counters['cancellation_rate'] = (
+            round(counters['cancellations'] / counters['bookings'], 4) if counters['bookings'] else 0.0
+        )
+        return counters
+
+    return {
+        'owner_id': owner_id,
+        'from': start_date,
+        'to': end_date,
+        'totals': with_rates(totals),
+        'turfs': {turf_id: with_rates(counters) for turf_id, counters in per_turf.items()},
+        'occupancy_by_hour': dict(sorted(hours.items())),
+        'daily': daily
+    }
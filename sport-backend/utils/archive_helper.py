@@ -0,0 +1,313 @@
+"""
+Retention: move finished posts, orphaned chat messages and old read
+notifications out of the hot collections.
+
+Live collections only ever grow otherwise, and every scan of them (nearby
+posts, a user's posts, notifications) pays for games that ended months ago.
+archive_stale_data() moves, in batches of ARCHIVE_BATCH_SIZE documents:
+
+    posts          date older than ARCHIVE_POSTS_AFTER_DAYS          -> archived_posts
+    messages       of deleted groups                                 -> archived_message_chunks
+    notifications  read, older than ARCHIVE_NOTIFICATIONS_AFTER_DAYS -> archived_notification_chunks
+
+Each batch writes the archive documents and deletes the originals in one
+Firestore batch, so a run can be interrupted at any point and simply started
+again. Archived documents are stored as zlib-compressed JSON (`payload`)
+next to the few fields the archive read endpoints query on; messages and
+notifications are packed into one chunk per group / user per batch.
+
+Every path that deletes a group first records its id in deleted_groups
+(mark_group_deleted), and the message rule only queries the messages of
+those groups instead of scanning the whole collection; a group's marker is
+removed once its messages are archived. Groups deleted without a marker
+(before markers existed, or by chat_helper's expiry and merge maintenance)
+are found by backfill_deleted_groups(), which scans the messages once:
+`python archive_data.py --backfill-deleted-groups`.
+
+Run it from cron or Cloud Scheduler with archive_data.py.
+"""
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+from utils.change_events import publish
+from utils.firebase_storage import get_db, POSTS_COLLECTION
+from utils.log_helper import get_logger
+
+try:
+    from utils.firebase_storage import GROUPS_COLLECTION
+except ImportError:
+    GROUPS_COLLECTION = 'groups'
+try:
+    from utils.firebase_storage import MESSAGES_COLLECTION
+except ImportError:
+    MESSAGES_COLLECTION = 'messages'
+try:
+    from utils.firebase_storage import NOTIFICATIONS_COLLECTION
+except ImportError:
+    NOTIFICATIONS_COLLECTION = 'notifications'
+
+ARCHIVED_POSTS_COLLECTION = 'archived_posts'
+ARCHIVED_MESSAGES_COLLECTION = 'archived_message_chunks'
+ARCHIVED_NOTIFICATIONS_COLLECTION = 'archived_notification_chunks'
+DELETED_GROUPS_COLLECTION = 'deleted_groups'
+
+ARCHIVE_POSTS_AFTER_DAYS = int(os.environ.get('ARCHIVE_POSTS_AFTER_DAYS', 7))
+ARCHIVE_NOTIFICATIONS_AFTER_DAYS = int(os.environ.get('ARCHIVE_NOTIFICATIONS_AFTER_DAYS', 30))
+# Each archived document costs a set and a delete; Firestore caps a batch at 500 writes
+ARCHIVE_BATCH_SIZE = min(int(os.environ.get('ARCHIVE_BATCH_SIZE', 200)), 240)
+
+MAX_ARCHIVE_PAGE = 100
+
+logger = get_logger('archive')
+
+
+def pack(data):
+    return zlib.compress(json.dumps(data, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def unpack(payload):
+    return json.loads(zlib.decompress(bytes(payload)).decode('utf-8'))
+
+
+def is_past_post(post, today=None):
+    """True once the game's date has passed (posts without a date never expire)"""
+    today = today or datetime.now().strftime('%Y-%m-%d')
+    date = post.get('date')
+    return bool(date) and date < today
+
+
+def _player_ids(post):
+    ids = {post['user_id']}
+    ids.update(p['user_id'] for p in post.get('accepted_players', []))
+    return sorted(ids)
+
+
+# ======================
+# ARCHIVING
+# ======================
+
+def archive_past_posts(now=None, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """Move posts dated more than ARCHIVE_POSTS_AFTER_DAYS ago; returns the number moved"""
+    db = get_db()
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=ARCHIVE_POSTS_AFTER_DAYS)).strftime('%Y-%m-%d')
+    # Posts stored without a date ('') never expire, like is_past_post says
+    stale = db.collection(POSTS_COLLECTION).where('date', '>', '').where('date', '<', cutoff)
+    if dry_run:
+        return sum(1 for _ in stale.select([]).stream())
+    query = stale.limit(batch_size)
+    archive = db.collection(ARCHIVED_POSTS_COLLECTION)
+    archived_at = now.isoformat()
+    moved = 0
+    while True:
+        docs = list(query.stream())
+        if not docs:
+            return moved
+        batch = db.batch()
+        for doc in docs:
+            post = {'id': doc.id, **doc.to_dict()}
+            batch.set(archive.document(doc.id), {
+                'id': doc.id,
+                'user_id': post.get('user_id'),
+                'player_ids': _player_ids(post) if post.get('user_id') else [],
+                'sport': post.get('sport'),
+                'date': post.get('date'),
+                'archived_at': archived_at,
+                'payload': pack(post)
+            })
+            batch.delete(doc.reference)
+        batch.commit()
+        moved += len(docs)
+        for doc in docs:
+            publish('post', 'deleted', doc.id)
+
+
+def _marker(group_id):
+    return {'group_id': group_id, 'deleted_at': datetime.now().isoformat()}
+
+
+def mark_group_deleted(group_id, batch=None):
+    """Record a group about to be deleted so its messages get archived without a collection scan
+
+    Call it before deleting the group: a marker left for a group that still
+    exists is simply dropped by the next archive run.
+    """
+    ref = get_db().collection(DELETED_GROUPS_COLLECTION).document(group_id)
+    if batch is not None:
+        batch.set(ref, _marker(group_id))
+    else:
+        ref.set(_marker(group_id))
+
+
+def backfill_deleted_groups(batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """Mark every group that still has messages but no longer exists; returns the number marked
+
+    Reads the group_id of every message, so run it once (and after group
+    deletions that bypassed mark_group_deleted), not on every archive run.
+    """
+    db = get_db()
+    group_ids = set()
+    for doc in db.collection(MESSAGES_COLLECTION).select(['group_id']).stream():
+        group_id = (doc.to_dict() or {}).get('group_id')
+        if group_id:
+            group_ids.add(group_id)
+
+    groups = db.collection(GROUPS_COLLECTION)
+    ordered = sorted(group_ids)
+    missing = []
+    for start in range(0, len(ordered), batch_size):
+        refs = [groups.document(group_id) for group_id in ordered[start:start + batch_size]]
+        missing.extend(doc.id for doc in db.get_all(refs) if not doc.exists)
+    if dry_run:
+        return len(missing)
+
+    for start in range(0, len(missing), batch_size):
+        batch = db.batch()
+        for group_id in missing[start:start + batch_size]:
+            mark_group_deleted(group_id, batch=batch)
+        batch.commit()
+    logger.info('archive.backfilled_deleted_groups', extra={'fields': {'count': len(missing)}})
+    return len(missing)
+
+
+def archive_orphaned_messages(now=None, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """Move messages of deleted groups, one chunk per group per batch; returns the number moved"""
+    db = get_db()
+    archived_at = (now or datetime.now()).isoformat()
+    archive = db.collection(ARCHIVED_MESSAGES_COLLECTION)
+    moved = 0
+    for marker in db.collection(DELETED_GROUPS_COLLECTION).stream():
+        group_id = marker.id
+        if db.collection(GROUPS_COLLECTION).document(group_id).get().exists:
+            marker.reference.delete()  # recreated under the same id
+            continue
+        messages_query = db.collection(MESSAGES_COLLECTION).where('group_id', '==', group_id)
+        if dry_run:
+            moved += sum(1 for _ in messages_query.select([]).stream())
+            continue
+
+        while True:
+            docs = list(messages_query.limit(batch_size).stream())
+            if not docs:
+                break
+            messages = sorted((doc.to_dict() for doc in docs), key=lambda m: m.get('timestamp', ''))
+            batch = db.batch()
+            batch.set(archive.document(f'{group_id}_{uuid.uuid4().hex[:12]}'), {
+                'group_id': group_id,
+                'author_ids': sorted({m.get('user_id') for m in messages if m.get('user_id')}),
+                'count': len(messages),
+                'first_timestamp': messages[0].get('timestamp', ''),
+                'last_timestamp': messages[-1].get('timestamp', ''),
+                'archived_at': archived_at,
+                'payload': pack(messages)
+            })
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            moved += len(docs)
+        marker.reference.delete()
+    return moved
+
+
+def archive_read_notifications(now=None, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """Move read notifications older than ARCHIVE_NOTIFICATIONS_AFTER_DAYS; returns the number moved"""
+    db = get_db()
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=ARCHIVE_NOTIFICATIONS_AFTER_DAYS)).isoformat()
+    stale = db.collection(NOTIFICATIONS_COLLECTION).where('read', '==', True).where('created_at', '<', cutoff)
+    if dry_run:
+        return sum(1 for _ in stale.select([]).stream())
+    query = stale.limit(batch_size)
+    archive = db.collection(ARCHIVED_NOTIFICATIONS_COLLECTION)
+    archived_at = now.isoformat()
+    moved = 0
+    while True:
+        docs = list(query.stream())
+        if not docs:
+            return moved
+
+        by_user = {}
+        for doc in docs:
+            by_user.setdefault((doc.to_dict() or {}).get('user_id') or 'unknown', []).append(doc)
+        batch = db.batch()
+        for user_id, user_docs in by_user.items():
+            notifications = sorted((doc.to_dict() for doc in user_docs), key=lambda n: n.get('created_at', ''))
+            batch.set(archive.document(f'{user_id}_{uuid.uuid4().hex[:12]}'), {
+                'user_id': user_id,
+                'count': len(notifications),
+                'first_created_at': notifications[0].get('created_at', ''),
+                'last_created_at': notifications[-1].get('created_at', ''),
+                'archived_at': archived_at,
+                'payload': pack(notifications)
+            })
+            for doc in user_docs:
+                batch.delete(doc.reference)
+        batch.commit()
+        moved += len(docs)
+
+
+def archive_stale_data(now=None, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """Run every retention rule; returns {'posts': n, 'messages': n, 'notifications': n}"""
+    result = {}
+    for name, rule in (('posts', archive_past_posts),
+                       ('messages', archive_orphaned_messages),
+                       ('notifications', archive_read_notifications)):
+        result[name] = rule(now=now, batch_size=batch_size, dry_run=dry_run)
+        logger.info('archive.moved', extra={'fields': {'rule': name, 'count': result[name], 'dry_run': dry_run}})
+    return result
+
+
+# ======================
+# ARCHIVE READS
+# ======================
+
+def get_archived_post(post_id):
+    doc = get_db().collection(ARCHIVED_POSTS_COLLECTION).document(post_id).get()
+    if not doc.exists:
+        return None
+    return {**unpack(doc.get('payload')), 'archived': True}
+
+
+def get_archived_user_posts(user_id, before=None, limit=20):
+    """Archived games the user organised or played in, newest first; `before` is a date cursor"""
+    query = (get_db().collection(ARCHIVED_POSTS_COLLECTION)
+             .where('player_ids', 'array_contains', user_id)
+             .order_by('date', direction='DESCENDING'))
+    if before:
+        query = query.where('date', '<', before)
+    return [{**unpack(doc.get('payload')), 'archived': True}
+            for doc in query.limit(min(limit, MAX_ARCHIVE_PAGE)).stream()]
+
+
+def get_archived_group_messages(group_id):
+    """(messages oldest first, ids of users allowed to read them) for a deleted group"""
+    messages = []
+    allowed = set()
+    for doc in get_db().collection(ARCHIVED_MESSAGES_COLLECTION).where('group_id', '==', group_id).stream():
+        messages.extend(unpack(doc.get('payload')))
+        allowed.update(doc.get('author_ids') or [])
+    if group_id.startswith('group_'):
+        post = get_db().collection(ARCHIVED_POSTS_COLLECTION).document(group_id[len('group_'):]).get()
+        if post.exists:
+            allowed.update(post.get('player_ids') or [])
+    messages.sort(key=lambda m: m.get('timestamp', ''))
+    return messages, allowed
+
+
+def get_archived_notifications(user_id, before=None, limit=50):
+    """Archived notifications of a user, newest first; `before` is a created_at cursor"""
+    query = (get_db().collection(ARCHIVED_NOTIFICATIONS_COLLECTION)
+             .where('user_id', '==', user_id)
+             .order_by('last_created_at', direction='DESCENDING'))
+    limit = min(limit, MAX_ARCHIVE_PAGE)
+    notifications = []
+    for doc in query.stream():
+        # Chunks overlap in time; stop once no later chunk can hold anything newer than the page
+        if len(notifications) >= limit and doc.get('last_created_at') <= notifications[limit - 1].get('created_at', ''):
+            break
+        notifications.extend(n for n in unpack(doc.get('payload')) if not before or n.get('created_at', '') < before)
+        notifications.sort(key=lambda n: n.get('created_at', ''), reverse=True)
+    return notifications[:limit]
@@ -0,0 +1,164 @@
+"""
+Stateless session tokens and password hashing policy.
+
+Login hands out two signed tokens (itsdangerous, HMAC with SECRET_KEY):
+
+    access   {'uid', 'role'}        valid ACCESS_TOKEN_TTL seconds (15 min)
+    refresh  {'uid', 'pwd'}         valid REFRESH_TOKEN_TTL seconds (30 days)
+
+Access tokens are checked by @require_auth with a constant-time signature
+comparison and no storage read. When one expires the app calls
+/api/auth/refresh instead of logging in again, so the deliberately slow
+password hash runs once per session rather than on every app launch. The
+refresh token carries a fingerprint of the password hash, so changing the
+password (or a rehash) invalidates outstanding refresh tokens.
+
+Passwords are hashed with PASSWORD_HASH_METHOD (any werkzeug method string,
+e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"). A successful login with
+a hash made under different parameters returns a fresh hash for the caller
+to store, so changing the setting migrates users as they log in.
+
+Set AUTH_REQUIRED=1 once every client sends tokens; until then requests
+without a token are let through, while requests with one are verified and
+must match the user they act for. Socket.IO clients send the token when
+connecting (auth={'token': ...}); their messages must then come from it.
+
+SECRET_KEY must be set in production (wsgi.py refuses to start without
+it); the development server falls back to a random per-process key.
+"""
+import functools
+import hashlib
+import os
+
+from flask import g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from utils.log_helper import get_logger
+
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', 15 * 60))
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', 30 * 24 * 3600))
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '0') == '1'
+
+logger = get_logger('auth')
+
+_secret = os.environ.get('SECRET_KEY')
+if not _secret:
+    # Tokens then only verify in the process that issued them
+    logger.warning('SECRET_KEY is not set; using a random per-process key')
+    _secret = os.urandom(32).hex()
+
+_access = URLSafeTimedSerializer(_secret, salt='sportmate-access')
+_refresh = URLSafeTimedSerializer(_secret, salt='sportmate-refresh')
+
+# Full parameter string werkzeug writes for the configured method ("scrypt" -> "scrypt:32768:8:1")
+_hash_prefix = generate_password_hash('', method=PASSWORD_HASH_METHOD).split('$', 1)[0]
+
+
+class AuthError(Exception):
+    """Token missing, invalid or expired"""
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+def verify_password(stored_hash, password):
+    """(matches, new_hash): new_hash is set when the stored hash uses outdated parameters"""
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    if stored_hash.split('$', 1)[0] != _hash_prefix:
+        return True, hash_password(password)
+    return True, None
+
+
+def _password_fingerprint(stored_hash):
+    return hashlib.sha256(stored_hash.encode()).hexdigest()[:16]
+
+
+def issue_tokens(user):
+    """Access and refresh tokens for a user that just proved their password"""
+    return {
+        'access_token': _access.dumps({'uid': user['id'], 'role': user.get('role', 'player')}),
+        'refresh_token': _refresh.dumps({'uid': user['id'], 'pwd': _password_fingerprint(user['password'])}),
+        'token_type': 'Bearer',
+        'expires_in': ACCESS_TOKEN_TTL
+    }
+
+
+def verify_access_token(token):
+    """Claims of a valid access token; raises AuthError"""
+    try:
+        return _access.loads(token, max_age=ACCESS_TOKEN_TTL)
+    except SignatureExpired:
+        raise AuthError('Token expired')
+    except BadSignature:
+        raise AuthError('Invalid token')
+
+
+def read_refresh_token(token):
+    """Claims of a valid refresh token; raises AuthError"""
+    try:
+        return _refresh.loads(token, max_age=REFRESH_TOKEN_TTL)
+    except SignatureExpired:
+        raise AuthError('Refresh token expired')
+    except BadSignature:
+        raise AuthError('Invalid refresh token')
+
+
+def refresh_is_current(claims, user):
+    """False once the user's password hash changed since the refresh token was issued"""
+    return claims.get('pwd') == _password_fingerprint(user['password'])
+
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        return header[7:].strip()
+    return None
+
+
+def verify_socket_auth(auth):
+    """Claims of the token a Socket.IO client connects with, None without one; raises AuthError"""
+    token = auth.get('token') if isinstance(auth, dict) else None
+    token = token or _bearer_token()
+    if token is None:
+        if AUTH_REQUIRED:
+            raise AuthError('Authentication required')
+        return None
+    return verify_access_token(token)
+
+
+def require_auth(identity='user_id'):
+    """Verify the bearer token and that it belongs to the user named by `identity`
+
+    `identity` is looked up in the URL arguments, the JSON body, then the
+    query string; a mismatch is a 403. The token's claims are available as g.auth.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _bearer_token()
+            g.auth = None
+            if token is None:
+                if AUTH_REQUIRED:
+                    return jsonify({'error': 'Authentication required'}), 401
+                return view(*args, **kwargs)
+
+            try:
+                g.auth = verify_access_token(token)
+            except AuthError as e:
+                return jsonify({'error': str(e)}), 401
+
+            if identity:
+                claimed = kwargs.get(identity)
+                if claimed is None:
+                    claimed = (request.get_json(silent=True) or {}).get(identity)
+                if claimed is None:
+                    claimed = request.args.get(identity)
+                if claimed is not None and claimed != g.auth['uid']:
+                    return jsonify({'error': 'Token does not belong to this user'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
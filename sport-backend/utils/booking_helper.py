@@ -0,0 +1,440 @@
+"""
+Turf bookings stored in their own collection.
+
+Each booking is one document keyed by (turf_id, date, time_slot):
+
+    turf_bookings/{turf_id}_{YYYY-MM-DD}_{HH:MM-HH:MM}
+
+so the turf document only carries summary counters (total_bookings,
+total_cancellations) and its size no longer grows with every booking.
+Cancelling moves the booking to its own document,
+{key}_cancelled_{suffix}, which frees the slot's key for the next booking
+without overwriting the cancelled one.
+
+An end time of 00:00 means midnight at the end of the day ('23:00-00:00').
+
+Booking and cancelling run in a Firestore transaction over the turf's
+bookings for that day, which makes the overlap check and the write atomic.
+The owner's analytics counters are updated in the same transaction.
+
+Turfs that still embed a legacy `bookings` array (not yet processed by
+migrate_bookings.py) keep working: those entries are honoured for
+availability and conflicts until the migration moves them.
+
+get_turf_bookings_by_date (bulk bookings, availability ranges) filters on
+turf_id equality plus a date range, which needs a composite Firestore index
+on turf_bookings (turf_id ASC, date ASC).
+"""
+import uuid
+from datetime import datetime, timedelta
+
+from firebase_admin import firestore
+
+from utils.firebase_storage import get_db
+from utils.analytics_helper import record_in_transaction
+
+try:
+    from utils.firebase_storage import TURFS_COLLECTION
+except ImportError:
+    TURFS_COLLECTION = 'turfs'
+
+TURF_BOOKINGS_COLLECTION = 'turf_bookings'
+
+# One transaction writes every booking, one stats document per day, the turf
+# and owner counters (Firestore caps writes at 500)
+MAX_BULK_BOOKINGS = 200
+
+
+def booking_key(turf_id, date, time_slot):
+    """Document id of a booking"""
+    return f'{turf_id}_{date}_{time_slot}'
+
+
+def cancelled_booking_key(key, suffix=None):
+    """Document id a cancelled booking is kept under"""
+    return f'{key}_cancelled_{suffix or uuid.uuid4().hex[:12]}'
+
+
+def slot_range(time_slot):
+    """'10:00-12:00' -> (600, 720) minutes since midnight, or None if malformed"""
+    try:
+        start, end = time_slot.split('-')
+        start_h, start_m = (int(part) for part in start.strip().split(':'))
+        end_h, end_m = (int(part) for part in end.strip().split(':'))
+    except (AttributeError, ValueError):
+        return None
+    start_min = start_h * 60 + start_m
+    end_min = end_h * 60 + end_m
+    if end_min == 0:
+        end_min = 24 * 60  # '23:00-00:00' ends at midnight
+    if end_min <= start_min:
+        return None
+    return start_min, end_min
+
+
+def _overlaps(a, b):
+    return a[0] < b[1] and b[0] < a[1]
+
+
+def _is_active(booking):
+    return booking.get('status', 'confirmed') != 'cancelled'
+
+
+def _legacy_bookings(turf, date):
+    return [b for b in turf.get('bookings', []) if b.get('date') == date and _is_active(b)]
+
+
+def _bookings_collection(db):
+    return db.collection(TURF_BOOKINGS_COLLECTION)
+
+
+def get_turf_bookings(turf, date, transaction=None):
+    """Active bookings of a turf on a date (collection plus any unmigrated legacy entries)"""
+    db = get_db()
+    query = _bookings_collection(db).where('turf_id', '==', turf['id']).where('date', '==', date)
+    bookings = [doc.to_dict() for doc in query.stream(transaction=transaction)]
+    return [b for b in bookings if _is_active(b)] + _legacy_bookings(turf, date)
+
+
+def get_turf_bookings_by_date(turf, start_date, end_date, transaction=None):
+    """{date: [active bookings]} for every date in the inclusive range, in one query"""
+    db = get_db()
+    query = (_bookings_collection(db)
+             .where('turf_id', '==', turf['id'])
+             .where('date', '>=', start_date)
+             .where('date', '<=', end_date))
+    by_date = {}
+    for doc in query.stream(transaction=transaction):
+        booking = doc.to_dict()
+        if _is_active(booking):
+            by_date.setdefault(booking['date'], []).append(booking)
+    for booking in turf.get('bookings', []):
+        if start_date <= booking.get('date', '') <= end_date and _is_active(booking):
+            by_date.setdefault(booking['date'], []).append(booking)
+    return by_date
+
+
+def find_conflicts(requested, booked):
+    """Requested time slots that overlap any booked slot (or are malformed)"""
+    booked_ranges = [r for r in (slot_range(b['time_slot']) for b in booked) if r]
+    conflicts = []
+    for time_slot in requested:
+        wanted = slot_range(time_slot)
+        if wanted is None or any(_overlaps(wanted, r) for r in booked_ranges):
+            conflicts.append(time_slot)
+    return conflicts
+
+
+def hourly_slots(turf):
+    """['06:00-07:00', ...] between the turf's opening and closing times"""
+    timings = turf.get('timings', {})
+    try:
+        open_h = int(timings.get('opening', '06:00').split(':')[0])
+        close_h = int(timings.get('closing', '22:00').split(':')[0])
+    except (AttributeError, ValueError):
+        return []
+    if close_h <= open_h:
+        close_h = 24
+    return [f'{hour:02d}:00-{(hour + 1) % 24:02d}:00' for hour in range(open_h, close_h)]
+
+
+def available_slots(turf, booked):
+    """[(time_slot, available)] for every hourly slot of a day with the given bookings"""
+    slots = hourly_slots(turf)
+    taken = set(find_conflicts(slots, booked))
+    return [(slot, slot not in taken) for slot in slots]
+
+
+def _new_booking(turf, booking_data, date, time_slot):
+    key = booking_key(turf['id'], date, time_slot)
+    booking = {
+        'id': key,
+        'booking_id': key,
+        'turf_id': turf['id'],
+        'turf_name': turf.get('name', ''),
+        'owner_id': turf.get('owner_id'),
+        'group_id': booking_data.get('group_id'),
+        'user_id': booking_data['user_id'],
+        'user_name': booking_data.get('user_name', ''),
+        'date': date,
+        'time_slot': time_slot,
+        'status': 'confirmed',
+        'created_at': datetime.now().isoformat()
+    }
+    for field in ('amount', 'currency', 'recurrence_id'):
+        if field in booking_data:
+            booking[field] = booking_data[field]
+    return booking
+
+
+def create_booking(turf, booking_data, quote=None):
+    """Atomically book a slot; returns the booking, or None if the slot overlaps another booking
+
+    quote(booked) is called inside the transaction with the day's existing
+    bookings and its result stored as the booking amount.
+    """
+    db = get_db()
+    turf_id = turf['id']
+    date = booking_data['date']
+    time_slot = booking_data['time_slot']
+    booking = _new_booking(turf, booking_data, date, time_slot)
+    key = booking['id']
+
+    @firestore.transactional
+    def book(transaction):
+        booked = get_turf_bookings(turf, date, transaction=transaction)
+        if find_conflicts([time_slot], booked):
+            return None
+        if quote is not None:
+            booking['amount'] = quote(booked)
+        record_in_transaction(transaction, turf, [booking])
+        transaction.set(_bookings_collection(db).document(key), booking)
+        transaction.update(db.collection(TURFS_COLLECTION).document(turf_id), {
+            'total_bookings': firestore.Increment(1)
+        })
+        return booking
+
+    return book(db.transaction())
+
+
+def expand_recurrence(start_date, time_slot, count=None, until=None, every_days=7):
+    """[(date, time_slot)] repeating every `every_days` from start_date, for `count` times or until a date"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    last = datetime.strptime(until, '%Y-%m-%d') if until else None
+    if every_days < 1:
+        raise ValueError('every_days must be at least 1')
+    if count is None and last is None:
+        raise ValueError('Recurrence needs a count or an until date')
+
+    occurrences = []
+    current = start
+    while (count is None or len(occurrences) < count) and (last is None or current <= last):
+        if len(occurrences) >= MAX_BULK_BOOKINGS:
+            raise ValueError(f'Cannot book more than {MAX_BULK_BOOKINGS} slots at once')
+        occurrences.append((current.strftime('%Y-%m-%d'), time_slot))
+        current += timedelta(days=every_days)
+    return occurrences
+
+
+def create_bookings(turf, booking_data, occurrences, quote=None, allow_partial=False):
+    """Book many (date, time_slot) pairs in one transaction; returns (bookings, conflicts)
+
+    All slots are checked against the turf's calendar (and each other) in one
+    pass over a single date-range query. Unless allow_partial is set, any
+    conflict aborts the whole request and nothing is written. quote(date,
+    time_slot, booked) prices each booking like create_booking's quote.
+    """
+    if not occurrences:
+        return [], []
+    if len(occurrences) > MAX_BULK_BOOKINGS:
+        raise ValueError(f'Cannot book more than {MAX_BULK_BOOKINGS} slots at once')
+
+    db = get_db()
+    turf_id = turf['id']
+    dates = sorted(date for date, _ in occurrences)
+
+    @firestore.transactional
+    def book(transaction):
+        by_date = get_turf_bookings_by_date(turf, dates[0], dates[-1], transaction=transaction)
+        bookings = []
+        conflicts = []
+        for date, time_slot in occurrences:
+            booked = by_date.setdefault(date, [])
+            if find_conflicts([time_slot], booked):
+                conflicts.append({'date': date, 'time_slot': time_slot})
+                continue
+            booking = _new_booking(turf, booking_data, date, time_slot)
+            if quote is not None:
+                booking['amount'] = quote(date, time_slot, booked)
+            # Later occurrences in the same request must not overlap this one
+            booked.append(booking)
+            bookings.append(booking)
+
+        if not bookings or (conflicts and not allow_partial):
+            return [], conflicts
+        record_in_transaction(transaction, turf, bookings)
+        for booking in bookings:
+            transaction.set(_bookings_collection(db).document(booking['id']), booking)
+        transaction.update(db.collection(TURFS_COLLECTION).document(turf_id), {
+            'total_bookings': firestore.Increment(len(bookings))
+        })
+        return bookings, conflicts
+
+    return book(db.transaction())
+
+
+def get_booking(booking_id):
+    """Load a booking by id (new key or the id it had before migration)"""
+    db = get_db()
+    doc = _bookings_collection(db).document(booking_id).get()
+    if doc.exists:
+        return doc.to_dict()
+    legacy = list(_bookings_collection(db).where('legacy_id', '==', booking_id).limit(1).stream())
+    return legacy[0].to_dict() if legacy else None
+
+
+def _cancelled(booking, doc_id, fields=None):
+    """The record a cancelled booking is moved to (see cancelled_booking_key)"""
+    cancelled_key = cancelled_booking_key(doc_id)
+    return {
+        **booking,
+        'id': cancelled_key,
+        'booking_id': cancelled_key,
+        'cancelled_from': doc_id,
+        'status': 'cancelled',
+        'cancelled_at': datetime.now().isoformat(),
+        **(fields or {})
+    }
+
+
+def _move_cancelled(transaction, db, turf, cancellations):
+    """Count [(doc_id, cancelled)] in analytics, move them off their slot keys and bump the turf counter"""
+    record_in_transaction(transaction, turf, [cancelled for _, cancelled in cancellations], booked=False)
+    collection = _bookings_collection(db)
+    for doc_id, cancelled in cancellations:
+        # Move it off the slot's key so rebooking the slot cannot overwrite it
+        transaction.set(collection.document(cancelled['id']), cancelled)
+        transaction.delete(collection.document(doc_id))
+    transaction.update(db.collection(TURFS_COLLECTION).document(turf['id']), {
+        'total_cancellations': firestore.Increment(len(cancellations))
+    })
+
+
+def cancel_booking(turf, booking_id, user_id):
+    """Cancel the user's booking; returns the cancelled booking, or None if not found/unauthorized"""
+    db = get_db()
+    booking = get_booking(booking_id)
+    if not booking or booking['turf_id'] != turf['id'] or booking['user_id'] != user_id:
+        return None
+    if not _is_active(booking):
+        return None
+
+    ref = _bookings_collection(db).document(booking['id'])
+
+    @firestore.transactional
+    def cancel(transaction):
+        current = ref.get(transaction=transaction)
+        if not current.exists or not _is_active(current.to_dict()):
+            return None
+        cancelled = _cancelled(current.to_dict(), ref.id)
+        _move_cancelled(transaction, db, turf, [(ref.id, cancelled)])
+        return cancelled
+
+    return cancel(db.transaction())
+
+
+def cancel_bookings(turf, booking_ids, **fields):
+    """Cancel several bookings of one turf in one transaction; returns the ones cancelled
+
+    Bookings that are gone or already cancelled are skipped. `fields` (e.g.
+    cancel_reason) are stored on each cancelled booking. At most
+    MAX_BULK_BOOKINGS ids per call.
+    """
+    if not booking_ids:
+        return []
+    if len(booking_ids) > MAX_BULK_BOOKINGS:
+        raise ValueError(f'Cannot cancel more than {MAX_BULK_BOOKINGS} bookings at once')
+    db = get_db()
+    refs = [_bookings_collection(db).document(booking_id) for booking_id in booking_ids]
+
+    @firestore.transactional
+    def cancel(transaction):
+        cancellations = []
+        for ref in refs:
+            current = ref.get(transaction=transaction)
+            if current.exists and _is_active(current.to_dict()):
+                cancellations.append((ref.id, _cancelled(current.to_dict(), ref.id, fields)))
+        if cancellations:
+            _move_cancelled(transaction, db, turf, cancellations)
+        return [cancelled for _, cancelled in cancellations]
+
+    return cancel(db.transaction())
+
+
+# ======================
+# MIGRATION FROM EMBEDDED ARRAYS
+# ======================
+
+def _migrated(turf, old):
+    """(key, document) for a legacy embedded booking, or None if it has no slot"""
+    if not old.get('date') or not old.get('time_slot'):
+        return None
+    key = booking_key(turf['id'], old['date'], old['time_slot'])
+    status = old.get('status', 'confirmed')
+    if status == 'cancelled':
+        # A cancelled entry must not overwrite a live booking of the same slot
+        key = cancelled_booking_key(key, old.get('id'))
+    return key, {
+        **old,
+        'id': key,
+        'booking_id': key,
+        'legacy_id': old.get('id'),
+        'turf_id': turf['id'],
+        'turf_name': turf.get('name', ''),
+        'owner_id': turf.get('owner_id'),
+        'status': status,
+    }
+
+
+def migrate_turf_bookings(turf, dry_run=False):
+    """Move a turf's embedded `bookings` array into the bookings collection; returns bookings moved
+
+    The bulk of the array is copied from `turf` in plain batches (the writes
+    are idempotent). The array is then removed in a transaction that
+    re-reads the turf, so entries added or cancelled through the legacy
+    helpers during the copy are written as they are now, and the counters
+    are set against the turf's current values instead of overwriting
+    concurrent increments.
+    """
+    legacy = turf.get('bookings')
+    if legacy is None:
+        return 0
+
+    db = get_db()
+    collection = _bookings_collection(db)
+    copied = dict(filter(None, (_migrated(turf, old) for old in legacy)))
+    if dry_run:
+        return len(copied)
+
+    batch = db.batch()
+    for count, (key, doc) in enumerate(copied.items(), 1):
+        batch.set(collection.document(key), doc)
+        # Firestore allows 500 writes per batch
+        if count % 450 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+    turf_ref = db.collection(TURFS_COLLECTION).document(turf['id'])
+
+    @firestore.transactional
+    def finish(transaction):
+        current = turf_ref.get(transaction=transaction)
+        fresh = current.to_dict() if current.exists else {}
+        if 'bookings' not in fresh:
+            return 0  # migrated by another run meanwhile
+        fresh_turf = {**turf, **fresh, 'id': turf['id']}
+        entries = dict(filter(None, (_migrated(fresh_turf, old) for old in fresh['bookings'])))
+
+        # Copies of entries cancelled since: keep only if the slot was not booked again meanwhile
+        stale = []
+        for key in copied.keys() - entries.keys():
+            snapshot = collection.document(key).get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get('legacy_id') == copied[key]['legacy_id']:
+                stale.append(key)
+
+        for key in stale:
+            transaction.delete(collection.document(key))
+        for key, doc in entries.items():
+            if copied.get(key) != doc:
+                transaction.set(collection.document(key), doc)
+        cancelled = sum(1 for doc in entries.values() if doc['status'] == 'cancelled')
+        transaction.update(turf_ref, {
+            'bookings': firestore.DELETE_FIELD,
+            'total_bookings': max(fresh.get('total_bookings', 0), len(entries)),
+            'total_cancellations': max(fresh.get('total_cancellations', 0), cancelled),
+            'bookings_migrated': True
+        })
+        return len(entries)
+
+    return finish(db.transaction())
@@ -0,0 +1,377 @@
+"""
+Background cascade delete for posts.
+
+Deleting a post used to notify every player, delete the group and the post
+inside the HTTP request, and leave the group's chat messages, the game's
+ratings and the group's turf bookings behind. Now the request only marks the
+post `status: deleted` and records a job:
+
+    deletion_jobs/post_{post_id}
+        status      pending / running / done / failed / abandoned
+        progress    {step: {done, count, ...}} for each step below
+        lease_until the worker holding the job; others leave it alone until then
+
+A background worker runs the steps in order, each in batches of at most
+CASCADE_BATCH_SIZE documents, and saves the progress after every batch:
+
+    notify     tell the players the game is cancelled
+    group      delete the group, so no new chat messages arrive
+    messages   delete the group's chat messages
+    ratings    delete ratings given for the game and recompute the rated players' averages
+    bookings   cancel the group's upcoming turf bookings (past ones stay as the turf's history)
+    post       delete the post
+
+Every step is idempotent, so a job interrupted by a restart or an error is
+picked up again where its progress left off (a batch of notifications may
+be sent twice). Unfinished jobs are resumed by the worker the server entry
+points (wsgi.py, `python app.py`) start, at startup and every
+CASCADE_RESUME_INTERVAL seconds. A job that fails CASCADE_MAX_ATTEMPTS
+times is marked `abandoned`, logged as an error and counted in
+sportmate_cascade_jobs_total; the worker no longer picks it up until
+retry_deletion_job() (POST /api/deletions/<job_id>/retry) queues it again.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from firebase_admin import firestore
+
+from utils.archive_helper import mark_group_deleted
+from utils.booking_helper import TURF_BOOKINGS_COLLECTION, cancel_bookings
+from utils.chat_helper import get_group_by_id
+from utils.firebase_storage import (
+    get_db, get_post_by_id, update_post, delete_post, delete_group, USERS_COLLECTION
+)
+from utils.log_helper import get_logger
+from utils.metrics import record_cascade_job
+from utils.rating_helper import create_notification, calculate_user_average_rating
+from utils.turf_helper import get_turf_by_id
+
+try:
+    from utils.firebase_storage import MESSAGES_COLLECTION
+except ImportError:
+    MESSAGES_COLLECTION = 'messages'
+try:
+    from utils.firebase_storage import RATINGS_COLLECTION
+except ImportError:
+    RATINGS_COLLECTION = 'ratings'
+
+DELETION_JOBS_COLLECTION = 'deletion_jobs'
+
+CASCADE_BATCH_SIZE = min(int(os.environ.get('CASCADE_BATCH_SIZE', 200)), 400)
+CASCADE_LEASE_SECONDS = float(os.environ.get('CASCADE_LEASE_SECONDS', 120))
+CASCADE_RESUME_INTERVAL = float(os.environ.get('CASCADE_RESUME_INTERVAL', 300))
+CASCADE_MAX_ATTEMPTS = int(os.environ.get('CASCADE_MAX_ATTEMPTS', 5))
+
+STEPS = ('notify', 'group', 'messages', 'ratings', 'bookings', 'post')
+# Jobs the worker still has to run
+RESUMABLE_STATUSES = ('pending', 'running', 'failed')
+
+logger = get_logger('cascade')
+
+_worker_started = False
+_worker_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def _jobs():
+    return get_db().collection(DELETION_JOBS_COLLECTION)
+
+
+def deletion_job_id(post_id):
+    return f'post_{post_id}'
+
+
+def get_live_post(post_id):
+    """get_post_by_id, treating a post whose deletion is under way as already gone"""
+    post = get_post_by_id(post_id)
+    if post is None or post.get('status') == 'deleted':
+        return None
+    return post
+
+
+# ======================
+# STEPS
+# ======================
+# Each takes (job, progress) and returns (documents handled, step finished)
+
+def _notify_players(job, progress):
+    cursor = progress.get('cursor', 0)
+    recipients = job['notify'][cursor:cursor + CASCADE_BATCH_SIZE]
+    for user_id in recipients:
+        create_notification(
+            user_id,
+            'game_cancelled',
+            'Game Cancelled ❌',
+            f"{job['post']['user_name']}'s {job['post']['sport']} game has been cancelled",
+            {'post_id': job['post_id']}
+        )
+    progress['cursor'] = cursor + len(recipients)
+    return len(recipients), progress['cursor'] >= len(job['notify'])
+
+
+def _delete_group(job, progress):
+    if get_group_by_id(job['group_id']):
+        mark_group_deleted(job['group_id'])
+        delete_group(job['group_id'])
+        return 1, True
+    return 0, True
+
+
+def _delete_query_batch(query):
+    db = get_db()
+    docs = list(query.limit(CASCADE_BATCH_SIZE).stream())
+    if docs:
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+    return docs
+
+
+def _delete_messages(job, progress):
+    query = get_db().collection(MESSAGES_COLLECTION).where('group_id', '==', job['group_id'])
+    docs = _delete_query_batch(query)
+    return len(docs), len(docs) < CASCADE_BATCH_SIZE
+
+
+def _delete_ratings(job, progress):
+    query = get_db().collection(RATINGS_COLLECTION).where('post_id', '==', job['post_id'])
+    docs = _delete_query_batch(query)
+    rated = set(progress.get('rated_users', []))
+    rated.update(filter(None, ((doc.to_dict() or {}).get('rated_user_id') for doc in docs)))
+    progress['rated_users'] = sorted(rated)
+    if len(docs) == CASCADE_BATCH_SIZE:
+        return len(docs), False
+
+    users = get_db().collection(USERS_COLLECTION)
+    for user_id in progress['rated_users']:
+        average = calculate_user_average_rating(user_id)
+        users.document(user_id).update({
+            'stats.average_rating': average['average_rating'],
+            'stats.total_ratings': average['total_ratings']
+        })
+    return len(docs), True
+
+
+def _cancel_bookings(job, progress):
+    db = get_db()
+    today = datetime.now().strftime('%Y-%m-%d')
+    orphaned = set(progress.get('orphaned', []))  # bookings of turfs that no longer exist
+    upcoming = [
+        doc for doc in db.collection(TURF_BOOKINGS_COLLECTION).where('group_id', '==', job['group_id']).stream()
+        if doc.to_dict().get('date', '') >= today and doc.to_dict().get('status', 'confirmed') != 'cancelled'
+        and doc.id not in orphaned
+    ]
+    # Each booking costs a move (set + delete) and a daily stats write in its turf's transaction
+    chunk = upcoming[:CASCADE_BATCH_SIZE // 3]
+    if not chunk:
+        return 0, True
+
+    per_turf = {}
+    for doc in chunk:
+        per_turf.setdefault(doc.to_dict()['turf_id'], []).append(doc.id)
+    for turf_id, booking_ids in per_turf.items():
+        turf = get_turf_by_id(turf_id)
+        if not turf:
+            orphaned.update(booking_ids)
+            progress['orphaned'] = sorted(orphaned)
+            continue
+        # Same move to {key}_cancelled_{suffix} as a user's cancellation, analytics included
+        cancel_bookings(turf, booking_ids, cancel_reason='post_deleted')
+    return len(chunk), len(chunk) == len(upcoming)
+
+
+def _delete_post(job, progress):
+    delete_post(job['post_id'])
+    return 1, True
+
+
+_STEP_HANDLERS = {
+    'notify': _notify_players,
+    'group': _delete_group,
+    'messages': _delete_messages,
+    'ratings': _delete_ratings,
+    'bookings': _cancel_bookings,
+    'post': _delete_post,
+}
+
+
+# ======================
+# JOBS
+# ======================
+
+def start_post_deletion(post, requested_by):
+    """Mark the post deleted and queue its cascade; returns the job id (existing job if already queued)"""
+    job_id = deletion_job_id(post['id'])
+    ref = _jobs().document(job_id)
+    if post.get('status') == 'deleted' and ref.get().exists:
+        return job_id
+
+    now = datetime.now().isoformat()
+    ref.set({
+        'id': job_id,
+        'kind': 'post',
+        'post_id': post['id'],
+        'group_id': post.get('group_id') or f"group_{post['id']}",
+        'post': {'user_name': post.get('user_name', ''), 'sport': post.get('sport', '')},
+        'notify': [p['user_id'] for p in post.get('accepted_players', []) if p['user_id'] != requested_by],
+        'requested_by': requested_by,
+        'status': 'pending',
+        'progress': {},
+        'attempts': 0,
+        'lease_until': 0,
+        'created_at': now,
+        'updated_at': now
+    })
+    update_post(post['id'], {**post, 'status': 'deleted', 'deleted_at': now, 'deletion_job_id': job_id})
+    start_deletion_worker()
+    _wake.set()
+    return job_id
+
+
+def get_deletion_job(job_id):
+    doc = _jobs().document(job_id).get()
+    if not doc.exists:
+        return None
+    job = doc.to_dict()
+    return {
+        'id': job['id'],
+        'post_id': job['post_id'],
+        'requested_by': job.get('requested_by'),
+        'status': job['status'],
+        'attempts': job.get('attempts', 0),
+        'steps': [
+            {'name': step, 'done': job['progress'].get(step, {}).get('done', False),
+             'count': job['progress'].get(step, {}).get('count', 0)}
+            for step in STEPS
+        ],
+        'error': job.get('error'),
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at']
+    }
+
+
+def _claim(job_id):
+    """Take the lease on a job; returns the job, or None if it is finished or held by another worker"""
+    db = get_db()
+    ref = _jobs().document(job_id)
+
+    @firestore.transactional
+    def claim(transaction):
+        doc = ref.get(transaction=transaction)
+        if not doc.exists:
+            return None
+        job = doc.to_dict()
+        if job['status'] not in RESUMABLE_STATUSES or job.get('lease_until', 0) > time.time():
+            return None
+        if job.get('attempts', 0) >= CASCADE_MAX_ATTEMPTS:
+            # Its last attempt died without recording a failure (e.g. the process was killed)
+            transaction.update(ref, {'status': 'abandoned', 'updated_at': datetime.now().isoformat()})
+            abandoned.append(job)
+            return None
+        update = {
+            'status': 'running',
+            'attempts': job.get('attempts', 0) + 1,
+            'lease_until': time.time() + CASCADE_LEASE_SECONDS,
+            'updated_at': datetime.now().isoformat()
+        }
+        transaction.update(ref, update)
+        return {**job, **update}
+
+    abandoned = []
+    job = claim(db.transaction())
+    if abandoned:
+        _report_abandoned(job_id, abandoned[-1].get('error'))
+    return job
+
+
+def _report_abandoned(job_id, error):
+    logger.error('cascade.abandoned', extra={'fields': {
+        'job_id': job_id, 'attempts': CASCADE_MAX_ATTEMPTS, 'error': error
+    }})
+    record_cascade_job('abandoned')
+
+
+def run_deletion_job(job_id):
+    """Run (or resume) a job to the end; returns True if it finished"""
+    job = _claim(job_id)
+    if job is None:
+        return False
+    ref = _jobs().document(job_id)
+    step = None
+    try:
+        for step in STEPS:
+            progress = job['progress'].setdefault(step, {'done': False, 'count': 0})
+            while not progress['done']:
+                count, progress['done'] = _STEP_HANDLERS[step](job, progress)
+                progress['count'] += count
+                # Save after every batch and extend the lease
+                ref.update({
+                    f'progress.{step}': progress,
+                    'lease_until': time.time() + CASCADE_LEASE_SECONDS,
+                    'updated_at': datetime.now().isoformat()
+                })
+    except Exception as e:
+        logger.exception('cascade.failed', extra={'fields': {'job_id': job_id, 'step': step}})
+        exhausted = job['attempts'] >= CASCADE_MAX_ATTEMPTS
+        ref.update({'status': 'abandoned' if exhausted else 'failed', 'error': f'{step}: {e}', 'lease_until': 0,
+                    'updated_at': datetime.now().isoformat()})
+        if exhausted:
+            _report_abandoned(job_id, f'{step}: {e}')
+        else:
+            record_cascade_job('failed')
+        return False
+
+    ref.update({'status': 'done', 'error': None, 'lease_until': 0, 'updated_at': datetime.now().isoformat()})
+    record_cascade_job('done')
+    logger.info('cascade.done', extra={'fields': {
+        'job_id': job_id, 'counts': {step: job['progress'][step]['count'] for step in STEPS}
+    }})
+    return True
+
+
+def resume_deletion_jobs():
+    """Run every unfinished job whose lease has expired; returns the number finished"""
+    query = _jobs().where('status', 'in', list(RESUMABLE_STATUSES))
+    return sum(1 for doc in query.stream() if run_deletion_job(doc.id))
+
+
+def retry_deletion_job(job_id):
+    """Queue an abandoned or failed job again with a fresh attempt budget; returns the job, or None"""
+    ref = _jobs().document(job_id)
+    doc = ref.get()
+    if not doc.exists or doc.get('status') not in ('abandoned', 'failed'):
+        return None
+    ref.update({'status': 'pending', 'attempts': 0, 'lease_until': 0, 'updated_at': datetime.now().isoformat()})
+    logger.info('cascade.retry', extra={'fields': {'job_id': job_id}})
+    start_deletion_worker()
+    _wake.set()
+    return get_deletion_job(job_id)
+
+
+# ======================
+# WORKER
+# ======================
+
+def _worker_loop():
+    while True:
+        _wake.clear()
+        try:
+            resume_deletion_jobs()
+        except Exception:
+            logger.exception('cascade.resume_failed')
+        _wake.wait(CASCADE_RESUME_INTERVAL)
+
+
+def start_deletion_worker():
+    """Start the background worker once per process; it first resumes jobs a previous process left unfinished"""
+    global _worker_started
+    if _worker_started:
+        return
+    with _worker_lock:
+        if _worker_started:
+            return
+        _worker_started = True
+    threading.Thread(target=_worker_loop, name='cascade-delete', daemon=True).start()
@@ -0,0 +1,300 @@
+"""
+Change events for users, posts, groups, turfs and bookings.
+
+Derived structures (membership cache, recommendation index, search, ...)
+subscribe to the documents they are built from instead of re-reading whole
+collections when a TTL runs out:
+
+    subscribe('post', handler)          handler(ChangeEvent) for post changes
+    subscribe('*', handler)             every kind
+
+emit_change_events() wraps the storage helpers that write those documents
+(add_post, update_post, delete_post, update_group, create_booking, ...) so
+each successful call publishes an event after the write, and rebinds the
+wrapped version wherever it was imported, like instrument_storage_calls().
+Only modules already imported are rebound: a module that does
+`from utils.firebase_storage import update_post` afterwards keeps the
+unwrapped helper and its writes publish nothing. app.py therefore calls
+check_change_events() right after, which raises if any loaded module still
+holds an unwrapped writing helper; import new writers before that point.
+
+Handlers run synchronously in the writing request, after the write, and
+add to its latency: keep them to in-memory updates under short locks (no
+storage reads, no rebuilding under a lock writers wait on). An exception
+in one is logged and does not affect the write or the other handlers.
+
+Writes made by other worker processes are picked up with Firestore
+on_snapshot listeners when CHANGE_FEED_LISTEN=1 (start_change_listeners()).
+A listener also sees this process's own writes a moment after the local
+event, so handlers must be idempotent: upsert / invalidate, never append.
+
+    CHANGE_FEED_LISTEN   1 to run the snapshot listeners (default 0)
+    CHANGE_FEED_KINDS    kinds to listen to (default user,post,group,turf,booking)
+"""
+import functools
+import importlib
+import inspect
+import os
+import sys
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from utils.log_helper import get_logger
+from utils.metrics import record_change_event
+
+CHANGE_FEED_LISTEN = os.environ.get('CHANGE_FEED_LISTEN', '0') == '1'
+CHANGE_FEED_KINDS = [
+    kind.strip() for kind in os.environ.get('CHANGE_FEED_KINDS', 'user,post,group,turf,booking').split(',')
+    if kind.strip()
+]
+
+logger = get_logger('events')
+
+# op is created / updated / deleted (bookings: created / cancelled); data is the
+# document after the change when known, else None. origin is 'local' or 'firestore'.
+# doc_id is None only when a helper call could not be parsed: treat every
+# document of that kind as changed.
+ChangeEvent = namedtuple('ChangeEvent', ['kind', 'op', 'doc_id', 'data', 'origin'])
+
+_subscribers = {}  # kind -> [handler]
+_lock = threading.Lock()
+_wrapped = {}  # writing helper -> its emitting wrapper
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def subscribe(kind, handler):
+    """Call handler(event) for every change of `kind` ('*' for all); returns handler"""
+    with _lock:
+        _subscribers.setdefault(kind, []).append(handler)
+    return handler
+
+
+def unsubscribe(kind, handler):
+    with _lock:
+        handlers = _subscribers.get(kind, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+
+def publish(kind, op, doc_id, data=None, origin='local'):
+    """Deliver one change to the subscribers of its kind"""
+    event = ChangeEvent(kind, op, doc_id, data, origin)
+    handlers = _subscribers.get(kind, []) + _subscribers.get('*', [])
+    record_change_event(kind, op, origin)
+    for handler in handlers:
+        try:
+            handler(event)
+        except Exception:
+            logger.exception('events.handler_failed', extra={'fields': {
+                'kind': kind, 'op': op, 'doc_id': doc_id, 'handler': getattr(handler, '__name__', repr(handler))
+            }})
+
+
+# ======================
+# LOCAL WRITES
+# ======================
+
+def _first_arg_doc(args, result):
+    return [(args[0]['id'], args[0])]
+
+
+def _id_and_doc(args, result):
+    return [(args[0], args[1])]
+
+
+def _id_only(args, result):
+    return [(args[0], None)]
+
+
+def _id_and_result(args, result):
+    return [(args[0], result)] if result else []
+
+
+def _result_doc(args, result):
+    return [(result['id'], result)] if result else []
+
+
+def _result_docs(args, result):
+    return [(booking['id'], booking) for booking in result[0]]
+
+
+def _result_list(args, result):
+    return [(booking['id'], booking) for booking in result]
+
+
+def _cancelled_legacy_booking(args, result):
+    return [(args[1], None)] if result else []
+
+
+# module -> helper -> (kind, op, extractor(args, result) -> [(doc_id, data)])
+CHANGE_EMITTERS = {
+    'utils.firebase_storage': {
+        'add_user': ('user', 'created', _first_arg_doc),
+        'update_user': ('user', 'updated', _id_and_doc),
+        'add_post': ('post', 'created', _first_arg_doc),
+        'update_post': ('post', 'updated', _id_and_doc),
+        'delete_post': ('post', 'deleted', _id_only),
+        'update_group': ('group', 'updated', _id_and_doc),
+        'delete_group': ('group', 'deleted', _id_only),
+    },
+    'utils.chat_helper': {
+        'create_group': ('group', 'created', _result_doc),
+        'remove_member_from_group': ('group', 'updated', _id_and_result),
+        'book_turf_for_group': ('group', 'updated', _id_and_result),
+    },
+    'utils.turf_helper': {
+        'add_turf': ('turf', 'created', _first_arg_doc),
+        'update_turf': ('turf', 'updated', _first_arg_doc),
+        'delete_turf': ('turf', 'deleted', _id_only),
+        'cancel_turf_booking': ('booking', 'cancelled', _cancelled_legacy_booking),
+    },
+    'utils.booking_helper': {
+        'create_booking': ('booking', 'created', _result_doc),
+        'create_bookings': ('booking', 'created', _result_docs),
+        'cancel_booking': ('booking', 'cancelled', _result_doc),
+        'cancel_bookings': ('booking', 'cancelled', _result_list),
+    },
+}
+
+
+def _emitting(func, kind, op, extract):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        try:
+            changes = extract(args, result)
+        except (IndexError, KeyError, TypeError):
+            # Called with keyword arguments or an unexpected shape: still a change, id unknown
+            logger.warning('events.unparsed_call', extra={'fields': {'helper': func.__name__}})
+            changes = [(None, None)]
+        for doc_id, data in changes:
+            publish(kind, op, doc_id, data)
+        return result
+
+    wrapper._emits_changes = True
+    return wrapper
+
+
+def _backend_namespaces(namespace=None):
+    """(name, globals) of every loaded module of this backend, plus `namespace`"""
+    targets = []
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if path and os.path.abspath(path).startswith(BACKEND_DIR + os.sep):
+            targets.append((name, vars(module)))
+    if namespace is not None:
+        targets.append((namespace.get('__name__', '<namespace>'), namespace))
+    return targets
+
+
+def emit_change_events(namespace=None):
+    """Wrap the writing helpers and rebind them in the loaded backend modules and `namespace`"""
+    for module_name, helpers in CHANGE_EMITTERS.items():
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        for attr, (kind, op, extract) in helpers.items():
+            func = getattr(module, attr, None)
+            if func is None or getattr(func, '_emits_changes', False):
+                continue
+            _wrapped[func] = _emitting(func, kind, op, extract)
+
+    for _, target in _backend_namespaces(namespace):
+        for attr, value in list(target.items()):
+            if inspect.isfunction(value) and value in _wrapped:
+                target[attr] = _wrapped[value]
+
+
+def check_change_events(namespace=None):
+    """Raise RuntimeError if a loaded module still calls a writing helper that publishes nothing"""
+    unwrapped = set()
+    for func in _wrapped:
+        # Also the undecorated helper under instrument_storage_calls()' wrapper
+        while func is not None:
+            unwrapped.add(func)
+            func = getattr(func, '__wrapped__', None)
+
+    stale = sorted(
+        f'{name}.{attr}'
+        for name, target in _backend_namespaces(namespace)
+        for attr, value in list(target.items())
+        if inspect.isfunction(value) and value in unwrapped
+    )
+    if stale:
+        raise RuntimeError(
+            f'Imported after emit_change_events(), these writes publish no change events: {", ".join(stale)}'
+        )
+
+
+# ======================
+# OTHER PROCESSES (FIRESTORE LISTENERS)
+# ======================
+
+_SNAPSHOT_OPS = {'ADDED': 'created', 'MODIFIED': 'updated', 'REMOVED': 'deleted'}
+_watches = {}
+
+
+def _listened_query(kind, db):
+    from utils.firebase_storage import POSTS_COLLECTION, USERS_COLLECTION
+    from utils.booking_helper import TURF_BOOKINGS_COLLECTION, TURFS_COLLECTION
+    try:
+        from utils.firebase_storage import GROUPS_COLLECTION
+    except ImportError:
+        GROUPS_COLLECTION = 'groups'
+
+    if kind == 'booking':
+        # Past bookings never change; skip them in the initial snapshot
+        today = datetime.now().strftime('%Y-%m-%d')
+        return db.collection(TURF_BOOKINGS_COLLECTION).where('date', '>=', today)
+    collection = {
+        'user': USERS_COLLECTION, 'post': POSTS_COLLECTION, 'group': GROUPS_COLLECTION, 'turf': TURFS_COLLECTION
+    }[kind]
+    return db.collection(collection)
+
+
+def _snapshot_handler(kind):
+    primed = []
+
+    def on_snapshot(docs, changes, read_time):
+        # The first snapshot reports every existing document as ADDED
+        if not primed:
+            primed.append(read_time)
+            return
+        for change in changes:
+            op = _SNAPSHOT_OPS.get(change.type.name)
+            if op is None:
+                continue
+            data = None if op == 'deleted' else change.document.to_dict()
+            # Cancelling moves a booking to a new document (booking_helper.cancel_booking)
+            if kind == 'booking' and op != 'deleted' and data and data.get('status') == 'cancelled':
+                op = 'cancelled'
+            publish(kind, op, change.document.id, data, origin='firestore')
+
+    return on_snapshot
+
+
+def start_change_listeners(kinds=None):
+    """Start one on_snapshot watch per kind (once per process); no-op unless CHANGE_FEED_LISTEN=1"""
+    if not CHANGE_FEED_LISTEN and kinds is None:
+        return []
+    from utils.firebase_storage import get_db
+    db = get_db()
+    with _lock:
+        for kind in kinds or CHANGE_FEED_KINDS:
+            if kind in _watches:
+                continue
+            try:
+                _watches[kind] = _listened_query(kind, db).on_snapshot(_snapshot_handler(kind))
+            except Exception:
+                logger.exception('events.listen_failed', extra={'fields': {'kind': kind}})
+        return list(_watches)
+
+
+def stop_change_listeners():
+    with _lock:
+        for watch in _watches.values():
+            watch.unsubscribe()
+        _watches.clear()
@@ -0,0 +1,100 @@
+"""
+Field-level counter increments.
+
+Stats such as stats.games_played or business.total_turfs used to be bumped
+by loading the whole user document, changing one number and writing the
+whole document back: two round trips, a large write, and concurrent updates
+overwriting each other. These helpers send a single Firestore update with
+`Increment` transforms, applied atomically on the server:
+
+    increment_user_stats(user_id, games_played=1, games_organized=1)
+    increment_business_stats(owner_id, total_turfs=-1)    # floored at 0
+
+Passing a batch adds the update to it instead of writing immediately.
+
+Negative deltas must not take a counter below zero (a stats document can
+be older than the games and turfs it counts), so they run as a small
+transaction instead: a counter that is missing or already 0 is left
+alone, which also keeps business.* from appearing on a player's document.
+In a batch every delta stays a plain Increment (used to reverse an amount
+the same code added, e.g. a cancelled booking's revenue).
+"""
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
+
+from utils.firebase_storage import get_db, USERS_COLLECTION
+
+
+def increment_fields(collection, doc_id, deltas, batch=None):
+    """Atomically add each delta to its (dotted) field; returns False if the document does not exist
+
+    With a batch the update is only queued, and a missing document fails the batch commit.
+    """
+    ref = get_db().collection(collection).document(doc_id)
+    update = {field: firestore.Increment(delta) for field, delta in deltas.items() if delta}
+    if not update:
+        return True
+    if batch is not None:
+        batch.update(ref, update)
+        return True
+    try:
+        ref.update(update)
+    except NotFound:
+        return False
+    return True
+
+
+def _field(data, path):
+    for part in path.split('.'):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def decrement_fields(collection, doc_id, amounts):
+    """Subtract each amount from its (dotted) counter in a transaction, stopping at zero
+
+    Counters that are missing, not numbers or already 0 are left alone.
+    Returns False if the document does not exist.
+    """
+    db = get_db()
+    ref = db.collection(collection).document(doc_id)
+
+    @firestore.transactional
+    def apply(transaction):
+        doc = ref.get(transaction=transaction)
+        if not doc.exists:
+            return False
+        data = doc.to_dict()
+        update = {}
+        for field, amount in amounts.items():
+            current = _field(data, field)
+            if isinstance(current, (int, float)) and current > 0:
+                update[field] = max(0, current - amount)
+        if update:
+            transaction.update(ref, update)
+        return True
+
+    return apply(db.transaction())
+
+
+def _update_counters(doc_id, prefix, deltas, batch):
+    if batch is not None:
+        return increment_fields(USERS_COLLECTION, doc_id, {f'{prefix}.{n}': d for n, d in deltas.items()}, batch)
+    increments = {f'{prefix}.{name}': delta for name, delta in deltas.items() if delta > 0}
+    decrements = {f'{prefix}.{name}': -delta for name, delta in deltas.items() if delta < 0}
+    found = increment_fields(USERS_COLLECTION, doc_id, increments, batch)
+    if decrements:
+        found = decrement_fields(USERS_COLLECTION, doc_id, decrements) and found
+    return found
+
+
+def increment_user_stats(user_id, batch=None, **deltas):
+    """increment_user_stats(user_id, games_played=1) -> stats.games_played += 1 (unbatched: never below zero)"""
+    return _update_counters(user_id, 'stats', deltas, batch)
+
+
+def increment_business_stats(owner_id, batch=None, **deltas):
+    """increment_business_stats(owner_id, total_turfs=1) -> business.total_turfs += 1 (unbatched: never below zero)"""
+    return _update_counters(owner_id, 'business', deltas, batch)
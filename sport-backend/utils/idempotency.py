@@ -0,0 +1,148 @@
+"""
+Idempotency-Key support for mutating endpoints.
+
+A client that may retry a request sends a unique `Idempotency-Key` header.
+The first request with a key runs the handler and its response is stored
+for IDEMPOTENCY_TTL seconds (default 24 h); retries with the same key and
+body replay the stored response (marked `Idempotent-Replayed: true`)
+without running the handler again, so a flaky network cannot create a
+second post, booking or message.
+
+    same key, different body        422
+    same key, first still running   409 (retry later)
+    handler failed with 5xx         nothing stored, the retry runs again
+
+Keys are scoped to the endpoint, the resource in the URL (the request
+path, so one key sent to /posts/a/join and /posts/b/join is two requests)
+and the caller (token user, else the acting user id in the body, else IP). Responses live in process memory, or in Redis
+when IDEMPOTENCY_STORAGE_URL is set so every worker sees them.
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+
+from flask import g, jsonify, make_response, request
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+# How long a key stays locked while its first request is running
+IDEMPOTENCY_LOCK_SECONDS = 60
+MAX_KEY_LENGTH = 255
+
+
+class MemoryIdempotencyStore:
+    """Stored responses in this process"""
+
+    def __init__(self):
+        self._entries = {}  # key -> (expires_at, record or None while in flight)
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        if len(self._entries) > 10000:
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+
+    def reserve(self, key):
+        """Existing record, or None after claiming the key; 'in_flight' if another request holds it"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1] or 'in_flight'
+            self._prune(now)
+            self._entries[key] = (now + IDEMPOTENCY_LOCK_SECONDS, None)
+            return None
+
+    def save(self, key, record):
+        with self._lock:
+            self._entries[key] = (time.time() + IDEMPOTENCY_TTL, record)
+
+    def release(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisIdempotencyStore:
+    """Stored responses shared by every worker"""
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def reserve(self, key):
+        name = f'idempotency:{key}'
+        if self._redis.set(name, '', nx=True, ex=IDEMPOTENCY_LOCK_SECONDS):
+            return None
+        value = self._redis.get(name)
+        if value is None:
+            return self.reserve(key)  # expired between the two calls
+        return json.loads(value) if value else 'in_flight'
+
+    def save(self, key, record):
+        self._redis.set(f'idempotency:{key}', json.dumps(record), ex=IDEMPOTENCY_TTL)
+
+    def release(self, key):
+        self._redis.delete(f'idempotency:{key}')
+
+
+_store = None
+
+
+def get_idempotency_store():
+    global _store
+    if _store is None:
+        url = os.environ.get('IDEMPOTENCY_STORAGE_URL')
+        _store = RedisIdempotencyStore(url) if url else MemoryIdempotencyStore()
+    return _store
+
+
+def _caller():
+    auth = g.get('auth')
+    if auth:
+        return auth['uid']
+    body = request.get_json(silent=True) or {}
+    return body.get('user_id') or body.get('from_user_id') or request.remote_addr or 'anonymous'
+
+
+def idempotent(view):
+    """Replay the stored response for a repeated Idempotency-Key instead of running the view"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        client_key = request.headers.get('Idempotency-Key')
+        if not client_key:
+            return view(*args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        store = get_idempotency_store()
+        key = hashlib.sha256(f'{request.endpoint}|{request.path}|{_caller()}|{client_key}'.encode()).hexdigest()
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        record = store.reserve(key)
+        if record == 'in_flight':
+            return jsonify({'error': 'A request with this Idempotency-Key is still being processed'}), 409
+        if record is not None:
+            if record['fingerprint'] != fingerprint:
+                return jsonify({'error': 'Idempotency-Key was already used with a different request body'}), 422
+            response = make_response(record['body'], record['status'])
+            response.headers['Content-Type'] = record['content_type']
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            store.release(key)
+            raise
+        if response.status_code >= 500:
+            store.release(key)
+        else:
+            store.save(key, {
+                'fingerprint': fingerprint,
+                'status': response.status_code,
+                'content_type': response.content_type,
+                'body': response.get_data(as_text=True)
+            })
+        return response
+    return wrapper
@@ -0,0 +1,294 @@
+"""
+Per-request storage call instrumentation and slow-request profiling.
+
+instrument_storage_calls() wraps every public function of the storage
+helper modules with a counter/timer and rebinds the wrapped version wherever
+it was imported (utils.* modules and app.py). Calls made from inside another
+helper are folded into the outermost call, so the numbers describe what a
+handler asked for rather than the helpers' internals.
+
+init_request_instrumentation(app) then reports per request:
+  - a Server-Timing header (`storage` total plus one entry per helper)
+  - one structured log line on the `sportmate.requests` logger
+  - a cProfile dump for sampled requests slower than SLOW_REQUEST_MS
+  - a stack-sample profile for every request slower than SLOW_REQUEST_MS
+
+cProfile slows a request down too much to run on all of them, so it only
+covers the PROFILE_SAMPLE_RATE share. Every other request is watched by a
+background sampler instead: once a request has run for half of
+SLOW_REQUEST_MS, its stack (thread or gevent greenlet) is recorded every
+SLOW_PROFILE_INTERVAL_MS, and if it ends up slow the samples are written to
+PROFILE_DIR as a `.folded` file (one `frame;frame;frame count` line per
+stack, readable by flamegraph.pl or speedscope). Set
+SLOW_PROFILE_INTERVAL_MS=0 to turn the sampler off.
+"""
+import cProfile
+import functools
+import importlib
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, has_app_context, request
+
+from utils.log_helper import get_logger, log_event
+
+STORAGE_MODULES = (
+    'utils.firebase_storage',
+    'utils.chat_helper',
+    'utils.rating_helper',
+    'utils.turf_helper',
+)
+
+# Accessors that never touch the network
+UNINSTRUMENTED_FUNCTIONS = {'get_db'}
+
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+# Fraction of requests run under cProfile; only slow ones are written to disk
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+SLOW_PROFILE_INTERVAL_MS = float(os.environ.get('SLOW_PROFILE_INTERVAL_MS', 10))
+MAX_PROFILE_DEPTH = 64
+
+logger = get_logger('requests')
+
+_local = threading.local()
+_listeners = []
+
+
+def add_storage_call_listener(listener):
+    """Register listener(name, seconds, failed) called after every outermost storage call"""
+    _listeners.append(listener)
+
+
+def _record(name, elapsed, failed):
+    if has_app_context():
+        calls = g.setdefault('storage_calls', {})
+        count, total = calls.get(name, (0, 0.0))
+        calls[name] = (count + 1, total + elapsed)
+    for listener in _listeners:
+        listener(name, elapsed, failed)
+
+
+def _timed(func, name):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, 'depth', 0)
+        if depth:
+            return func(*args, **kwargs)
+
+        _local.depth = 1
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _local.depth = 0
+            _record(name, time.perf_counter() - start, failed)
+
+    wrapper._storage_call = True
+    return wrapper
+
+
+def instrument_storage_calls(namespace=None):
+    """Wrap the storage helpers and rebind them in utils.* modules and `namespace`"""
+    replacements = {}
+    for module_name in STORAGE_MODULES:
+        module = importlib.import_module(module_name)
+        for attr, value in list(vars(module).items()):
+            if (attr.startswith('_') or attr in UNINSTRUMENTED_FUNCTIONS
+                    or not inspect.isfunction(value)
+                    or value.__module__ != module_name
+                    or getattr(value, '_storage_call', False)):
+                continue
+            replacements[value] = _timed(value, attr)
+
+    targets = [
+        vars(module) for name, module in list(sys.modules.items())
+        if module is not None and (name == 'utils' or name.startswith('utils.'))
+    ]
+    if namespace is not None:
+        targets.append(namespace)
+
+    for target in targets:
+        for attr, value in list(target.items()):
+            if inspect.isfunction(value) and value in replacements:
+                target[attr] = replacements[value]
+    return len(replacements)
+
+
+def get_request_storage_calls():
+    """{helper_name: (count, seconds)} for the current request"""
+    return g.get('storage_calls', {})
+
+
+def _server_timing(calls, total_ms):
+    storage_ms = sum(seconds for _, seconds in calls.values()) * 1000.0
+    storage_count = sum(count for count, _ in calls.values())
+    parts = [
+        f'app;dur={total_ms:.1f}',
+        f'storage;dur={storage_ms:.1f};desc="{storage_count} calls"',
+    ]
+    for name, (count, seconds) in sorted(calls.items(), key=lambda item: -item[1][1]):
+        parts.append(f'{name};dur={seconds * 1000.0:.1f};desc="x{count}"')
+    return ', '.join(parts)
+
+
+def _profile_path(total_ms, extension):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = (request.endpoint or 'unknown').replace('/', '_')
+    filename = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{endpoint}_{int(total_ms)}ms.{extension}"
+    return os.path.join(PROFILE_DIR, filename)
+
+
+def _dump_profile(profiler, total_ms):
+    path = _profile_path(total_ms, 'prof')
+    profiler.dump_stats(path)
+    return path
+
+
+# ======================
+# SLOW REQUEST SAMPLER
+# ======================
+
+class _WatchedRequest:
+    __slots__ = ('started', 'thread_id', 'greenlet', 'samples')
+
+    def __init__(self, started):
+        self.started = started
+        self.thread_id = threading.get_ident()
+        self.greenlet = _current_greenlet()
+        self.samples = Counter()
+
+
+def _current_greenlet():
+    """The request's greenlet under gevent (None when requests run on plain threads)"""
+    greenlet = sys.modules.get('greenlet')
+    if greenlet is None:
+        return None
+    current = greenlet.getcurrent()
+    return current if current.parent is not None else None
+
+
+_watched = {}  # id -> _WatchedRequest
+_sampler_started = False
+_sampler_lock = threading.Lock()
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None and len(stack) < MAX_PROFILE_DEPTH:
+        code = frame.f_code
+        stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def _sample_slow_requests():
+    threshold = SLOW_REQUEST_MS / 2000.0
+    while True:
+        time.sleep(SLOW_PROFILE_INTERVAL_MS / 1000.0)
+        now = time.perf_counter()
+        frames = None
+        for watched in list(_watched.values()):
+            if now - watched.started < threshold:
+                continue
+            # A suspended greenlet keeps its frame; a thread's is in _current_frames()
+            frame = watched.greenlet.gr_frame if watched.greenlet is not None else None
+            if frame is None:
+                if frames is None:
+                    frames = sys._current_frames()
+                frame = frames.get(watched.thread_id)
+            if frame is not None:
+                watched.samples[_collapse(frame)] += 1
+
+
+def _start_sampler():
+    global _sampler_started
+    if _sampler_started:
+        return
+    with _sampler_lock:
+        if _sampler_started:
+            return
+        _sampler_started = True
+    threading.Thread(target=_sample_slow_requests, name='slow-request-sampler', daemon=True).start()
+
+
+def _dump_samples(samples, total_ms):
+    path = _profile_path(total_ms, 'folded')
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+    return path
+
+
+def init_request_instrumentation(app):
+    """Register the before/after request hooks on the Flask app"""
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+        g.storage_calls = {}
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.profiler = profiler
+                return
+            except ValueError:
+                # Another profiler is already active in this thread
+                pass
+        if SLOW_PROFILE_INTERVAL_MS > 0:
+            _start_sampler()
+            g.watched = _WatchedRequest(g.request_started)
+            _watched[id(g.watched)] = g.watched
+
+    @app.teardown_request
+    def _stop_watching(exc=None):
+        watched = g.pop('watched', None)
+        if watched is not None:
+            _watched.pop(id(watched), None)
+
+    @app.after_request
+    def _report_request_timing(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        total_ms = (time.perf_counter() - started) * 1000.0
+        calls = g.get('storage_calls', {})
+
+        response.headers['Server-Timing'] = _server_timing(calls, total_ms)
+
+        profile_path = None
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            if total_ms >= SLOW_REQUEST_MS:
+                profile_path = _dump_profile(profiler, total_ms)
+        watched = g.pop('watched', None)
+        if watched is not None:
+            _watched.pop(id(watched), None)
+            if total_ms >= SLOW_REQUEST_MS and watched.samples:
+                profile_path = _dump_samples(watched.samples, total_ms)
+
+        log_event(
+            logger, 'request',
+            method=request.method,
+            path=request.path,
+            endpoint=request.endpoint,
+            status=response.status_code,
+            duration_ms=round(total_ms, 2),
+            storage_calls=sum(count for count, _ in calls.values()),
+            storage_ms=round(sum(seconds for _, seconds in calls.values()) * 1000.0, 2),
+            calls={name: count for name, (count, _) in calls.items()},
+            slow=total_ms >= SLOW_REQUEST_MS,
+            profile=profile_path
+        )
+        return response
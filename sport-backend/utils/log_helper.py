@@ -0,0 +1,129 @@
+"""
+Queue-backed structured logging.
+
+Handlers only push LogRecords onto a bounded in-memory queue; a
+QueueListener thread formats them as JSON lines and writes them to stdout.
+A full queue drops records (and counts them) instead of blocking the worker.
+
+Environment:
+  LOG_LEVEL          default level of the `sportmate` loggers (INFO)
+  LOG_LEVELS         per-logger overrides, e.g. "sportmate.socket=WARNING,sportmate.requests=INFO"
+  LOG_SAMPLE_RATES   fraction of high-volume events kept, e.g. "socket.message=0.01"
+  LOG_QUEUE_SIZE     max records waiting for the writer thread (10000)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+ROOT_LOGGER = 'sportmate'
+
+# Defaults for events fired once per chat action; override with LOG_SAMPLE_RATES
+DEFAULT_SAMPLE_RATES = {
+    'socket.connect': 0.1,
+    'socket.disconnect': 0.1,
+    'socket.join_group': 0.1,
+    'socket.leave_group': 0.1,
+    'socket.message': 0.01,
+}
+
+_sample_rates = dict(DEFAULT_SAMPLE_RATES)
+_listener = None
+_dropped = 0
+
+
+def _parse_pairs(value):
+    pairs = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, val = item.split('=', 1)
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured fields come from log_event()"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking"""
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; only resolve exc_info here
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def configure_logging():
+    """Install the queue handler on the `sportmate` logger tree (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    root.propagate = False
+
+    for name, level in _parse_pairs(os.environ.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    for event, rate in _parse_pairs(os.environ.get('LOG_SAMPLE_RATES')).items():
+        _sample_rates[event] = float(rate)
+
+
+def get_logger(name):
+    """Logger under the `sportmate` tree, e.g. get_logger('socket')"""
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """Log a structured event; disabled levels and sampled-out events cost one check"""
+    if not logger.isEnabledFor(level):
+        return
+    rate = _sample_rates.get(event)
+    if rate is not None and rate < 1.0:
+        if random.random() >= rate:
+            return
+        fields['sample_rate'] = rate
+    logger.log(level, event, extra={'fields': fields})
+
+
+def get_dropped_log_count():
+    """Records dropped because the log queue was full"""
+    return _dropped
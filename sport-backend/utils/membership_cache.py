@@ -0,0 +1,81 @@
+"""
+In-process cache of group membership for the chat hot path.
+
+Holds a hash map of member id -> display name for each group (owner
+included) so chat endpoints and Socket.IO messages can be authorized with an
+O(1) lookup instead of loading the group document and scanning its members.
+Entries are dropped on every group change event (utils.change_events): local
+writes always, writes by other processes when the Firestore listeners run.
+The TTL only bounds staleness of changes no event reported.
+"""
+import os
+import threading
+import time
+
+from utils.change_events import subscribe
+from utils.chat_helper import get_group_by_id
+from utils.metrics import record_cache_lookup
+
+MEMBERSHIP_CACHE_TTL = float(os.environ.get('MEMBERSHIP_CACHE_TTL', 60))
+
+# group_id -> (expires_at, {user_id: user_name})
+_membership = {}
+_lock = threading.Lock()
+
+
+def _load_members(group):
+    members = {m['user_id']: m.get('user_name') for m in group.get('members', [])}
+    members[group['owner_id']] = group.get('owner_name')
+    return members
+
+
+def get_group_membership(group_id):
+    """Return {user_id: user_name} for the owner and members, or None if the group does not exist"""
+    now = time.monotonic()
+    entry = _membership.get(group_id)
+    if entry and entry[0] > now:
+        record_cache_lookup('group_membership', True)
+        return entry[1]
+
+    record_cache_lookup('group_membership', False)
+    group = get_group_by_id(group_id)
+    if not group:
+        return None
+    members = _load_members(group)
+    with _lock:
+        _membership[group_id] = (now + MEMBERSHIP_CACHE_TTL, members)
+    return members
+
+
+def get_group_member_ids(group_id):
+    """Return the cached member ids for a group, or None if the group does not exist"""
+    members = get_group_membership(group_id)
+    return None if members is None else members.keys()
+
+
+def is_group_member(group_id, user_id):
+    """True if user is the owner or a member of the group"""
+    members = get_group_membership(group_id)
+    return members is not None and user_id in members
+
+
+def invalidate_group_membership(group_id):
+    """Drop the cached membership of a group"""
+    with _lock:
+        _membership.pop(group_id, None)
+
+
+def clear_membership_cache():
+    """Drop every cached membership (after bulk maintenance such as merges)"""
+    with _lock:
+        _membership.clear()
+
+
+def _on_group_change(event):
+    if event.doc_id is None:
+        clear_membership_cache()
+    else:
+        invalidate_group_membership(event.doc_id)
+
+
+subscribe('group', _on_group_change)
@@ -0,0 +1,196 @@
+"""
+Write-behind buffer for group chat messages.
+
+Socket.IO messages are broadcast immediately and queued here; a background
+flusher persists them to Firestore in batched writes once MESSAGE_BATCH_SIZE
+messages are waiting, or every MESSAGE_FLUSH_INTERVAL seconds otherwise.
+Each commit carries at most MESSAGE_BATCH_SIZE messages. After a failed
+commit the flusher backs off exponentially (up to MESSAGE_RETRY_MAX_SECONDS)
+before trying again, and while Firestore is unavailable the queue holds at
+most MESSAGE_BUFFER_MAX messages: newer ones are dropped unpersisted (they
+were still broadcast) and counted in sportmate_message_buffer_dropped_total.
+The buffer is drained on interpreter exit and from the gunicorn
+worker_exit hook so a graceful shutdown does not lose messages.
+"""
+import atexit
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from utils.firebase_storage import get_db
+from utils.log_helper import get_logger
+from utils.metrics import record_messages_dropped
+
+try:
+    from utils.firebase_storage import MESSAGES_COLLECTION
+except ImportError:
+    MESSAGES_COLLECTION = 'messages'
+
+MESSAGE_BATCH_SIZE = int(os.environ.get('MESSAGE_BATCH_SIZE', 100))
+MESSAGE_FLUSH_INTERVAL = float(os.environ.get('MESSAGE_FLUSH_INTERVAL', 0.5))
+MESSAGE_RETRY_MAX_SECONDS = float(os.environ.get('MESSAGE_RETRY_MAX_SECONDS', 30))
+MESSAGE_BUFFER_MAX = int(os.environ.get('MESSAGE_BUFFER_MAX', 10000))
+
+# Firestore rejects batches with more than 500 writes
+_FIRESTORE_MAX_BATCH = 500
+
+logger = get_logger('chat')
+
+# Each entry is (enqueued_at, message)
+_pending = deque()
+_condition = threading.Condition()
+_flush_lock = threading.Lock()
+_flusher_started = False
+_failed_attempts = 0  # consecutive failed commits, drives the retry backoff
+
+_stats = {
+    'flushed_messages': 0,
+    'flushed_batches': 0,
+    'failed_flushes': 0,
+    'dropped_messages': 0,
+    'last_flush_lag_seconds': 0.0,
+    'max_flush_lag_seconds': 0.0,
+}
+
+
+def build_group_message(user_id, user_name, message_text, group_id):
+    """Build a group message document with the same fields send_message stores"""
+    message_id = str(uuid.uuid4())
+    return {
+        'id': message_id,
+        'message_id': message_id,
+        'user_id': user_id,
+        'user_name': user_name,
+        'message': message_text,
+        'group_id': group_id,
+        'recipient_id': None,
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def _persist_batch(messages):
+    db = get_db()
+    collection = db.collection(MESSAGES_COLLECTION)
+    for start in range(0, len(messages), _FIRESTORE_MAX_BATCH):
+        batch = db.batch()
+        for message in messages[start:start + _FIRESTORE_MAX_BATCH]:
+            batch.set(collection.document(message['id']), message)
+        batch.commit()
+
+
+def _drop_overflow():
+    """Drop the newest messages beyond MESSAGE_BUFFER_MAX (caller holds _condition)"""
+    dropped = 0
+    while len(_pending) > MESSAGE_BUFFER_MAX:
+        _pending.pop()
+        dropped += 1
+    if dropped:
+        _stats['dropped_messages'] += dropped
+        record_messages_dropped(dropped)
+        logger.warning('chat.messages_dropped', extra={'fields': {'messages': dropped}})
+
+
+def enqueue_message(message):
+    """Queue a message for persistence and wake the flusher if a batch is ready"""
+    _start_flusher()
+    with _condition:
+        _pending.append((time.monotonic(), message))
+        _drop_overflow()
+        if len(_pending) >= MESSAGE_BATCH_SIZE:
+            _condition.notify()
+    return message
+
+
+def get_pending_messages(group_id):
+    """Messages for a group that are broadcast but not yet persisted"""
+    with _condition:
+        return [m for _, m in _pending if m.get('group_id') == group_id]
+
+
+def flush_messages():
+    """Persist what is currently queued in MESSAGE_BATCH_SIZE commits; returns the number written
+
+    Stops at the first failed commit and leaves the rest queued.
+    """
+    global _failed_attempts
+    with _flush_lock:
+        with _condition:
+            remaining = len(_pending)
+        written = 0
+        while remaining > 0:
+            with _condition:
+                entries = [_pending.popleft() for _ in range(min(MESSAGE_BATCH_SIZE, remaining, len(_pending)))]
+            if not entries:
+                break
+            remaining -= len(entries)
+
+            try:
+                _persist_batch([m for _, m in entries])
+            except Exception:
+                # Put the batch back in front so ordering is kept for the retry
+                with _condition:
+                    _pending.extendleft(reversed(entries))
+                    _drop_overflow()
+                _failed_attempts += 1
+                _stats['failed_flushes'] += 1
+                logger.exception('chat.flush_failed', extra={'fields': {
+                    'messages': len(entries), 'attempt': _failed_attempts
+                }})
+                return written
+
+            _failed_attempts = 0
+            lag = time.monotonic() - entries[0][0]
+            _stats['flushed_messages'] += len(entries)
+            _stats['flushed_batches'] += 1
+            _stats['last_flush_lag_seconds'] = round(lag, 4)
+            _stats['max_flush_lag_seconds'] = round(max(_stats['max_flush_lag_seconds'], lag), 4)
+            written += len(entries)
+        return written
+
+
+def _retry_delay():
+    return min(MESSAGE_RETRY_MAX_SECONDS, MESSAGE_FLUSH_INTERVAL * 2 ** _failed_attempts)
+
+
+def _flush_loop():
+    while True:
+        with _condition:
+            if _failed_attempts:
+                # Back off after a failed commit; a full batch does not cut the wait short
+                remaining = _retry_delay()
+                deadline = time.monotonic() + remaining
+                while remaining > 0:
+                    _condition.wait(remaining)
+                    remaining = deadline - time.monotonic()
+            elif len(_pending) < MESSAGE_BATCH_SIZE:
+                _condition.wait(MESSAGE_FLUSH_INTERVAL)
+        flush_messages()
+
+
+def _start_flusher():
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _condition:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    threading.Thread(target=_flush_loop, name='message-flusher', daemon=True).start()
+
+
+def get_buffer_stats():
+    """Queue depth and flush lag (seconds between enqueue and durable write)"""
+    with _condition:
+        pending = len(_pending)
+        oldest_age = time.monotonic() - _pending[0][0] if _pending else 0.0
+    return {
+        'pending_messages': pending,
+        'oldest_pending_age_seconds': round(oldest_age, 4),
+        **_stats
+    }
+
+
+atexit.register(flush_messages)
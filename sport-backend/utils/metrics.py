@@ -0,0 +1,190 @@
+"""
+Prometheus metrics for HTTP routes, Socket.IO, storage calls and caches.
+
+init_metrics(app, socketio) registers the request hooks and the /metrics
+endpoint. Other modules record through the small helpers below so they do
+not need to know about prometheus_client.
+
+With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory so /metrics aggregates all worker processes.
+"""
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest, multiprocess
+)
+
+HTTP_REQUESTS = Counter(
+    'sportmate_http_requests_total',
+    'HTTP requests by route and status code',
+    ['method', 'route', 'status']
+)
+HTTP_LATENCY = Histogram(
+    'sportmate_http_request_duration_seconds',
+    'HTTP request latency by route',
+    ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+SOCKET_CLIENTS = Gauge(
+    'sportmate_socketio_connected_clients',
+    'Socket.IO clients connected to this process',
+    multiprocess_mode='livesum'
+)
+SOCKET_EVENTS = Counter(
+    'sportmate_socketio_events_total',
+    'Socket.IO events received by event name',
+    ['event']
+)
+SOCKET_ROOMS = Gauge(
+    'sportmate_socketio_rooms',
+    'Socket.IO group rooms with at least one client on this process',
+    multiprocess_mode='livesum'
+)
+STORAGE_LATENCY = Histogram(
+    'sportmate_storage_call_duration_seconds',
+    'Latency of storage helper calls',
+    ['call'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+STORAGE_ERRORS = Counter(
+    'sportmate_storage_call_errors_total',
+    'Storage helper calls that raised',
+    ['call']
+)
+CACHE_LOOKUPS = Counter(
+    'sportmate_cache_lookups_total',
+    'Cache lookups by cache and result (hit/miss); hit ratio = hit / (hit + miss)',
+    ['cache', 'result']
+)
+MESSAGE_BUFFER_PENDING = Gauge(
+    'sportmate_message_buffer_pending',
+    'Chat messages broadcast but not yet persisted',
+    multiprocess_mode='livesum'
+)
+MESSAGE_BUFFER_LAG = Gauge(
+    'sportmate_message_buffer_flush_lag_seconds',
+    'Age of the oldest chat message waiting to be persisted',
+    multiprocess_mode='livemax'
+)
+MESSAGE_BUFFER_DROPPED = Counter(
+    'sportmate_message_buffer_dropped_total',
+    'Chat messages dropped unpersisted because the write-behind queue was full'
+)
+LOG_RECORDS_DROPPED = Gauge(
+    'sportmate_log_records_dropped',
+    'Log records dropped because the log queue was full',
+    multiprocess_mode='livesum'
+)
+
+REQUESTS_REJECTED = Counter(
+    'sportmate_http_requests_rejected_total',
+    'Requests refused before reaching a handler (rate_limited / shed) by route class',
+    ['reason', 'route_class']
+)
+HTTP_INFLIGHT = Gauge(
+    'sportmate_http_requests_inflight',
+    'HTTP requests being handled by this process',
+    multiprocess_mode='livesum'
+)
+CHANGE_EVENTS = Counter(
+    'sportmate_change_events_total',
+    'Change events delivered to subscribers by kind, operation and origin (local / firestore)',
+    ['kind', 'op', 'origin']
+)
+
+CASCADE_JOBS = Counter(
+    'sportmate_cascade_jobs_total',
+    'Cascade delete job runs by outcome (done / failed / abandoned)',
+    ['outcome']
+)
+
+
+def record_request_rejected(reason, route_class):
+    REQUESTS_REJECTED.labels(reason, route_class).inc()
+
+
+def record_inflight(count):
+    HTTP_INFLIGHT.set(count)
+
+
+def record_change_event(kind, op, origin):
+    CHANGE_EVENTS.labels(kind, op, origin).inc()
+
+
+def record_cascade_job(outcome):
+    CASCADE_JOBS.labels(outcome).inc()
+
+
+def record_messages_dropped(count):
+    MESSAGE_BUFFER_DROPPED.inc(count)
+
+
+def record_socket_connected():
+    SOCKET_CLIENTS.inc()
+
+
+def record_socket_disconnected():
+    SOCKET_CLIENTS.dec()
+
+
+def record_socket_event(event):
+    SOCKET_EVENTS.labels(event).inc()
+
+
+def record_storage_call(name, seconds, failed):
+    STORAGE_LATENCY.labels(name).observe(seconds)
+    if failed:
+        STORAGE_ERRORS.labels(name).inc()
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def _count_group_rooms(socketio):
+    rooms = socketio.server.manager.rooms.get('/', {})
+    # Every client also sits in a private room named after its sid
+    client_sids = rooms.get(None, {})
+    return sum(1 for room in rooms if room is not None and room not in client_sids)
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def init_metrics(app, socketio):
+    """Register HTTP hooks, the /metrics endpoint and scrape-time gauges"""
+
+    @app.before_request
+    def _start_metrics_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_http_metrics(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+        HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus scrape endpoint"""
+        from utils.log_helper import get_dropped_log_count
+        from utils.message_buffer import get_buffer_stats
+        LOG_RECORDS_DROPPED.set(get_dropped_log_count())
+        buffer_stats = get_buffer_stats()
+        MESSAGE_BUFFER_PENDING.set(buffer_stats['pending_messages'])
+        MESSAGE_BUFFER_LAG.set(buffer_stats['oldest_pending_age_seconds'])
+        SOCKET_ROOMS.set(_count_group_rooms(socketio))
+
+        return Response(generate_latest(_registry()), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,135 @@
+"""
+Compact models for posts held in process memory.
+
+Storage and the JSON API keep using plain dicts; these classes are for the
+long-lived copies inside caches and indexes (the recommendation index), and
+Location also validates coordinates at the API edge.
+They use __slots__ instead of a per-instance __dict__, so a cached post takes
+a fraction of the memory of the nested dicts it came from and attribute
+access skips a hash lookup. (dataclass(slots=True) needs Python 3.10; the
+backend supports 3.8+.)
+
+from_dict() validates and converts once at the edge and raises ValueError
+on malformed input; to_dict() gives back the dict it was built from: keys
+the model does not know about are kept in `extra`, and optional keys that
+were missing stay missing rather than coming back with a default.
+"""
+
+
+def _require(data, *fields):
+    missing = [field for field in fields if field not in data]
+    if missing:
+        raise ValueError(f'Missing required field: {missing[0]}')
+
+
+class Location:
+    __slots__ = ('lat', 'lng', 'address')
+
+    def __init__(self, lat, lng, address=''):
+        self.lat = lat
+        self.lng = lng
+        self.address = address
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise ValueError('Location must be an object with lat and lng')
+        _require(data, 'lat', 'lng')
+        try:
+            lat, lng = float(data['lat']), float(data['lng'])
+        except (TypeError, ValueError):
+            raise ValueError('lat and lng must be numbers')
+        if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+            raise ValueError('lat/lng out of range')
+        return cls(lat, lng, data.get('address', ''))
+
+    def to_dict(self):
+        return {'lat': self.lat, 'lng': self.lng, 'address': self.address}
+
+
+class Participant:
+    """A player in one of a post's lists; `since` is accepted_at / requested_at / joined_at (None if absent)"""
+    __slots__ = ('user_id', 'user_name', 'since', 'extra')
+
+    def __init__(self, user_id, user_name='', since=None, extra=None):
+        self.user_id = user_id
+        self.user_name = user_name
+        self.since = since
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data, since_key):
+        _require(data, 'user_id')
+        extra = {k: v for k, v in data.items() if k not in ('user_id', 'user_name', since_key)} or None
+        return cls(data['user_id'], data.get('user_name'), data.get(since_key), extra)
+
+    def to_dict(self, since_key):
+        data = dict(self.extra) if self.extra else {}
+        data['user_id'] = self.user_id
+        if self.user_name is not None:
+            data['user_name'] = self.user_name
+        if self.since is not None:
+            data[since_key] = self.since
+        return data
+
+
+class Post:
+    __slots__ = (
+        'id', 'user_id', 'user_name', 'sport', 'players_needed', 'location',
+        'accepted_players', 'pending_requests', 'waitlist', 'description',
+        'date', 'time', 'status', 'group_id', 'created_at', 'extra', 'absent'
+    )
+
+    # list field -> timestamp key of its entries
+    _PLAYER_LISTS = (
+        ('accepted_players', 'accepted_at'),
+        ('pending_requests', 'requested_at'),
+        ('waitlist', 'joined_at'),
+    )
+    _SCALARS = ('id', 'user_id', 'user_name', 'sport', 'players_needed',
+                'description', 'date', 'time', 'status', 'group_id', 'created_at')
+    _OPTIONAL = ('user_name', 'description', 'date', 'time', 'status', 'group_id', 'created_at',
+                 'accepted_players', 'pending_requests', 'waitlist')
+
+    @classmethod
+    def from_dict(cls, data):
+        _require(data, 'id', 'user_id', 'sport', 'players_needed', 'location')
+        post = cls.__new__(cls)
+        post.id = data['id']
+        post.user_id = data['user_id']
+        post.user_name = data.get('user_name', '')
+        post.sport = data['sport']
+        try:
+            post.players_needed = int(data['players_needed'])
+        except (TypeError, ValueError):
+            raise ValueError('players_needed must be a number')
+        if post.players_needed < 1:
+            raise ValueError('players_needed must be at least 1')
+        post.location = Location.from_dict(data['location'])
+        for field, since_key in cls._PLAYER_LISTS:
+            setattr(post, field, tuple(Participant.from_dict(p, since_key) for p in data.get(field, [])))
+        post.description = data.get('description', '')
+        post.date = data.get('date', '')
+        post.time = data.get('time', '')
+        post.status = data.get('status', 'open')
+        post.group_id = data.get('group_id') or f"group_{data['id']}"
+        post.created_at = data.get('created_at', '')
+        known = set(cls.__slots__) - {'extra', 'absent'}
+        post.extra = {k: v for k, v in data.items() if k not in known} or None
+        post.absent = frozenset(field for field in cls._OPTIONAL if field not in data) or None
+        return post
+
+    def has_player(self, user_id):
+        return any(p.user_id == user_id for p in self.accepted_players)
+
+    def to_dict(self):
+        absent = self.absent or ()
+        data = dict(self.extra) if self.extra else {}
+        for field in self._SCALARS:
+            if field not in absent:
+                data[field] = getattr(self, field)
+        data['location'] = self.location.to_dict()
+        for field, since_key in self._PLAYER_LISTS:
+            if field not in absent:
+                data[field] = [p.to_dict(since_key) for p in getattr(self, field)]
+        return data
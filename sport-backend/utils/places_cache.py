@@ -0,0 +1,261 @@
+"""
+Geo-tile cache in front of external turf discovery (find_nearby_turfs).
+
+Lookups are keyed by a quantized tile (PLACES_TILE_DEGREES, ~1 km) and the
+smallest radius bucket covering the requested radius. A miss asks the places
+provider once for the tile centre at the bucket radius (plus the tile's half
+diagonal) and every later lookup in that neighbourhood is served locally,
+filtered down to the caller's exact point and radius.
+
+    memory   LRU of PLACES_CACHE_MAX_ENTRIES tiles, PLACES_CACHE_TTL seconds
+    disk     sqlite file shared by all workers, only when PLACES_CACHE_PATH
+             is set (relative paths are taken from the backend directory)
+
+Concurrent misses for the same tile wait for one provider call instead of
+each hitting the API. If the provider fails, an expired entry is served
+rather than an error. Under gevent the sqlite calls run on the hub's thread
+pool so a slow disk does not stall the worker.
+
+The provider returns at most PLACES_RESULT_CAP results (Google Places: 20
+per page), ranked by prominence rather than distance. A tile that comes
+back with that many is saturated: the widened query may have pushed out
+places close to the caller. For those tiles the lookup goes to a finer grid
+(PLACES_FINE_TILE_DEGREES, ~200 m) with the same radius bucket, whose query
+is widened by much less, and nearby callers still share its cached result.
+
+The provider is injectable, so the cache can be exercised with a fake and
+no network:
+
+    cache = PlacesCache(lambda lat, lng, radius_km: [...], path=None)
+"""
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+from utils.metrics import record_cache_lookup
+
+PLACES_CACHE_TTL = float(os.environ.get('PLACES_CACHE_TTL', 24 * 3600))
+PLACES_CACHE_MAX_ENTRIES = int(os.environ.get('PLACES_CACHE_MAX_ENTRIES', 2048))
+PLACES_CACHE_PATH = os.environ.get('PLACES_CACHE_PATH', '')
+PLACES_TILE_DEGREES = float(os.environ.get('PLACES_TILE_DEGREES', 0.01))
+PLACES_RESULT_CAP = int(os.environ.get('PLACES_RESULT_CAP', 20))
+PLACES_FINE_TILE_DEGREES = float(os.environ.get('PLACES_FINE_TILE_DEGREES', 0.002))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RADIUS_BUCKETS_KM = (1, 2, 5, 10, 25, 50)
+EARTH_RADIUS_KM = 6371.0
+
+
+def _distance_km(lat1, lng1, lat2, lng2):
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+    a = (math.sin(d_lat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _coords(place):
+    """(lat, lng) of a provider result, or None if it carries no position"""
+    location = place.get('location') if isinstance(place.get('location'), dict) else place
+    try:
+        return float(location['lat']), float(location['lng'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _off_loop(func, *args):
+    """Run blocking file I/O on gevent's thread pool when the process is monkey-patched"""
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('socket'):
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
+class _SqliteStore:
+    """Tiles persisted as JSON rows so restarts and other workers start warm
+
+    Each call opens its own connection, so calls can run on any thread of
+    the pool; sqlite's file locking serialises the writers.
+    """
+
+    def __init__(self, path):
+        self._path = os.path.join(BACKEND_DIR, path)  # absolute paths are kept as they are
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _off_loop(self._execute, 'CREATE TABLE IF NOT EXISTS places '
+                  '(key TEXT PRIMARY KEY, fetched_at REAL NOT NULL, payload TEXT NOT NULL)')
+
+    def _execute(self, *statements):
+        """Run (sql, params) statements in one transaction; returns the last one's first row"""
+        with closing(sqlite3.connect(self._path, timeout=5)) as conn, conn:
+            row = None
+            for statement in statements:
+                sql, params = statement if isinstance(statement, tuple) else (statement, ())
+                row = conn.execute(sql, params).fetchone()
+            return row
+
+    def get(self, key):
+        row = _off_loop(self._execute, ('SELECT fetched_at, payload FROM places WHERE key = ?', (key,)))
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put(self, key, fetched_at, places, max_entries):
+        _off_loop(
+            self._execute,
+            ('INSERT OR REPLACE INTO places (key, fetched_at, payload) VALUES (?, ?, ?)',
+             (key, fetched_at, json.dumps(places))),
+            ('DELETE FROM places WHERE key NOT IN '
+             '(SELECT key FROM places ORDER BY fetched_at DESC LIMIT ?)', (max_entries,))
+        )
+
+
+class PlacesCache:
+    """TTL + LRU tile cache with request coalescing and optional sqlite persistence"""
+
+    def __init__(self, provider, path=PLACES_CACHE_PATH, ttl=PLACES_CACHE_TTL,
+                 max_entries=PLACES_CACHE_MAX_ENTRIES, tile_degrees=PLACES_TILE_DEGREES,
+                 result_cap=PLACES_RESULT_CAP, fine_tile_degrees=PLACES_FINE_TILE_DEGREES,
+                 clock=time.time):
+        self._provider = provider
+        self._result_cap = result_cap
+        self._fine_tile_degrees = fine_tile_degrees
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._tile_degrees = tile_degrees
+        self._clock = clock
+        self._store = _SqliteStore(path) if path else None
+        self._entries = OrderedDict()  # key -> (fetched_at, places)
+        self._inflight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+
+    def _key(self, lat, lng, radius_km, degrees):
+        row = math.floor(lat / degrees)
+        col = math.floor(lng / degrees)
+        bucket = next((b for b in RADIUS_BUCKETS_KM if b >= radius_km), math.ceil(radius_km))
+        return f'{row}:{col}:{bucket}', row, col, bucket
+
+    def _remember(self, key, fetched_at, places):
+        with self._lock:
+            self._entries[key] = (fetched_at, places)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key):
+        """Cached (fetched_at, places) for a tile from memory, then disk"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+                return entry
+        if self._store:
+            entry = self._store.get(key)
+            if entry:
+                self._remember(key, *entry)
+                return entry
+        return None
+
+    @staticmethod
+    def _tile_query(row, col, bucket, degrees):
+        """Provider arguments covering every point of a tile within `bucket` km"""
+        centre_lat = (row + 0.5) * degrees
+        centre_lng = (col + 0.5) * degrees
+        half_diagonal_km = _distance_km(centre_lat, centre_lng, row * degrees, col * degrees)
+        return centre_lat, centre_lng, bucket + half_diagonal_km
+
+    def _fetch(self, key, query, stale):
+        try:
+            places = list(self._provider(*query) or [])
+        except Exception:
+            if stale:
+                return stale[1]
+            raise
+        fetched_at = self._clock()
+        self._remember(key, fetched_at, places)
+        if self._store:
+            self._store.put(key, fetched_at, places, self._max_entries * 4)
+        return places
+
+    def _cached(self, key, query):
+        """Places for a cache key, asking the provider with `query` on a miss"""
+        entry = self._lookup(key)
+        if entry and self._clock() - entry[0] < self._ttl:
+            record_cache_lookup('places', True)
+            return entry[1]
+        record_cache_lookup('places', False)
+
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            event.wait()
+            entry = self._lookup(key)
+            if entry:
+                return entry[1]
+            # The leader's provider call failed; try on our own
+            return self._fetch(key, query, None)
+
+        try:
+            return self._fetch(key, query, entry)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def get(self, lat, lng, radius_km):
+        """Places within radius_km of (lat, lng), sorted by distance when positions are known"""
+        lat, lng, radius_km = float(lat), float(lng), float(radius_km)
+        key, row, col, bucket = self._key(lat, lng, radius_km, self._tile_degrees)
+        places = self._cached(key, self._tile_query(row, col, bucket, self._tile_degrees))
+        if self._result_cap and len(places) >= self._result_cap:
+            # Saturated tile: nearer places may have been cut; use the finer grid
+            key, row, col, bucket = self._key(lat, lng, radius_km, self._fine_tile_degrees)
+            places = self._cached(
+                f'fine:{key}', self._tile_query(row, col, bucket, self._fine_tile_degrees)
+            )
+
+        nearby = []
+        for place in places:
+            coords = _coords(place)
+            if coords is None:
+                nearby.append(place)
+                continue
+            distance = _distance_km(lat, lng, *coords)
+            if distance <= radius_km:
+                nearby.append({**place, 'distance_km': round(distance, 2)})
+        nearby.sort(key=lambda place: place.get('distance_km', float('inf')))
+        return nearby
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_places_cache():
+    """Process-wide cache in front of utils.location_helper.find_nearby_turfs"""
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                from utils.location_helper import find_nearby_turfs
+                _default_cache = PlacesCache(find_nearby_turfs)
+    return _default_cache
+
+
+def find_nearby_turfs_cached(lat, lng, radius_km):
+    """Drop-in replacement for find_nearby_turfs served from the tile cache"""
+    return get_places_cache().get(lat, lng, radius_km)
@@ -0,0 +1,181 @@
+"""
+Dynamic slot pricing for turfs.
+
+A turf's `pricing` block may carry rules on top of the flat rate:
+
+    "pricing": {
+        "per_hour": 800,
+        "currency": "INR",
+        "peak_hours": [{"start": "18:00", "end": "22:00", "multiplier": 1.25}],
+        "weekend_multiplier": 1.2,
+        "surge": [{"occupancy": 0.5, "multiplier": 1.1},
+                  {"occupancy": 0.8, "multiplier": 1.25}]
+    }
+
+The rules are compiled once into a PricingPlan holding 24 hourly rates for
+weekdays and 24 for weekends. For a given day only the surge multiplier
+(from that day's occupancy) changes, so the final hourly table is cached per
+(pricing rules, weekend, surge tier) and a slot price is a couple of list
+lookups.
+"""
+import json
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from utils.booking_helper import (
+    slot_range, hourly_slots, available_slots, get_turf_bookings_by_date
+)
+
+# Longest range the availability endpoint prices in one request
+MAX_AVAILABILITY_DAYS = 14
+
+
+class PricingPlan:
+    """Compiled pricing rules of one turf"""
+    __slots__ = ('currency', 'weekday_rates', 'weekend_rates', 'surge_tiers')
+
+    def __init__(self, currency, weekday_rates, weekend_rates, surge_tiers):
+        self.currency = currency
+        self.weekday_rates = weekday_rates
+        self.weekend_rates = weekend_rates
+        self.surge_tiers = surge_tiers
+
+    def surge_multiplier(self, occupancy):
+        """Multiplier of the highest surge tier the occupancy reaches"""
+        multiplier = 1.0
+        for threshold, tier_multiplier in self.surge_tiers:
+            if occupancy >= threshold:
+                multiplier = tier_multiplier
+        return multiplier
+
+
+def _hour(value):
+    hours, minutes = (int(part) for part in value.split(':'))
+    if not 0 <= hours <= 24 or not 0 <= minutes < 60:
+        raise ValueError(f'Invalid time: {value}')
+    return hours
+
+
+def validate_pricing(pricing):
+    """Raise ValueError if the pricing rules are malformed
+
+    The block replaces a turf's pricing as a whole, so per_hour is required.
+    """
+    if not isinstance(pricing, dict):
+        raise ValueError('pricing must be an object')
+    if 'per_hour' not in pricing:
+        raise ValueError('per_hour is required')
+    if float(pricing['per_hour']) < 0:
+        raise ValueError('per_hour must not be negative')
+    for window in pricing.get('peak_hours', []):
+        if _hour(window['start']) >= (_hour(window['end']) or 24):
+            raise ValueError('peak_hours start must be before end')
+        if float(window.get('multiplier', 1)) <= 0:
+            raise ValueError('peak_hours multiplier must be positive')
+    if float(pricing.get('weekend_multiplier', 1)) <= 0:
+        raise ValueError('weekend_multiplier must be positive')
+    for tier in pricing.get('surge', []):
+        if not 0 <= float(tier['occupancy']) <= 1:
+            raise ValueError('surge occupancy must be between 0 and 1')
+        if float(tier['multiplier']) <= 0:
+            raise ValueError('surge multiplier must be positive')
+
+
+@lru_cache(maxsize=1024)
+def _compile(fingerprint):
+    pricing = json.loads(fingerprint)
+    base = float(pricing.get('per_hour', 0))
+
+    hourly = [base] * 24
+    for window in pricing.get('peak_hours', []):
+        multiplier = float(window.get('multiplier', 1))
+        for hour in range(_hour(window['start']), _hour(window['end']) or 24):
+            hourly[hour] = base * multiplier
+
+    weekend_multiplier = float(pricing.get('weekend_multiplier', 1))
+    surge_tiers = tuple(sorted(
+        (float(tier['occupancy']), float(tier['multiplier'])) for tier in pricing.get('surge', [])
+    ))
+    return PricingPlan(
+        pricing.get('currency', 'INR'),
+        tuple(hourly),
+        tuple(rate * weekend_multiplier for rate in hourly),
+        surge_tiers
+    )
+
+
+def _fingerprint(turf):
+    return json.dumps(turf.get('pricing', {}), sort_keys=True)
+
+
+def get_pricing_plan(turf):
+    """Compiled (and cached) pricing plan of a turf"""
+    return _compile(_fingerprint(turf))
+
+
+@lru_cache(maxsize=4096)
+def _day_rates(fingerprint, weekend, surge):
+    plan = _compile(fingerprint)
+    rates = plan.weekend_rates if weekend else plan.weekday_rates
+    return tuple(round(rate * surge, 2) for rate in rates)
+
+
+def _booked_hours(booked):
+    total = 0.0
+    for booking in booked:
+        span = slot_range(booking['time_slot'])
+        if span:
+            total += (span[1] - span[0]) / 60.0
+    return total
+
+
+def get_day_rates(turf, date, booked=()):
+    """24 hourly rates for a turf on a date, given that day's bookings (drives surge)"""
+    fingerprint = _fingerprint(turf)
+    plan = _compile(fingerprint)
+    weekend = datetime.strptime(date, '%Y-%m-%d').weekday() >= 5
+    surge = 1.0
+    if plan.surge_tiers:
+        open_hours = len(hourly_slots(turf)) or 24
+        surge = plan.surge_multiplier(_booked_hours(booked) / open_hours)
+    return _day_rates(fingerprint, weekend, surge)
+
+
+def price_slot(rates, time_slot):
+    """Price of a time slot from a day's hourly rates (partial hours pro-rated)"""
+    span = slot_range(time_slot)
+    if not span:
+        return None
+    start, end = span
+    total = 0.0
+    minute = start
+    while minute < end:
+        hour_end = min(end, (minute // 60 + 1) * 60)
+        total += rates[(minute // 60) % 24] * (hour_end - minute) / 60.0
+        minute = hour_end
+    return round(total, 2)
+
+
+def quote_slot(turf, date, time_slot, booked=()):
+    """Price of booking time_slot on date, given the bookings already on that day"""
+    return price_slot(get_day_rates(turf, date, booked), time_slot)
+
+
+def get_priced_availability(turf, start_date, days=1):
+    """[{'date', 'slots': [{'time', 'available', 'price'}]}] for `days` days from start_date"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    bookings_by_date = get_turf_bookings_by_date(turf, dates[0], dates[-1])
+
+    result = []
+    for date in dates:
+        booked = bookings_by_date.get(date, [])
+        rates = get_day_rates(turf, date, booked)
+        result.append({
+            'date': date,
+            'slots': [
+                {'time': slot, 'available': available, 'price': price_slot(rates, slot)}
+                for slot, available in available_slots(turf, booked)
+            ]
+        })
+    return result
@@ -0,0 +1,232 @@
+"""
+Per-client rate limiting and adaptive load shedding.
+
+Every route belongs to a class (default, heavy, auth) set with the
+@route_class decorator. Each (client, class) pair gets a token bucket:
+
+    RATE_LIMITS="default=20:60,heavy=2:10,auth=1:5"     rate/second : burst
+
+Clients are identified by the user id of a valid bearer token, else by IP
+(the X-Forwarded-For client with RATE_LIMIT_TRUST_PROXY=1). Buckets live in
+process memory, or in Redis when RATE_LIMIT_STORAGE_URL is set so all
+workers share them. Over the limit the request gets a 429 with Retry-After.
+
+Load shedding looks at the process's in-flight request count and, when the
+proxy sets X-Request-Start, how long requests queued before reaching us.
+Heavy routes are refused with 503 once pressure reaches SHED_HEAVY_AT
+(default half of capacity) so cheap routes keep their share; everything
+else is refused only at full capacity:
+
+    SHED_MAX_INFLIGHT   concurrent requests per process (default 500)
+    SHED_QUEUE_MS       queue latency (EWMA) that counts as full (default 500)
+"""
+import os
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from utils.auth_helper import AuthError, verify_access_token
+from utils.log_helper import get_logger
+from utils.metrics import record_inflight, record_request_rejected
+
+DEFAULT_RATE_LIMITS = 'default=20:60,heavy=2:10,auth=1:5'
+SHED_MAX_INFLIGHT = int(os.environ.get('SHED_MAX_INFLIGHT', 500))
+SHED_QUEUE_MS = float(os.environ.get('SHED_QUEUE_MS', 500))
+SHED_HEAVY_AT = float(os.environ.get('SHED_HEAVY_AT', 0.5))
+RATE_LIMIT_TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY', '0') == '1'
+
+logger = get_logger('ratelimit')
+
+
+def parse_rate_limits(spec):
+    """'heavy=2:10,...' -> {'heavy': (2.0, 10.0), ...}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        limits[name.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+RATE_LIMITS = {
+    **parse_rate_limits(DEFAULT_RATE_LIMITS),
+    **parse_rate_limits(os.environ.get('RATE_LIMITS', ''))
+}
+
+
+def route_class(name):
+    """Put a view in a rate-limit / shedding class ('heavy', 'auth'); unmarked views are 'default'"""
+    def decorator(view):
+        view.route_class = name
+        return view
+    return decorator
+
+
+class MemoryBucketStore:
+    """Token buckets in this process"""
+
+    # Buckets untouched this long are full again and can be forgotten
+    IDLE_SECONDS = 600
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self._next_prune = time.monotonic() + self.IDLE_SECONDS
+
+    def take(self, key, rate, burst, now=None):
+        """(allowed, seconds until a token is available)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if now >= self._next_prune:
+                self._prune(now)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now):
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < self.IDLE_SECONDS
+        }
+        self._next_prune = now + self.IDLE_SECONDS
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker through Redis (one atomic script call per request)"""
+
+    _SCRIPT = """
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens, ts = tonumber(bucket[1]) or burst, tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(self._SCRIPT)
+
+    def take(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        allowed, tokens = self._take(keys=[f'ratelimit:{key}'], args=[rate, burst, now])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / rate
+
+
+def make_bucket_store():
+    url = os.environ.get('RATE_LIMIT_STORAGE_URL')
+    return RedisBucketStore(url) if url else MemoryBucketStore()
+
+
+class LoadShedder:
+    """Tracks in-flight requests and queue latency; decides whether to admit a request"""
+
+    def __init__(self, max_inflight=SHED_MAX_INFLIGHT, queue_ms=SHED_QUEUE_MS, heavy_at=SHED_HEAVY_AT):
+        self.max_inflight = max_inflight
+        self.queue_ms = queue_ms
+        self.heavy_at = heavy_at
+        self.inflight = 0
+        self.queue_ewma_ms = 0.0
+        self._lock = threading.Lock()
+
+    def pressure(self):
+        return max(self.inflight / self.max_inflight, self.queue_ewma_ms / self.queue_ms)
+
+    def admit(self, route, queue_ms=None):
+        """Count the request in if there is room for its class; returns False to shed it"""
+        with self._lock:
+            if queue_ms is not None:
+                self.queue_ewma_ms = 0.8 * self.queue_ewma_ms + 0.2 * max(queue_ms, 0.0)
+            limit = self.heavy_at if route == 'heavy' else 1.0
+            if self.pressure() >= limit:
+                return False
+            self.inflight += 1
+            inflight = self.inflight
+        record_inflight(inflight)
+        return True
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+            inflight = self.inflight
+        record_inflight(inflight)
+
+
+def _queue_ms():
+    """Milliseconds since the proxy received the request (X-Request-Start: t=<seconds>), if known"""
+    header = request.headers.get('X-Request-Start')
+    if not header:
+        return None
+    try:
+        started = float(header.split('=', 1)[-1])
+    except ValueError:
+        return None
+    if started > 1e12:  # microseconds
+        started /= 1e6
+    elif started > 1e10:  # milliseconds
+        started /= 1e3
+    return (time.time() - started) * 1000
+
+
+def _client_key():
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        try:
+            return 'user:' + verify_access_token(header[7:].strip())['uid']
+        except AuthError:
+            pass
+    if RATE_LIMIT_TRUST_PROXY and request.access_route:
+        return 'ip:' + request.access_route[0]
+    return 'ip:' + (request.remote_addr or 'unknown')
+
+
+def init_rate_limiting(app, store=None, shedder=None):
+    """Register the rate-limit / load-shedding hooks; store and shedder are injectable"""
+    store = store or make_bucket_store()
+    shedder = shedder or LoadShedder()
+
+    @app.before_request
+    def _limit_request():
+        view = app.view_functions.get(request.endpoint)
+        if view is None or request.endpoint == 'metrics':
+            return None
+        route = getattr(view, 'route_class', 'default')
+
+        if not shedder.admit(route, _queue_ms()):
+            record_request_rejected('shed', route)
+            response = jsonify({'error': 'Server is busy, please retry shortly'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        g.rate_limit_admitted = True
+
+        rate, burst = RATE_LIMITS.get(route, RATE_LIMITS['default'])
+        try:
+            allowed, retry_after = store.take(f'{route}:{_client_key()}', rate, burst)
+        except Exception:
+            # A shared store outage must not take the API down with it
+            logger.exception('ratelimit.store_failed')
+            return None
+        if not allowed:
+            record_request_rejected('rate_limited', route)
+            response = jsonify({'error': 'Too many requests, please slow down'})
+            response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+            return response, 429
+        return None
+
+    @app.teardown_request
+    def _release_request(exc):
+        if g.pop('rate_limit_admitted', False):
+            shedder.release()
@@ -0,0 +1,372 @@
+"""
+Player-to-game recommendations.
+
+Open posts are kept in an in-memory geo index: one numpy array per feature
+(position, sport, start time, organizer skill and rating), plus a grid of
+GEO_CELL_DEGREES cells mapping to row numbers. A request only scores the
+rows in the cells around the player, and does it with array operations
+rather than a Python loop per post.
+
+Score = weighted sum of
+    distance       1 at the player's position, 0 at the search radius
+    sport          share of the player's past games in that sport
+    skill          closeness of player and organizer skill_level
+    rating         organizer stats.average_rating / 5
+    time           games starting soon rank above ones weeks out
+
+The index follows post change events (utils.change_events): created and
+updated posts are upserted in place, deleted or closed ones leave the grid.
+It is still rebuilt from storage every RECOMMENDATION_INDEX_TTL seconds to
+refresh organizer skill/rating and catch changes no event reported. The
+rebuild runs outside the lock, reads the organizers in one batched call,
+replays the post changes made meanwhile and is then swapped in; requests
+keep using the previous index until it is ready. Organizers a post event
+introduces get neutral skill/rating until the next rebuild, so the write
+path never reads storage. Results are cached per user and dropped when a
+post changes in any cell their search covered.
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from utils.change_events import subscribe
+from utils.firebase_storage import get_db, read_json, POSTS_COLLECTION, USERS_COLLECTION
+from utils.models import Post
+
+GEO_CELL_DEGREES = 0.1  # ~11 km of latitude
+EARTH_RADIUS_KM = 6371.0
+
+RECOMMENDATION_INDEX_TTL = float(os.environ.get('RECOMMENDATION_INDEX_TTL', 60))
+RECOMMENDATION_CACHE_TTL = float(os.environ.get('RECOMMENDATION_CACHE_TTL', 300))
+
+SKILL_LEVELS = {'beginner': 0, 'intermediate': 1, 'advanced': 2, 'professional': 3}
+WEIGHTS = {'distance': 0.35, 'sport': 0.25, 'skill': 0.15, 'rating': 0.1, 'time': 0.15}
+
+# Games this many hours out score half of one starting now
+TIME_HALF_LIFE_HOURS = 48.0
+
+_lock = threading.RLock()
+_build_lock = threading.Lock()
+_index = None
+_pending_changes = None  # (post id, Post or None) seen while a rebuild runs
+_user_results = {}  # user_id -> (expires_at, cells, params, recommendations)
+
+
+def _cell(lat, lng):
+    return int(math.floor(lat / GEO_CELL_DEGREES)), int(math.floor(lng / GEO_CELL_DEGREES))
+
+
+def _cells_within(lat, lng, radius_km):
+    lat_span = int(math.ceil(radius_km / 111.0 / GEO_CELL_DEGREES))
+    lng_km = 111.0 * max(math.cos(math.radians(lat)), 0.01)
+    lng_span = int(math.ceil(radius_km / lng_km / GEO_CELL_DEGREES))
+    row, col = _cell(lat, lng)
+    return {
+        (row + d_row, col + d_col)
+        for d_row in range(-lat_span, lat_span + 1)
+        for d_col in range(-lng_span, lng_span + 1)
+    }
+
+
+def _start_timestamp(post):
+    """Epoch seconds of the game's start (end of day if only the date is set), or NaN"""
+    date = post.date or ''
+    try:
+        return datetime.strptime(f"{date} {post.time or ''}".strip(), '%Y-%m-%d %H:%M').timestamp()
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(f'{date} 23:59', '%Y-%m-%d %H:%M').timestamp()
+    except ValueError:
+        return float('nan')
+
+
+def _skill(level):
+    return SKILL_LEVELS.get(str(level or '').lower(), 1)
+
+
+class _PostIndex:
+    """Column arrays of open posts (held as compact Post models), the grid over them and per-user sport history
+
+    Rows are never renumbered: a post that is updated keeps its row, one that
+    is deleted or no longer open is only taken out of the grid.
+    """
+
+    def __init__(self, posts, organizers):
+        self.built_at = time.time()
+        self.sport_history = {}
+        self._preferences = {}  # user id -> {sport: share of their games}
+        self.rows = []
+        self._row_of = {}  # post id -> row
+        for data in posts:
+            sport = str(data.get('sport', '')).lower()
+            self._count_players(sport, (p['user_id'] for p in data.get('accepted_players', [])))
+            if data.get('status') == 'open':
+                try:
+                    post = Post.from_dict(data)
+                except ValueError:
+                    continue  # malformed post, never recommendable
+                self._row_of[post.id] = len(self.rows)
+                self.rows.append(post)
+        self.organizers = organizers
+        self._arrays = None
+        self._cells = {}
+        for row, post in enumerate(self.rows):
+            self._cells.setdefault(_cell(post.location.lat, post.location.lng), []).append(row)
+
+    def _count_players(self, sport, user_ids):
+        for user_id in user_ids:
+            counts = self.sport_history.setdefault(user_id, {})
+            counts[sport] = counts.get(sport, 0) + 1
+            self._preferences.pop(user_id, None)
+
+    def sport_preferences(self, user_id):
+        """Normalised sport history of a player, computed once per index and history change"""
+        preferences = self._preferences.get(user_id)
+        if preferences is None:
+            counts = self.sport_history.get(user_id, {})
+            total = sum(counts.values())
+            preferences = {sport: count / total for sport, count in counts.items()} if total else {}
+            self._preferences[user_id] = preferences
+        return preferences
+
+    def _unlink(self, row):
+        old = self.rows[row]
+        members = self._cells.get(_cell(old.location.lat, old.location.lng), [])
+        if row in members:
+            members.remove(row)
+
+    def get(self, post_id):
+        row = self._row_of.get(post_id)
+        return None if row is None else self.rows[row]
+
+    def add(self, post):
+        self._row_of[post.id] = len(self.rows)
+        self.rows.append(post)
+        self._cells.setdefault(_cell(post.location.lat, post.location.lng), []).append(len(self.rows) - 1)
+        if self._arrays is not None:
+            extra = self._columns([post])
+            self._arrays = {name: np.concatenate([column, extra[name]]) for name, column in self._arrays.items()}
+
+    def upsert(self, post):
+        """Insert or replace a post; players newly accepted into it count towards their sport history"""
+        row = self._row_of.get(post.id)
+        known = {p.user_id for p in self.rows[row].accepted_players} if row is not None else set()
+        joined = (p.user_id for p in post.accepted_players if p.user_id not in known)
+        self._count_players(str(post.sport).lower(), joined)
+        if row is None:
+            if post.status == 'open':
+                self.add(post)
+            return
+        self._unlink(row)
+        self.rows[row] = post
+        if post.status != 'open':
+            return
+        self._cells.setdefault(_cell(post.location.lat, post.location.lng), []).append(row)
+        if self._arrays is not None:
+            for name, values in self._columns([post]).items():
+                self._arrays[name][row] = values[0]
+
+    def remove(self, post_id):
+        row = self._row_of.pop(post_id, None)
+        if row is not None:
+            self._unlink(row)
+
+    def _columns(self, posts):
+        def organizer(post, key, default):
+            return self.organizers.get(post.user_id, {}).get(key, default)
+        return {
+            'lat': np.radians([p.location.lat for p in posts]),
+            'lng': np.radians([p.location.lng for p in posts]),
+            'sport': np.array([str(p.sport).lower() for p in posts], dtype=object),
+            'start': np.array([_start_timestamp(p) for p in posts], dtype=float),
+            'skill': np.array([organizer(p, 'skill', 1) for p in posts], dtype=float),
+            'rating': np.array([organizer(p, 'rating', 0.0) for p in posts], dtype=float),
+        }
+
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = self._columns(self.rows)
+        return self._arrays
+
+    def candidates(self, cells):
+        rows = []
+        for cell in cells:
+            rows.extend(self._cells.get(cell, ()))
+        return np.array(sorted(rows), dtype=int)
+
+
+def _organizer_features(organizer_ids):
+    """{user id: skill/rating features} for the organizers, read in one batched call"""
+    if not organizer_ids:
+        return {}
+    users = get_db().collection(USERS_COLLECTION)
+    features = {}
+    for doc in get_db().get_all([users.document(organizer_id) for organizer_id in organizer_ids]):
+        if doc.exists:
+            user = doc.to_dict()
+            features[doc.id] = {
+                'skill': _skill(user.get('profile', {}).get('skill_level')),
+                'rating': float(user.get('stats', {}).get('average_rating', 0.0) or 0.0)
+            }
+    return features
+
+
+def _apply(index, post_id, post):
+    if post is None:
+        index.remove(post_id)
+    else:
+        index.upsert(post)
+
+
+def _get_index():
+    """The current index, rebuilt when older than RECOMMENDATION_INDEX_TTL"""
+    global _index, _pending_changes
+    index = _index
+    if index is not None and time.time() - index.built_at <= RECOMMENDATION_INDEX_TTL:
+        return index
+    # Only the first request waits; while a rebuild runs the others keep the stale index
+    if not _build_lock.acquire(blocking=index is None):
+        return index
+    try:
+        if _index is not index:
+            return _index  # rebuilt while this thread waited
+        with _lock:
+            _pending_changes = []
+        try:
+            posts = list(read_json(POSTS_COLLECTION).values())
+            organizer_ids = {p['user_id'] for p in posts if p.get('status') == 'open'}
+            fresh = _PostIndex(posts, _organizer_features(organizer_ids))
+        except Exception:
+            with _lock:
+                _pending_changes = None
+            raise
+        with _lock:
+            for post_id, post in _pending_changes:
+                _apply(fresh, post_id, post)
+            _pending_changes = None
+            _index = fresh
+            _user_results.clear()
+        return fresh
+    finally:
+        _build_lock.release()
+
+
+def _drop_results_covering(cells):
+    for user_id in [u for u, entry in _user_results.items() if entry[1] & cells]:
+        del _user_results[user_id]
+
+
+def _on_post_change(event):
+    """Keep the index and cached results in step with post writes"""
+    post = None
+    if event.op != 'deleted' and event.data:
+        try:
+            post = Post.from_dict(event.data)
+        except ValueError:
+            post = None  # malformed post, never recommendable
+
+    with _lock:
+        if event.doc_id is None:
+            _user_results.clear()
+            return
+        cells = set()
+        if post is not None:
+            cells.add(_cell(post.location.lat, post.location.lng))
+        if _index is not None:
+            old = _index.get(event.doc_id)
+            if old is not None:
+                cells.add(_cell(old.location.lat, old.location.lng))
+            _apply(_index, event.doc_id, post)
+        if _pending_changes is not None:
+            _pending_changes.append((event.doc_id, post))
+        _drop_results_covering(cells)
+
+
+subscribe('post', _on_post_change)
+
+
+def invalidate_user_recommendations(user_id):
+    with _lock:
+        _user_results.pop(user_id, None)
+
+
+def user_features(user, index):
+    """Player feature vector: skill level and normalised sport preferences"""
+    return {
+        'skill': _skill(user.get('profile', {}).get('skill_level')),
+        'sports': index.sport_preferences(user['id'])
+    }
+
+
+def score_posts(user, lat, lng, radius_km, index, now=None):
+    """(cells searched, [(score, post, distance_km, components)] best first) for open posts within radius"""
+    cells = _cells_within(lat, lng, radius_km)
+    rows = index.candidates(cells)
+    if rows.size == 0:
+        return cells, []
+    arrays = index.arrays()
+    features = user_features(user, index)
+    now = now or time.time()
+
+    # Haversine over all candidates at once
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = arrays['lat'][rows], arrays['lng'][rows]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    sports = arrays['sport'][rows]
+    if features['sports']:
+        sport_score = np.array([features['sports'].get(s, 0.0) for s in sports])
+    else:
+        sport_score = np.full(rows.size, 0.5)  # no history yet: every sport is neutral
+
+    hours_out = (arrays['start'][rows] - now) / 3600.0
+    time_score = np.where(np.isnan(hours_out), 0.5, np.exp2(-np.abs(hours_out) / TIME_HALF_LIFE_HOURS))
+
+    components = {
+        'distance': np.clip(1.0 - distance / radius_km, 0.0, 1.0),
+        'sport': sport_score,
+        'skill': 1.0 - np.abs(arrays['skill'][rows] - features['skill']) / (len(SKILL_LEVELS) - 1),
+        'rating': np.clip(arrays['rating'][rows] / 5.0, 0.0, 1.0),
+        'time': time_score,
+    }
+    score = sum(WEIGHTS[name] * values for name, values in components.items())
+
+    # Drop posts out of range, already started, organised by or already joined by the user
+    keep = (distance <= radius_km) & ~(hours_out < 0)
+    results = []
+    for i in np.nonzero(keep)[0][np.argsort(-score[keep], kind='stable')]:
+        post = index.rows[rows[i]]
+        if post.user_id == user['id'] or post.status != 'open' or post.has_player(user['id']):
+            continue
+        results.append((
+            round(float(score[i]), 4), post, round(float(distance[i]), 2),
+            {name: round(float(values[i]), 3) for name, values in components.items()}
+        ))
+    return cells, results
+
+
+def get_recommendations(user, lat, lng, radius_km=10, limit=20):
+    """Best open posts for a player near (lat, lng), cached per user"""
+    params = (round(lat, 3), round(lng, 3), radius_km, limit)
+    with _lock:
+        cached = _user_results.get(user['id'])
+        if cached and cached[0] > time.time() and cached[2] == params:
+            return cached[3]
+
+    index = _get_index()
+    with _lock:
+        cells, scored = score_posts(user, lat, lng, radius_km, index)
+    recommendations = [
+        {**post.to_dict(), 'distance_km': distance, 'match_score': score, 'score_breakdown': parts}
+        for score, post, distance, parts in scored[:limit]
+    ]
+    with _lock:
+        _user_results[user['id']] = (time.time() + RECOMMENDATION_CACHE_TTL, cells, params, recommendations)
+    return recommendations
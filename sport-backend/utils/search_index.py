@@ -0,0 +1,320 @@
+"""
+In-process full-text search over turfs, posts and users.
+
+An inverted index maps each token to the documents containing it, with the
+weight of the field it came from:
+
+    turf   name x3, sports x2, facilities x1, location.address x1
+    post   sport x3, description x1
+    user   name x3
+
+A query matches a document when every query token matches one of its
+tokens, exactly (1.0), as a prefix (0.8; "foot" -> "football") or within
+one edit (0.6, tokens of FUZZY_MIN_LENGTH+ characters; "fotball"). Prefixes
+are found by bisecting the sorted vocabulary and typos through a
+deletion-neighbourhood table, so a query touches only the postings of the
+tokens it matches and never the collections.
+
+The index is built from storage on first use and then kept current from
+change events (utils.change_events): created/updated documents are
+re-tokenised, deleted ones dropped. With several workers, writes made by
+the others only arrive through the Firestore listeners (CHANGE_FEED_LISTEN=1,
+with `user` among CHANGE_FEED_KINDS for renames). Posts being deleted and
+inactive turfs are left out, and posts whose date has passed are skipped
+at query time: archive_data.py removes them in its own process, which no
+worker hears about without the listeners. Results carry a small summary of the document, never a user's
+contact details.
+"""
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from datetime import datetime
+
+from utils.change_events import subscribe
+
+SEARCH_KINDS = ('turf', 'post', 'user')
+MAX_QUERY_LENGTH = 100
+MAX_QUERY_TOKENS = 8
+MAX_SEARCH_RESULTS = 50
+PREFIX_MIN_LENGTH = 2
+FUZZY_MIN_LENGTH = 4
+
+MATCH_WEIGHTS = {'exact': 1.0, 'prefix': 0.8, 'fuzzy': 0.6}
+
+_TOKEN_RE = re.compile(r'[0-9a-z]+')
+
+
+def tokenize(text):
+    """Lowercase ASCII-folded alphanumeric tokens of a string (or list of strings)"""
+    if not text:
+        return []
+    if isinstance(text, (list, tuple, set)):
+        text = ' '.join(str(item) for item in text)
+    folded = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return _TOKEN_RE.findall(folded.lower())
+
+
+def _deletes(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _within_one_edit(a, b):
+    """Damerau-Levenshtein distance <= 1"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return (a[i + 1:] == b[i + 1:]
+                or (i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]))
+    return a[i:] == b[i + 1:]
+
+
+def _fields(kind, doc):
+    """[(text, weight)] indexed for a document, or None if it should not be searchable"""
+    if kind == 'turf':
+        if doc.get('status', 'active') != 'active':
+            return None
+        return [
+            (doc.get('name'), 3.0),
+            (doc.get('sports'), 2.0),
+            (doc.get('facilities'), 1.0),
+            ((doc.get('location') or {}).get('address'), 1.0),
+        ]
+    if kind == 'post':
+        if doc.get('status') == 'deleted' or _is_past(doc):
+            return None
+        return [(doc.get('sport'), 3.0), (doc.get('description'), 1.0)]
+    return [(doc.get('name'), 3.0)]
+
+
+def _is_past(post, today=None):
+    """Same rule as archive_helper.is_past_post: the game's date has passed"""
+    date = post.get('date')
+    return bool(date) and date < (today or datetime.now().strftime('%Y-%m-%d'))
+
+
+def _summary(kind, doc):
+    if kind == 'turf':
+        return {
+            'name': doc.get('name'),
+            'address': (doc.get('location') or {}).get('address'),
+            'sports': doc.get('sports', []),
+            'rating': doc.get('rating', 0.0),
+        }
+    if kind == 'post':
+        return {
+            'sport': doc.get('sport'),
+            'description': (doc.get('description') or '')[:200],
+            'date': doc.get('date'),
+            'time': doc.get('time'),
+            'status': doc.get('status'),
+            'user_name': doc.get('user_name'),
+            'address': (doc.get('location') or {}).get('address'),
+        }
+    return {'name': doc.get('name'), 'role': doc.get('role', 'player')}
+
+
+class SearchIndex:
+    """Inverted index with prefix and single-typo matching; all methods are thread safe"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}     # token -> {(kind, id): weight}
+        self._doc_tokens = {}   # (kind, id) -> {token: weight}
+        self._summaries = {}    # (kind, id) -> summary dict
+        self._vocabulary = []   # sorted tokens, for prefix lookups
+        self._fuzzy = {}        # token or one-deletion variant -> {token}
+        self._loading = False
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def _add_token(self, token):
+        if self._loading:
+            self._vocabulary.append(token)  # sorted once at the end of load()
+        else:
+            bisect.insort(self._vocabulary, token)
+        if len(token) >= FUZZY_MIN_LENGTH:
+            for variant in _deletes(token) | {token}:
+                self._fuzzy.setdefault(variant, set()).add(token)
+
+    def _drop_token(self, token):
+        del self._postings[token]
+        i = bisect.bisect_left(self._vocabulary, token)
+        if i < len(self._vocabulary) and self._vocabulary[i] == token:
+            del self._vocabulary[i]
+        if len(token) >= FUZZY_MIN_LENGTH:
+            for variant in _deletes(token) | {token}:
+                tokens = self._fuzzy.get(variant)
+                if tokens:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._fuzzy[variant]
+
+    def remove(self, kind, doc_id):
+        key = (kind, doc_id)
+        with self._lock:
+            for token in self._doc_tokens.pop(key, {}):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(key, None)
+                if not postings:
+                    self._drop_token(token)
+            self._summaries.pop(key, None)
+
+    def upsert(self, kind, doc_id, doc):
+        fields = _fields(kind, doc)
+        if fields is None:
+            self.remove(kind, doc_id)
+            return
+        weights = {}
+        for text, weight in fields:
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0.0), weight)
+
+        key = (kind, doc_id)
+        with self._lock:
+            self.remove(kind, doc_id)
+            for token, weight in weights.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    self._add_token(token)
+                postings[key] = weight
+            self._doc_tokens[key] = weights
+            self._summaries[key] = _summary(kind, doc)
+
+    def load(self, kind, docs):
+        """Bulk upsert {doc_id: doc}, sorting the vocabulary once instead of per new token"""
+        with self._lock:
+            self._loading = True
+            try:
+                for doc_id, doc in docs.items():
+                    self.upsert(kind, doc_id, doc)
+            finally:
+                self._loading = False
+                self._vocabulary.sort()
+
+    def _matches(self, term, prefix):
+        """{token: match weight} for one query term"""
+        matches = {}
+        if prefix and len(term) >= PREFIX_MIN_LENGTH:
+            i = bisect.bisect_left(self._vocabulary, term)
+            while i < len(self._vocabulary) and self._vocabulary[i].startswith(term):
+                matches[self._vocabulary[i]] = MATCH_WEIGHTS['prefix']
+                i += 1
+        if len(term) >= FUZZY_MIN_LENGTH:
+            candidates = set()
+            for variant in _deletes(term) | {term}:
+                candidates.update(self._fuzzy.get(variant, ()))
+            for token in candidates:
+                if token not in matches and _within_one_edit(term, token):
+                    matches[token] = MATCH_WEIGHTS['fuzzy']
+        if term in self._postings:
+            matches[term] = MATCH_WEIGHTS['exact']
+        return matches
+
+    def search(self, query, kinds=SEARCH_KINDS, limit=20, prefix=True):
+        """[{'type', 'id', 'score', **summary}] best first; every query term must match"""
+        terms = tokenize(query[:MAX_QUERY_LENGTH])[:MAX_QUERY_TOKENS]
+        if not terms:
+            return []
+        kinds = set(kinds)
+        today = datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token, match_weight in self._matches(term, prefix).items():
+                    for key, field_weight in self._postings[token].items():
+                        if key[0] in kinds and not (key[0] == 'post' and _is_past(self._summaries[key], today)):
+                            score = match_weight * field_weight
+                            if score > term_scores.get(key, 0.0):
+                                term_scores[key] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {key: scores[key] + score for key, score in term_scores.items() if key in scores}
+                if not scores:
+                    return []
+            ranked = heapq.nlargest(min(limit, MAX_SEARCH_RESULTS), scores.items(), key=lambda item: item[1])
+            return [
+                {'type': kind, 'id': doc_id, 'score': round(score, 3), **self._summaries[(kind, doc_id)]}
+                for (kind, doc_id), score in ranked
+            ]
+
+
+_index = None
+_build_lock = threading.Lock()
+# Guards _index / _pending_events so no change event falls between the build and going live
+_events_lock = threading.Lock()
+_pending_events = None  # changes seen while the index is being built
+
+
+def _apply(index, event):
+    if event.doc_id is None:
+        return  # unparsed helper call; caught up on the next process start
+    if event.op == 'deleted':
+        index.remove(event.kind, event.doc_id)
+    elif event.data:
+        index.upsert(event.kind, event.doc_id, event.data)
+
+
+def get_search_index():
+    """The process-wide index, built from storage on first use"""
+    global _index, _pending_events
+    if _index is not None:
+        return _index
+    # Storage is only needed for the build; the index itself is pure logic
+    from utils.booking_helper import TURFS_COLLECTION
+    from utils.firebase_storage import read_json, POSTS_COLLECTION, USERS_COLLECTION
+
+    with _build_lock:
+        if _index is not None:
+            return _index
+        with _events_lock:
+            _pending_events = []
+        index = SearchIndex()
+        try:
+            for kind, collection in (('turf', TURFS_COLLECTION), ('post', POSTS_COLLECTION),
+                                     ('user', USERS_COLLECTION)):
+                index.load(kind, read_json(collection))
+        except Exception:
+            with _events_lock:
+                _pending_events = None
+            raise
+        # Replay writes made during the build and go live in one step
+        with _events_lock:
+            for event in _pending_events:
+                _apply(index, event)
+            _pending_events = None
+            _index = index
+    return _index
+
+
+def search_documents(query, kinds=SEARCH_KINDS, limit=20):
+    return get_search_index().search(query, kinds, limit)
+
+
+def _on_change(event):
+    with _events_lock:
+        index = _index
+        if index is None:
+            # Buffered while a build runs; otherwise nothing to keep current yet
+            if _pending_events is not None:
+                _pending_events.append(event)
+            return
+    _apply(index, event)
+
+
+for _kind in SEARCH_KINDS:
+    subscribe(_kind, _on_change)
@@ -0,0 +1,93 @@
+"""
+Coalesced typing indicators for group chat.
+
+Keystroke `typing` events only update in-memory state here. A background
+task wakes once per tick and emits the same `user_typing {user_name,
+is_typing}` event clients have always received, but only when a user
+started or stopped typing since the last tick, never per keystroke, and
+never to the typist's own connection. Entries expire on their own (with
+an `is_typing: False`) if the client never sends one.
+"""
+import os
+import threading
+import time
+
+TYPING_TICK_SECONDS = float(os.environ.get('TYPING_TICK_SECONDS', 0.5))
+TYPING_EXPIRY_SECONDS = float(os.environ.get('TYPING_EXPIRY_SECONDS', 5))
+
+# group_id -> {user_name: (expires_at, sid)}
+_typing_users = {}
+# group_id -> {user_name: sid} last announced to the room as typing
+_announced = {}
+# Rooms whose set of typing users changed since the last tick
+_dirty_rooms = set()
+_lock = threading.Lock()
+_broadcaster_started = False
+
+
+def mark_typing(group_id, user_name, is_typing, sid=None, now=None):
+    """Record a typing event; repeated events from the same user only extend its expiry"""
+    now = now if now is not None else time.monotonic()
+    with _lock:
+        room = _typing_users.setdefault(group_id, {})
+        if is_typing:
+            if user_name not in room:
+                _dirty_rooms.add(group_id)
+            room[user_name] = (now + TYPING_EXPIRY_SECONDS, sid)
+        elif room.pop(user_name, None) is not None:
+            _dirty_rooms.add(group_id)
+        if not room:
+            _typing_users.pop(group_id, None)
+
+
+def collect_typing_changes(now=None):
+    """Expire stale entries and return [(group_id, user_name, is_typing, sid)] since the last call
+
+    A user who started and stopped within one tick produces no change.
+    """
+    now = now if now is not None else time.monotonic()
+    changes = []
+    with _lock:
+        for group_id in list(_typing_users):
+            room = _typing_users[group_id]
+            expired = [name for name, (expires_at, _) in room.items() if expires_at <= now]
+            for name in expired:
+                del room[name]
+            if expired:
+                _dirty_rooms.add(group_id)
+            if not room:
+                del _typing_users[group_id]
+
+        for group_id in _dirty_rooms:
+            typing = {name: sid for name, (_, sid) in _typing_users.get(group_id, {}).items()}
+            announced = _announced.pop(group_id, {})
+            for name in sorted(typing.keys() - announced.keys()):
+                changes.append((group_id, name, True, typing[name]))
+            for name in sorted(announced.keys() - typing.keys()):
+                changes.append((group_id, name, False, announced[name]))
+            if typing:
+                _announced[group_id] = typing
+        _dirty_rooms.clear()
+    return changes
+
+
+def _broadcast_loop(socketio):
+    while True:
+        socketio.sleep(TYPING_TICK_SECONDS)
+        for group_id, user_name, is_typing, sid in collect_typing_changes():
+            socketio.emit('user_typing', {
+                'user_name': user_name,
+                'is_typing': is_typing
+            }, room=group_id, skip_sid=sid)
+
+
+def start_typing_broadcaster(socketio):
+    """Start the tick loop once per process (safe to call on every event)"""
+    global _broadcaster_started
+    if _broadcaster_started:
+        return
+    with _lock:
+        if _broadcaster_started:
+            return
+        _broadcaster_started = True
+    socketio.start_background_task(_broadcast_loop, socketio)
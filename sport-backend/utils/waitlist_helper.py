@@ -0,0 +1,157 @@
+"""
+FIFO waitlist for full games.
+
+The waitlist lives on the post document next to accepted_players, as a list
+of small {'user_id', 'user_name', 'joined_at'} entries in arrival order:
+
+    post['waitlist'] = [{'user_id': ..., 'user_name': ..., 'joined_at': ...}, ...]
+
+Every change to a post's players and waitlist goes through
+update_post_atomically(), a Firestore transaction over the post document,
+so two requests (a join and a leave, two joins of a full game) cannot
+overwrite each other's changes. When a spot opens (leave, kick, deny),
+release_spot() removes the player, promotes the next ones and flips the
+status in that same transaction. Waiting players are notified instead of
+having to poll join until a spot appears.
+"""
+import os
+from datetime import datetime
+
+from firebase_admin import firestore
+
+from utils.change_events import publish
+from utils.firebase_storage import get_db, POSTS_COLLECTION
+
+MAX_WAITLIST_SIZE = int(os.environ.get('MAX_WAITLIST_SIZE', 50))
+
+
+def get_waitlist(post):
+    return post.setdefault('waitlist', [])
+
+
+def waitlist_position(post, user_id):
+    """1-based position of a user on the waitlist, or None"""
+    for index, entry in enumerate(post.get('waitlist', [])):
+        if entry['user_id'] == user_id:
+            return index + 1
+    return None
+
+
+def add_to_waitlist(post, user):
+    """Append a user to the waitlist; returns their position
+
+    Raises ValueError if the user is already waiting or the list is full.
+    """
+    if waitlist_position(post, user['id']):
+        raise ValueError('You are already on the waitlist for this game')
+    waitlist = get_waitlist(post)
+    if len(waitlist) >= MAX_WAITLIST_SIZE:
+        raise ValueError('The waitlist for this game is full')
+    waitlist.append({
+        'user_id': user['id'],
+        'user_name': user['name'],
+        'joined_at': datetime.now().isoformat()
+    })
+    return len(waitlist)
+
+
+def remove_from_waitlist(post, user_id):
+    """Drop a user from the waitlist; returns True if they were on it"""
+    waitlist = post.get('waitlist', [])
+    remaining = [entry for entry in waitlist if entry['user_id'] != user_id]
+    if len(remaining) == len(waitlist):
+        return False
+    post['waitlist'] = remaining
+    return True
+
+
+def promote_from_waitlist(post, can_join=None):
+    """Move waiting players into open spots, oldest first; returns the promoted entries
+
+    can_join(user_id) may veto a player (e.g. group limit reached); vetoed
+    players keep their place for the next opening. Updates post status.
+    """
+    waitlist = post.get('waitlist', [])
+    promoted = []
+    remaining = []
+    for entry in waitlist:
+        has_spot = len(post['accepted_players']) < post['players_needed']
+        if has_spot and (can_join is None or can_join(entry['user_id'])):
+            post['accepted_players'].append({
+                'user_id': entry['user_id'],
+                'user_name': entry['user_name'],
+                'accepted_at': datetime.now().isoformat()
+            })
+            promoted.append(entry)
+        else:
+            remaining.append(entry)
+
+    if promoted:
+        post['waitlist'] = remaining
+    if post.get('status') in ('open', 'full'):
+        post['status'] = 'full' if len(post['accepted_players']) >= post['players_needed'] else 'open'
+    return promoted
+
+
+def _memoized(check):
+    """check(user_id) evaluated once per user, also across transaction retries"""
+    if check is None:
+        return None
+    results = {}
+
+    def memo(user_id):
+        if user_id not in results:
+            results[user_id] = check(user_id)
+        return results[user_id]
+    return memo
+
+
+def update_post_atomically(post_id, change):
+    """Apply change(post) to the stored post in a transaction and save it; returns (post, change's result)
+
+    change runs again if the transaction retries, so it may only modify the
+    post it is given; it raises ValueError to abort without writing.
+    Returns (None, None) if the post does not exist or is being deleted.
+    """
+    db = get_db()
+    ref = db.collection(POSTS_COLLECTION).document(post_id)
+
+    @firestore.transactional
+    def apply(transaction):
+        doc = ref.get(transaction=transaction)
+        if not doc.exists:
+            return None, None
+        post = {'id': doc.id, **doc.to_dict()}
+        if post.get('status') == 'deleted':
+            return None, None
+        result = change(post)
+        transaction.set(ref, post)
+        return post, result
+
+    post, result = apply(db.transaction())
+    if post is not None:
+        publish('post', 'updated', post_id, post)
+    return post, result
+
+
+def release_spot(post_id, user_id, can_join=None):
+    """Remove a player and fill the spot from the waitlist in one transaction
+
+    Returns (post, removed entry, promoted entries), or (None, None, []) if
+    the post is gone. Raises ValueError if the player is not in the game.
+    """
+    can_join = _memoized(can_join)
+
+    def change(post):
+        entry = next((p for p in post['accepted_players'] if p['user_id'] == user_id), None)
+        if entry is None:
+            raise ValueError('Player not in this game')
+        post['accepted_players'].remove(entry)
+        if post['status'] == 'full':
+            post['status'] = 'open'
+        return entry, promote_from_waitlist(post, can_join)
+
+    post, result = update_post_atomically(post_id, change)
+    if post is None:
+        return None, None, []
+    return post, result[0], result[1]
@@ -0,0 +1,26 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+Cooperative I/O has to be switched on before Flask, requests or the Firebase
+SDK are imported, otherwise their sockets stay blocking and a single slow
+Firestore call stalls every Socket.IO client on the worker.
+"""
+import os
+
+from gevent import monkey
+monkey.patch_all()
+
+# Without a shared key every worker signs tokens the others reject
+if not os.environ.get('SECRET_KEY'):
+    raise RuntimeError('SECRET_KEY must be set to run in production')
+
+# Firestore talks grpc, which does not use Python sockets - hook it into the
+# gevent loop explicitly
+import grpc.experimental.gevent as grpc_gevent
+grpc_gevent.init_gevent()
+
+from app import app, socketio  # noqa: E402,F401
+from utils.cascade_delete import start_deletion_worker  # noqa: E402
+
+# Finish cascade deletes a previous process left half done (not at import, so
+# scripts and tests importing app do not start it)
+start_deletion_worker()